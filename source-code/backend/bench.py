@@ -0,0 +1,318 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+WORDS = ('Apel', 'Banana', 'Orange', 'Mango', 'Milk', 'Choco', 'Teh', 'Kopi', 'Gula', 'Beras', 'Minyak',
+         'Sunpride', 'Serum', 'Mask', 'Lotion', 'Chips', 'Juice', 'Water', 'Keju', 'Roti', 'Mie', 'Sabun',
+         'Shampoo', 'Pasta', 'Saos', 'Kecap', 'Garam', 'Lada', 'Susu', 'Yogurt')
+SIZES = '1000,10000,100000'
+QUERIES = ('ban', 'sunpride ban', 'kopi susu', 'a', 'zzz', 'mi')
+TYPOS = ('sunprid banan', 'bananna', 'choko milk')
+REGRESSION_THRESHOLD = 0.2
+
+
+def timed(fn, repeat=1):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples)
+
+
+def summarize(samples, ops=None):
+    samples = sorted(samples)
+    total = sum(samples)
+    ops = ops or len(samples)
+    return {
+        'ops': ops,
+        'total_s': round(total, 6),
+        'per_op_ms': round(total / ops * 1000, 4),
+        'p50_ms': round(samples[len(samples) // 2] * 1000, 4),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 4),
+        'max_ms': round(samples[-1] * 1000, 4),
+    }
+
+
+def product_rows(n, rnd, prefix='B'):
+    for i in range(n):
+        name = ' '.join(rnd.sample(WORDS, rnd.randint(1, 3))) + f' {rnd.randint(1, 999)}'
+        yield (f'{prefix}{i:07d}', name, rnd.randrange(1000, 100000, 500), rnd.randint(0, 200))
+
+
+def build_db(path, n_products, n_sales, rnd):
+    import main
+    main.DB_PATH = path
+    main.init_db()
+    conn = main.get_db_conn()
+    conn.executemany("INSERT INTO products (sku, name, price, stock) VALUES (?,?,?,?)", product_rows(n_products, rnd))
+    prices = dict(conn.execute("SELECT id, price FROM products"))
+    ids = list(prices)
+    start = datetime.now() - timedelta(days=365)
+    for s in range(n_sales):
+        when = (start + timedelta(seconds=s * 365 * 86400 // max(n_sales, 1))).isoformat(' ', 'seconds')
+        lines = [(pid, rnd.randint(1, 3)) for pid in rnd.sample(ids, min(len(ids), rnd.randint(1, 6)))]
+        sub = sum(prices[p] * q for p, q in lines)
+        cur = conn.execute("INSERT INTO sales (datetime, total) VALUES (?,?)", (when, sub + int(sub * 0.11)))
+        conn.executemany("INSERT INTO sale_items (sale_id, product_id, qty, subtotal) VALUES (?,?,?,?)",
+                         [(cur.lastrowid, p, q, prices[p] * q) for p, q in lines])
+    conn.commit()
+    import reports
+    reports.rebuild(conn)
+    return conn
+
+
+def bench_search(conn, results):
+    from catalog_index import CatalogIndex
+    t0 = time.perf_counter()
+    idx = CatalogIndex.from_db(conn)
+    results['index_build'] = summarize([time.perf_counter() - t0])
+    like, indexed = [], []
+    for q in QUERIES:
+        t0 = time.perf_counter()
+        conn.execute("SELECT * FROM products WHERE sku LIKE ? OR name LIKE ?", (f'%{q}%', f'%{q}%')).fetchall()
+        like.append(time.perf_counter() - t0)
+        for _ in range(5):
+            t0 = time.perf_counter()
+            idx.search(q)
+            indexed.append(time.perf_counter() - t0)
+    results['search_like_scan'] = summarize(like)
+    results['search_index'] = summarize(indexed)
+    from product_search import ProductSearch
+    fts = ProductSearch(conn)
+    if fts.enabled:
+        results['search_fts'] = timed(lambda: [fts.search(q) for q in QUERIES], repeat=5)
+    if fts.fuzzy:
+        results['search_fts_typo'] = timed(lambda: [fts.search(q) for q in TYPOS], repeat=5)
+    sku = conn.execute("SELECT sku FROM products ORDER BY random() LIMIT 1").fetchone()[0]
+    results['sku_lookup'] = timed(lambda: idx.lookup_sku(sku), repeat=1000)
+    return idx
+
+
+def bench_paging(conn, results):
+    from product_list import ProductPager
+    pager = ProductPager(conn)
+    results['page_first'] = timed(lambda: pager.page_after(None, 60), repeat=20)
+    page = pager.page_after(None, 60)
+    samples = []
+    for _ in range(50):
+        if not page:
+            break
+        t0 = time.perf_counter()
+        page = pager.page_after(pager.key_of(page[-1]), 60)
+        samples.append(time.perf_counter() - t0)
+    results['page_keyset_next'] = summarize(samples or [0.0])
+    total = pager.count()
+    rnd = random.Random(7)
+    results['page_jump_offset'] = timed(lambda: pager.page_at(rnd.randrange(max(total, 1)), 60), repeat=10)
+
+
+def bench_import(tmpdir, conn, rows, results):
+    from csv_import import import_csv
+    path = os.path.join(tmpdir, 'import.csv')
+    rnd = random.Random(3)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('Id,Sku,Name,Price,Stock\n')
+        for i, (sku, name, price, stock) in enumerate(product_rows(rows, rnd, prefix='I'), 1):
+            f.write(f'{i},{sku},{name},{price},{stock}\n')
+    t0 = time.perf_counter()
+    import_csv(conn, path, mode='upsert')
+    results['csv_import'] = summarize([time.perf_counter() - t0], ops=rows)
+    t0 = time.perf_counter()
+    import_csv(conn, path, mode='upsert')
+    results['csv_reimport_upsert'] = summarize([time.perf_counter() - t0], ops=rows)
+
+
+def bench_cart(idx, results, lines=500):
+    from cart import Cart, Product
+    rows = list(idx.rows.values())[:lines]
+    products = [Product(r) for r in rows]
+    cart = Cart(tax_pct=11.0)
+    samples = []
+    for p in products:
+        t0 = time.perf_counter()
+        cart.add(p, 1)
+        samples.append(time.perf_counter() - t0)
+    for p in products:
+        t0 = time.perf_counter()
+        cart.set_qty(p.id, 3)
+        samples.append(time.perf_counter() - t0)
+    results['cart_mutation'] = summarize(samples)
+    return cart
+
+
+def bench_checkout(conn, idx, results, sales=300):
+    from checkout_service import commit_sale
+    rnd = random.Random(5)
+    rows = [r for r in idx.rows.values() if r[4] > 0] or list(idx.rows.values())
+    samples = []
+    for _ in range(sales):
+        cart = [(r[0], 1, r[3]) for r in rnd.sample(rows, min(len(rows), rnd.randint(1, 8)))]
+        t0 = time.perf_counter()
+        commit_sale(conn, cart, tax_pct=11.0, policy='partial')
+        samples.append(time.perf_counter() - t0)
+    results['checkout'] = summarize(samples)
+
+
+def bench_pricing(conn, idx, results, lookups=5000):
+    import pricing
+    pricing.add_rule(conn, 'prefix', 'B00', 'percent', 10)
+    pricing.add_rule(conn, 'prefix', 'B001', 'amount', -500, priority=1)
+    pricing.add_promotion(conn, 'prefix', 'B000', 3, pay_qty=2)
+    results['pricing_refresh'] = timed(lambda: pricing.refresh(conn), repeat=5)
+    results['pricing_reprice'] = timed(lambda: pricing.reprice(conn, 'prefix', 'B00', 'percent', 0))
+    book = pricing.PriceBook(conn)
+    ids = list(idx.rows)
+    rnd = random.Random(11)
+    results['price_lookup'] = timed(lambda: book.get(rnd.choice(ids), 0), repeat=lookups)
+
+
+def bench_receipts(tmpdir, conn, idx, results, count=2000):
+    from receipts import ReceiptStore, format_receipt, rebuild_receipts
+    rows = list(idx.rows.values())[:20]
+    items = [(r[2], 2, r[3] * 2) for r in rows[:8]]
+    now = datetime.now().isoformat(' ', 'seconds')
+    results['receipt_format'] = timed(lambda: format_receipt(now, 123456, items), repeat=count)
+    store = ReceiptStore(os.path.join(tmpdir, 'journal'))
+    text = format_receipt(now, 123456, items)
+    samples = []
+    for i in range(count):
+        t0 = time.perf_counter()
+        store.append(i + 1, now, text)
+        samples.append(time.perf_counter() - t0)
+    results['receipt_append'] = summarize(samples)
+    rnd = random.Random(9)
+    results['receipt_lookup'] = timed(lambda: store.get(rnd.randint(1, count)), repeat=count)
+    store.close()
+    ids = [r[0] for r in conn.execute("SELECT id FROM sales")]
+    t0 = time.perf_counter()
+    for _ in rebuild_receipts(conn, ids):
+        pass
+    results['receipt_rebuild'] = summarize([time.perf_counter() - t0], ops=max(len(ids), 1))
+
+
+def bench_ui(idx, results, lines=300):
+    import tkinter as tk
+    import main
+    from cart import Product
+    try:
+        app = main.CashierApp()
+    except tk.TclError as e:
+        results['ui_skipped'] = str(e)
+        return
+    app.withdraw()
+    try:
+        t0 = time.perf_counter()
+        while not app.catalog_ready and time.perf_counter() - t0 < 60:
+            app.update()
+            time.sleep(0.01)
+        results['ui_catalog_ready'] = summarize([time.perf_counter() - t0])
+        rows = list(idx.rows.values())[:lines]
+        samples = []
+        for r in rows:
+            t0 = time.perf_counter()
+            app.add_to_cart(Product(r), 1)
+            app.update_idletasks()
+            samples.append(time.perf_counter() - t0)
+        results['ui_add_to_cart'] = summarize(samples)
+        results['ui_refresh_cart_view'] = timed(lambda: (app.refresh_cart_view(), app.update_idletasks()), repeat=20)
+        results['ui_load_products'] = timed(lambda: (app.load_products(), app.update_idletasks()), repeat=20)
+        app.search_var.set('ban')
+        results['ui_search'] = timed(lambda: (app.load_products(), app.update_idletasks()), repeat=20)
+    finally:
+        app.on_close()
+
+
+def run_size(n_products, args):
+    rnd = random.Random(args.seed)
+    tmpdir = tempfile.mkdtemp(prefix='cashier-bench-')
+    results = {}
+    try:
+        path = os.path.join(tmpdir, 'cashier.db')
+        t0 = time.perf_counter()
+        conn = build_db(path, n_products, args.sales, rnd)
+        results['generate_db'] = summarize([time.perf_counter() - t0])
+        idx = bench_search(conn, results)
+        bench_paging(conn, results)
+        bench_import(tmpdir, conn, args.import_rows, results)
+        bench_cart(idx, results)
+        bench_checkout(conn, idx, results, args.checkouts)
+        bench_pricing(conn, idx, results)
+        bench_receipts(tmpdir, conn, idx, results)
+        if args.ui:
+            os.environ['CASHIER_RECEIPTS'] = os.path.join(tmpdir, 'receipts')
+            import main
+            main.RECEIPT_JOURNAL_DIR = os.path.join(tmpdir, 'receipts', 'journal')
+            # the lane's own sale journal must not be replayed into, or compacted against, the bench database
+            main.JOURNAL_DIR = os.path.join(tmpdir, 'journal')
+            bench_ui(idx, results)
+        conn.close()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return results
+
+
+def compare(old, new, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    for size, benches in new['results'].items():
+        for name, stats in benches.items():
+            before = old.get('results', {}).get(size, {}).get(name)
+            if not isinstance(stats, dict) or not isinstance(before, dict) or not before.get('per_op_ms'):
+                continue
+            ratio = stats['per_op_ms'] / before['per_op_ms']
+            flag = ' REGRESSION' if ratio > 1 + threshold else ''
+            print(f"{size:>8} {name:24} {before['per_op_ms']:>12.4f} -> {stats['per_op_ms']:>12.4f} ms  x{ratio:.2f}{flag}")
+            if flag:
+                regressions.append((size, name, ratio))
+    return regressions
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the cashier hot paths on synthetic data')
+    parser.add_argument('--sizes', default=SIZES, help='comma separated catalog sizes')
+    parser.add_argument('--sales', type=int, default=5000, help='sales history rows to generate')
+    parser.add_argument('--import-rows', type=int, default=20000)
+    parser.add_argument('--checkouts', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--ui', action='store_true', help='also time Tk callbacks (needs a display or Xvfb)')
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--compare', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(' ', 'seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': {},
+    }
+    for size in (int(s) for s in args.sizes.split(',') if s):
+        print(f"catalog size {size:,}...", file=sys.stderr)
+        report['results'][str(size)] = run_size(size, args)
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.out}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            old = json.load(f)
+        if compare(old, report, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,97 @@
+from checkout_service import calculate_total
+from pricing import line_total
+
+INSERT, UPDATE, DELETE, CLEAR = 'insert', 'update', 'delete', 'clear'
+
+
+class Product:
+    __slots__ = ('id', 'sku', 'name', 'price', 'stock', 'deal')
+
+    def __init__(self, row, price=None, deal=None):
+        self.id, self.sku, self.name, self.price, self.stock = row[:5]
+        if price is not None:
+            self.price = price
+        self.deal = deal
+
+
+class CartItem:
+    __slots__ = ('product', 'qty')
+
+    def __init__(self, product: Product, qty: int):
+        self.product = product
+        self.qty = qty
+
+    @property
+    def subtotal(self):
+        return line_total(self.qty, self.product.price, self.product.deal)
+
+
+class Cart:
+    def __init__(self, tax_pct=0.0):
+        self.items = {}
+        self.subtotal = 0
+        self.tax_pct = tax_pct
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def __iter__(self):
+        return iter(self.items.values())
+
+    def __contains__(self, product_id):
+        return product_id in self.items
+
+    def get(self, product_id):
+        return self.items.get(product_id)
+
+    @property
+    def total(self):
+        return calculate_total(self.subtotal, self.tax_pct)
+
+    @property
+    def tax(self):
+        return self.total - self.subtotal
+
+    def add(self, product, qty):
+        item = self.items.get(product.id)
+        if item is None:
+            if qty <= 0:
+                return []
+            item = self.items[product.id] = CartItem(product, qty)
+            self.subtotal += item.subtotal
+            return [(INSERT, product.id, item)]
+        return self.set_qty(product.id, item.qty + qty)
+
+    def set_qty(self, product_id, qty):
+        item = self.items.get(product_id)
+        if item is None:
+            return []
+        if qty <= 0:
+            return self.remove(product_id)
+        if qty == item.qty:
+            return []
+        old = item.subtotal
+        item.qty = qty
+        self.subtotal += item.subtotal - old
+        return [(UPDATE, product_id, item)]
+
+    def remove(self, product_id):
+        item = self.items.pop(product_id, None)
+        if item is None:
+            return []
+        self.subtotal -= item.subtotal
+        return [(DELETE, product_id, item)]
+
+    def clear(self):
+        if not self.items:
+            return []
+        self.items.clear()
+        self.subtotal = 0
+        return [(CLEAR, None, None)]
+
+    def lines(self):
+        return [(it.product.id, it.qty, it.product.price, it.product.deal, it.product.sku, it.product.name)
+                for it in self.items.values()]
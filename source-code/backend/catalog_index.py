@@ -0,0 +1,192 @@
+import heapq
+from bisect import bisect_left, insort
+
+SEARCH_LIMIT = 200
+# upper bound on candidates examined per tier, keeps broad one- or two-letter queries fast
+SCAN_FACTOR = 10
+
+# rank tiers, lower is better
+RANK_SKU_EXACT = 0
+RANK_SKU_PREFIX = 1
+RANK_NAME_PREFIX = 2
+RANK_WORD_PREFIX = 3
+RANK_SUBSTRING = 4
+
+SCHEMA = [
+    # one row per product added, deleted or given a new sku or name, with the latest change last;
+    # stock and price changes are left out, so a lane can follow other lanes' catalog edits cheaply
+    '''
+    CREATE TABLE IF NOT EXISTS catalog_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL UNIQUE
+    )
+    ''',
+]
+
+LOG_CHANGE = "INSERT OR REPLACE INTO catalog_changes (product_id) VALUES ({t}.id)"
+TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS catalog_changes_ai AFTER INSERT ON products BEGIN
+        {LOG_CHANGE.format(t='new')};
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS catalog_changes_au AFTER UPDATE OF sku, name ON products
+    WHEN old.sku IS NOT new.sku OR old.name IS NOT new.name BEGIN
+        {LOG_CHANGE.format(t='new')};
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS catalog_changes_ad AFTER DELETE ON products BEGIN
+        {LOG_CHANGE.format(t='old')};
+    END''',
+]
+
+
+def ensure_schema(conn):
+    for sql in SCHEMA + TRIGGERS:
+        conn.execute(sql)
+
+
+def last_change(conn):
+    return conn.execute("SELECT IFNULL(MAX(seq), 0) FROM catalog_changes").fetchone()[0]
+
+
+def changes_since(conn, seq, limit=None):
+    # (new seq, product ids); more than limit changes returns (None, None), rebuilding is cheaper
+    sql = "SELECT seq, product_id FROM catalog_changes WHERE seq > ? ORDER BY seq"
+    params = [seq]
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+    if limit is not None and len(rows) > limit:
+        return None, None
+    return (rows[-1][0] if rows else seq), [r[1] for r in rows]
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CatalogIndex:
+    def __init__(self):
+        self.rows = {}
+        self.names = {}
+        self.by_sku = {}
+        self._skus = []
+        self._words = []
+        self._grams = {}
+        # catalog_changes seq the index is up to date with
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def from_db(cls, conn):
+        idx = cls()
+        # read before the products, so a change landing in between is applied again rather than missed
+        idx.seq = last_change(conn)
+        rows = conn.execute("SELECT id, sku, name, price, stock FROM products").fetchall()
+        for r in rows:
+            idx._add(tuple(r), keep_sorted=False)
+        idx._skus.sort()
+        idx._words.sort()
+        return idx
+
+    def get(self, pid):
+        return self.rows.get(pid)
+
+    def lookup_sku(self, sku):
+        pid = self.by_sku.get(sku.strip().lower())
+        return self.rows.get(pid) if pid is not None else None
+
+    def upsert(self, row):
+        row = tuple(row)
+        if row[0] in self.rows:
+            self.remove(row[0])
+        self._add(row)
+
+    def remove(self, pid):
+        row = self.rows.pop(pid, None)
+        if row is None:
+            return
+        sku, name = (row[1] or '').lower(), self.names.pop(pid)
+        if self.by_sku.get(sku) == pid:
+            del self.by_sku[sku]
+        _discard_sorted(self._skus, (sku, pid))
+        for w in set(name.split()):
+            _discard_sorted(self._words, (w, pid))
+        for g in _trigrams(name):
+            ids = self._grams.get(g)
+            if ids is not None:
+                ids.discard(pid)
+                if not ids:
+                    del self._grams[g]
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        q = query.strip().lower()
+        if not q:
+            return []
+        ranks = {}
+        scan = limit * SCAN_FACTOR
+        names = self.names
+
+        def hit(pid, rank):
+            if rank < ranks.get(pid, RANK_SUBSTRING + 1):
+                ranks[pid] = rank
+
+        pid = self.by_sku.get(q)
+        if pid is not None:
+            hit(pid, RANK_SKU_EXACT)
+        for _, pid in _prefix_range(self._skus, q, limit):
+            hit(pid, RANK_SKU_PREFIX)
+
+        terms = q.split()
+        first = terms[0]
+        for _, pid in _prefix_range(self._words, first, scan):
+            name = names[pid]
+            if all(t in name for t in terms[1:]):
+                hit(pid, RANK_NAME_PREFIX if name.startswith(q) else RANK_WORD_PREFIX)
+
+        if len(q) >= 3:
+            sets = [self._grams.get(g, ()) for g in _trigrams(q)]
+            sets.sort(key=len)
+            candidates = set(sets[0]).intersection(*sets[1:]) if sets[0] else ()
+            n = 0
+            for pid in candidates:
+                if pid not in ranks and q in names[pid]:
+                    ranks[pid] = RANK_SUBSTRING
+                    n += 1
+                    if n >= scan:
+                        break
+
+        best = heapq.nsmallest(limit, ranks.items(),
+                               key=lambda kv: (kv[1], names[kv[0]], kv[0]))
+        return [self.rows[pid] for pid, _ in best]
+
+    def _add(self, row, keep_sorted=True):
+        pid, sku, name = row[0], (row[1] or '').lower(), row[2].lower()
+        add = insort if keep_sorted else list.append
+        self.rows[pid] = row
+        self.names[pid] = name
+        if sku:
+            self.by_sku[sku] = pid
+        add(self._skus, (sku, pid))
+        for w in set(name.split()):
+            add(self._words, (w, pid))
+        for g in _trigrams(name):
+            self._grams.setdefault(g, set()).add(pid)
+
+
+def _discard_sorted(seq, item):
+    i = bisect_left(seq, item)
+    if i < len(seq) and seq[i] == item:
+        del seq[i]
+
+
+def _prefix_range(seq, prefix, limit):
+    i = bisect_left(seq, (prefix,))
+    n = 0
+    while i < len(seq) and seq[i][0].startswith(prefix):
+        yield seq[i]
+        i += 1
+        n += 1
+        if limit is not None and n >= limit:
+            return
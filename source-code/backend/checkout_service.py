@@ -0,0 +1,152 @@
+import sqlite3
+from datetime import datetime
+
+import inventory
+import reports
+from pricing import line_total
+from instrument import timed
+
+POLICIES = ('reject', 'partial', 'oversell')
+
+
+class LineResult:
+    def __init__(self, product_id, requested, filled, price, available, deal=None, sku=None, name=None):
+        self.product_id = product_id
+        self.requested = requested
+        self.filled = filled
+        self.price = price
+        self.available = available
+        self.deal = deal
+        self.sku = sku
+        self.name = name
+
+    @property
+    def subtotal(self):
+        return line_total(self.filled, self.price, self.deal)
+
+    @property
+    def short(self):
+        return self.requested - self.filled
+
+
+class CheckoutResult:
+    def __init__(self, lines, tax_pct, sale_time):
+        self.sale_id = None
+        self.journal_seq = None
+        self.sale_time = sale_time
+        self.tax_pct = tax_pct
+        self.lines = lines
+        self.subtotal = sum(ln.subtotal for ln in lines)
+        self.total = calculate_total(self.subtotal, tax_pct)
+
+    @property
+    def ok(self):
+        return self.sale_id is not None or self.journal_seq is not None
+
+    @property
+    def shortages(self):
+        return [ln for ln in self.lines if ln.short > 0]
+
+    @property
+    def sold(self):
+        return [ln for ln in self.lines if ln.filled > 0]
+
+    def __repr__(self):
+        return (f"CheckoutResult(sale_id={self.sale_id}, journal_seq={self.journal_seq}, total={self.total}, "
+                f"lines={len(self.sold)}, shortages={len(self.shortages)})")
+
+
+class StockConflict(Exception):
+    pass
+
+
+def calculate_total(subtotal, tax_pct):
+    return subtotal + int(subtotal * tax_pct / 100)
+
+
+def merge_lines(lines):
+    # lines: (product_id, qty, unit price[, multi-buy deal[, sku, name]]) as they were at the till
+    merged = {}
+    for pid, qty, price, *rest in lines:
+        if qty <= 0:
+            continue
+        if pid in merged:
+            merged[pid][0] += qty
+        else:
+            deal, sku, name = (tuple(rest) + (None, None, None))[:3]
+            merged[pid] = [qty, price, deal, sku, name]
+    return merged
+
+
+def plan_sale(merged, stock, tax_pct, policy, sale_time):
+    results = []
+    for pid, (qty, price, deal, sku, name) in merged.items():
+        available = max(stock.get(pid, 0), 0)
+        if qty <= available or policy == 'oversell':
+            filled = qty
+        else:
+            filled = available if policy == 'partial' else 0
+        results.append(LineResult(pid, qty, filled, price, available, deal, sku, name))
+    return CheckoutResult(results, tax_pct, sale_time)
+
+
+def write_sale(cur, result, policy):
+    # caller holds the write transaction
+    sold = result.sold
+    cur.execute("INSERT INTO sales (datetime, total) VALUES (?,?)", (result.sale_time, result.total))
+    sale_id = cur.lastrowid
+    # sku, name and unit price are frozen into the line as the till had them, so receipts can be rebuilt
+    # exactly as sold even if the product is renamed or deleted before the sale reaches the database;
+    # only callers that pass bare (id, qty, price) lines fall back to the product row
+    cur.executemany(
+        "INSERT INTO sale_items (sale_id, product_id, qty, subtotal, sku, name, price) "
+        "VALUES (?1, ?2, ?3, ?4, IFNULL(?5, (SELECT sku FROM products WHERE id = ?2)), "
+        "IFNULL(?6, (SELECT name FROM products WHERE id = ?2)), ?7)",
+        [(sale_id, ln.product_id, ln.filled, ln.subtotal, ln.sku, ln.name, ln.price) for ln in sold])
+    if policy == 'oversell':
+        # the goods have already left the store, so stock may go below zero
+        cur.executemany("UPDATE products SET stock = stock - ? WHERE id = ?",
+                        [(ln.filled, ln.product_id) for ln in sold])
+    else:
+        cur.executemany(
+            "UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?",
+            [(ln.filled, ln.product_id, ln.filled) for ln in sold])
+        if cur.rowcount != len(sold):
+            raise StockConflict("stock changed while the sale was being committed")
+    inventory.record(cur, [(ln.product_id, -ln.filled, 'sale', sale_id) for ln in sold], at=result.sale_time)
+    reports.record_sale(cur, result.sale_time, result.total,
+                        [(ln.product_id, ln.filled, ln.subtotal) for ln in sold])
+    result.sale_id = sale_id
+    return sale_id
+
+
+def read_stock(cur, ids):
+    ids = list(ids)
+    marks = ','.join('?' * len(ids))
+    return dict(cur.execute(f"SELECT id, stock FROM products WHERE id IN ({marks})", ids).fetchall())
+
+
+@timed('commit_sale', category='job')
+def commit_sale(conn, lines, tax_pct=0.0, policy='reject', now=None):
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown stock policy: {policy}")
+    merged = merge_lines(lines)
+    sale_time = now or datetime.now().isoformat(' ', 'seconds')
+    if not merged:
+        return CheckoutResult([], tax_pct, sale_time)
+
+    if conn.in_transaction:
+        raise sqlite3.OperationalError("checkout needs a connection without an open transaction")
+    cur = conn.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        result = plan_sale(merged, read_stock(cur, merged), tax_pct, policy, sale_time)
+        if not result.sold or (policy == 'reject' and result.shortages):
+            conn.rollback()
+            return result
+        write_sale(cur, result, policy)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return result
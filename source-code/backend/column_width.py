@@ -0,0 +1,99 @@
+from collections import OrderedDict
+import tkinter.font as tkfont
+
+from instrument import timed
+
+CELL_PADDING = 20
+CACHE_SIZE = 4096
+
+
+class TextMeasurer:
+    def __init__(self, font_name='TkDefaultFont', maxsize=CACHE_SIZE):
+        self.font_name = font_name
+        self.maxsize = maxsize
+        self._font = None
+        self._cache = OrderedDict()
+
+    def measure(self, text):
+        text = str(text)
+        cache = self._cache
+        width = cache.get(text)
+        if width is not None:
+            cache.move_to_end(text)
+            return width
+        if self._font is None:
+            self._font = tkfont.nametofont(self.font_name)
+        width = self._font.measure(text)
+        cache[text] = width
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+        return width
+
+
+_measurers = {}
+
+
+def get_measurer(font_name='TkDefaultFont'):
+    m = _measurers.get(font_name)
+    if m is None:
+        m = _measurers[font_name] = TextMeasurer(font_name)
+    return m
+
+
+class ColumnSizer:
+    def __init__(self, tree, measurer=None, shrink=True):
+        self.tree = tree
+        self.measurer = measurer or get_measurer()
+        self.shrink = shrink
+        self.columns = tuple(tree['columns'])
+        self._rows = {}
+        self._counts = [{} for _ in self.columns]
+        self._header = [self._width(tree.heading(c, 'text') or c) for c in self.columns]
+        self._max = list(self._header)
+        self._applied = [None] * len(self.columns)
+
+    def _width(self, text):
+        return self.measurer.measure(text) + CELL_PADDING
+
+    def add_row(self, iid, values):
+        if iid in self._rows:
+            self.remove_row(iid)
+        widths = tuple(self._width(v) for v in values)
+        self._rows[iid] = widths
+        for i, w in enumerate(widths[:len(self.columns)]):
+            counts = self._counts[i]
+            counts[w] = counts.get(w, 0) + 1
+            if w > self._max[i]:
+                self._max[i] = w
+
+    def update_row(self, iid, values):
+        self.add_row(iid, values)
+
+    def remove_row(self, iid):
+        widths = self._rows.pop(iid, None)
+        if widths is None:
+            return
+        for i, w in enumerate(widths[:len(self.columns)]):
+            counts = self._counts[i]
+            left = counts[w] - 1
+            if left:
+                counts[w] = left
+                continue
+            del counts[w]
+            if w == self._max[i] and self.shrink:
+                self._max[i] = max(self._header[i], max(counts, default=0))
+
+    def clear(self):
+        self._rows.clear()
+        for counts in self._counts:
+            counts.clear()
+        if self.shrink:
+            self._max = list(self._header)
+
+    @timed('column_sizer.apply')
+    def apply(self):
+        for i, col in enumerate(self.columns):
+            w = self._max[i]
+            if w != self._applied[i]:
+                self.tree.column(col, width=w)
+                self._applied[i] = w
@@ -0,0 +1,200 @@
+import csv
+import os
+import re
+import sqlite3
+from itertools import islice
+
+import inventory
+from db import run_write
+from instrument import timed
+
+CHUNK_SIZE = 5000
+MODES = ('insert', 'upsert', 'skip')
+REQUIRED_FIELDS = ('sku', 'name', 'price')
+MAX_ERRORS = 1000
+
+HEADER_ALIASES = {
+    'code': 'sku',
+    'barcode': 'sku',
+    'product': 'name',
+    'product_name': 'name',
+    'item': 'name',
+    'qty': 'stock',
+    'quantity': 'stock',
+    'kategori': 'category',
+    'group': 'category',
+    'reorder': 'reorder_level',
+    'reorder_point': 'reorder_level',
+    'min_stock': 'reorder_level',
+}
+
+# stock is NULL when the file has no stock for the row: new products start at 0, existing ones keep
+# their count, so a supplier price list (sku,name,price) does not wipe the shelf
+INSERT = ("INSERT INTO products (sku, name, price, stock, category, reorder_level) "
+          "VALUES (?1, ?2, ?3, IFNULL(?4, 0), ?5, ?6)")
+INSERT_SQL = {
+    'insert': INSERT,
+    'skip': INSERT + " ON CONFLICT(sku) DO NOTHING",
+    # the WHERE leaves identical rows alone so they count as unchanged
+    'upsert': (INSERT + " ON CONFLICT(sku) DO UPDATE SET name=excluded.name, price=excluded.price, "
+               "stock=IFNULL(?4, stock), category=IFNULL(excluded.category, category), "
+               "reorder_level=IFNULL(excluded.reorder_level, reorder_level) "
+               "WHERE name IS NOT excluded.name OR price IS NOT excluded.price "
+               "OR stock IS NOT IFNULL(?4, stock) "
+               "OR category IS NOT IFNULL(excluded.category, category) "
+               "OR reorder_level IS NOT IFNULL(excluded.reorder_level, reorder_level)"),
+}
+
+
+THOUSANDS = re.compile(r'^\d{1,3}([.,]\d{3})+$')
+
+
+class ImportCancelled(Exception):
+    pass
+
+
+class ImportResult:
+    def __init__(self, total_bytes=0):
+        self.total_bytes = total_bytes
+        self.bytes_read = 0
+        self.rows = 0
+        self.written = 0
+        self.skipped = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def fraction(self):
+        return min(1.0, self.bytes_read / self.total_bytes) if self.total_bytes else 0.0
+
+    def __repr__(self):
+        return (f"ImportResult(rows={self.rows}, written={self.written}, "
+                f"skipped={self.skipped}, errors={len(self.errors)})")
+
+
+def normalize_header(name):
+    key = (name or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return HEADER_ALIASES.get(key, key)
+
+
+def _to_int(value):
+    value = (value or '').replace('Rp', '').strip()
+    if not value:
+        return 0
+    if THOUSANDS.match(value):
+        return int(value.replace('.', '').replace(',', ''))
+    return int(round(float(value)))
+
+
+def _counted(f, result):
+    for line in f:
+        result.bytes_read += len(line)
+        yield line
+
+
+def parse_rows(f, result):
+    rdr = csv.reader(_counted(f, result))
+    header = [normalize_header(h) for h in next(rdr, [])]
+    missing = [c for c in REQUIRED_FIELDS if c not in header]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    pos = {c: header.index(c) for c in ('sku', 'name', 'price', 'stock', 'category', 'reorder_level') if c in header}
+    for row in rdr:
+        if not any(cell.strip() for cell in row):
+            continue
+        result.rows += 1
+        line = rdr.line_num
+        try:
+            sku = row[pos['sku']].strip()
+            name = row[pos['name']].strip()
+            price = _to_int(row[pos['price']])
+            stock = row[pos['stock']].strip() if 'stock' in pos else ''
+            stock = _to_int(stock) if stock else None
+            category = (row[pos['category']].strip() or None) if 'category' in pos else None
+            level = row[pos['reorder_level']].strip() if 'reorder_level' in pos else ''
+            level = _to_int(level) if level else None
+        except (IndexError, ValueError) as e:
+            result.add_error(line, f"bad value: {e}")
+            continue
+        if not sku or not name:
+            result.add_error(line, "sku and name are required")
+            continue
+        yield (sku, name, price, stock, category, level)
+
+
+def _stock_by_sku(cur, skus):
+    found = {}
+    for i in range(0, len(skus), 900):
+        part = skus[i:i + 900]
+        found.update((r[0], (r[1], r[2])) for r in cur.execute(
+            f"SELECT sku, id, stock FROM products WHERE sku IN ({','.join('?' * len(part))})", part))
+    return found
+
+
+def _write_chunk(cur, mode, chunk, result):
+    skus = list({rec[0] for rec in chunk})
+    before = _stock_by_sku(cur, skus)
+    # rowcount, unlike total_changes, leaves out rows written by the search triggers
+    if mode == 'insert':
+        # one failing row must not abort the whole chunk, fall back to row by row
+        try:
+            cur.execute('SAVEPOINT chunk')
+            cur.executemany(INSERT_SQL[mode], chunk)
+            written = cur.rowcount
+            cur.execute('RELEASE chunk')
+        except sqlite3.IntegrityError:
+            cur.execute('ROLLBACK TO chunk')
+            cur.execute('RELEASE chunk')
+            written = 0
+            for rec in chunk:
+                try:
+                    cur.execute(INSERT_SQL[mode], rec)
+                    written += cur.rowcount
+                except sqlite3.IntegrityError as e:
+                    result.add_error(None, f"{rec[0]}: {e}")
+    else:
+        cur.executemany(INSERT_SQL[mode], chunk)
+        written = cur.rowcount
+    result.written += written
+    result.skipped += len(chunk) - written
+    moved = []
+    for sku, (pid, stock) in _stock_by_sku(cur, skus).items():
+        old = before.get(sku)
+        moved.append((pid, stock - (old[1] if old else 0), 'import', None))
+    inventory.record(cur, moved)
+
+
+@timed('import_csv', category='job')
+def import_csv(conn, path, mode='upsert', chunk_size=CHUNK_SIZE, progress=None, cancel=None):
+    if mode not in MODES:
+        raise ValueError(f"Unknown import mode: {mode}")
+    if conn.in_transaction:
+        raise sqlite3.OperationalError("import needs a connection without an open transaction")
+    return run_write(conn, _import, path, mode, chunk_size, progress, cancel)
+
+
+def _import(conn, path, mode, chunk_size, progress, cancel):
+    # a retry after SQLITE_BUSY starts over from the top of the file
+    result = ImportResult(os.path.getsize(path))
+    cur = conn.cursor()
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = parse_rows(f, result)
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                _write_chunk(cur, mode, chunk, result)
+                if progress:
+                    progress(result)
+                if cancel is not None and cancel.is_set():
+                    raise ImportCancelled()
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    return result
@@ -0,0 +1,81 @@
+import os
+import random
+import sqlite3
+import time
+from urllib.request import pathname2url
+
+import instrument
+
+BUSY_TIMEOUT_MS = int(os.environ.get('CASHIER_BUSY_TIMEOUT_MS', 5000))
+SYNCHRONOUS = os.environ.get('CASHIER_SYNCHRONOUS', 'NORMAL').upper()
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+WRITE_RETRIES = 5
+RETRY_BASE_DELAY = 0.05
+RETRY_MAX_DELAY = 1.0
+
+
+def connect(path, readonly=False, busy_timeout_ms=BUSY_TIMEOUT_MS, synchronous=SYNCHRONOUS,
+            check_same_thread=True):
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"Unknown synchronous mode: {synchronous}")
+    if readonly:
+        conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=ro", uri=True,
+                               timeout=busy_timeout_ms / 1000, check_same_thread=check_same_thread,
+                               factory=instrument.connection_factory())
+    else:
+        conn = sqlite3.connect(path, timeout=busy_timeout_ms / 1000, check_same_thread=check_same_thread,
+                               factory=instrument.connection_factory())
+        conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+    conn.execute(f'PRAGMA synchronous={synchronous}')
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def data_version(conn):
+    return conn.execute('PRAGMA data_version').fetchone()[0]
+
+
+class CommitWatch:
+    # data_version of a connection moves for every commit made by any *other* connection, so a commit
+    # that moved all of the app's writing connections came from another lane; our own commits are
+    # applied to the caches by hand and move at most all but one of them
+    def __init__(self, *sources):
+        self.sources = sources
+        self.version = 0
+        self._seen = self._read()
+
+    def _read(self):
+        return [read() for read in self.sources]
+
+    def current(self):
+        seen = self._read()
+        if None in seen:
+            # a source is busy writing; look again next time
+            return self.version
+        # a commit landing between the reads leaves them out of step, count it rather than miss it
+        raced = len(seen) > 1 and self.sources[0]() != seen[0]
+        if raced or all(a != b for a, b in zip(seen, self._seen)):
+            self.version += 1
+        self._seen = seen
+        return self.version
+
+
+def is_busy_error(exc):
+    msg = str(exc).lower()
+    return isinstance(exc, sqlite3.OperationalError) and ('locked' in msg or 'busy' in msg)
+
+
+def run_write(conn, fn, *args, retries=WRITE_RETRIES, **kwargs):
+    attempt = 0
+    while True:
+        try:
+            return fn(conn, *args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt >= retries:
+                raise
+            if conn.in_transaction:
+                conn.rollback()
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            attempt += 1
@@ -0,0 +1,156 @@
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+from instrument import timed
+
+FETCH_SIZE = 5000
+FORMATS = ('csv', 'jsonl')
+STATE_FILE = '.export_state.json'
+
+# (columns, query); sales tables take a (watermark, last sale id] window, products is always shipped whole
+TABLES = {
+    'sales': (('id', 'datetime', 'total'),
+              "SELECT id, datetime, total FROM sales WHERE id > ? AND id <= ? ORDER BY id"),
+    'sale_items': (('id', 'sale_id', 'product_id', 'sku', 'name', 'price', 'qty', 'subtotal'),
+                   "SELECT id, sale_id, product_id, sku, name, price, qty, subtotal FROM sale_items "
+                   "WHERE sale_id > ? AND sale_id <= ? ORDER BY sale_id, id"),
+    'products': (('id', 'sku', 'name', 'category', 'price', 'stock'),
+                 "SELECT id, sku, name, category, price, stock FROM products ORDER BY id"),
+}
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class ExportResult:
+    def __init__(self, last_sale_id):
+        self.last_sale_id = last_sale_id
+        self.files = []
+        self.rows = {}
+
+    @property
+    def total_rows(self):
+        return sum(self.rows.values())
+
+    def __repr__(self):
+        return f"ExportResult(last_sale_id={self.last_sale_id}, rows={self.rows})"
+
+
+def stream_rows(conn, sql, params=(), size=FETCH_SIZE):
+    cur = conn.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def csv_lines(columns, chunks):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(columns)
+    for rows in chunks:
+        w.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def jsonl_lines(columns, chunks):
+    for rows in chunks:
+        yield ''.join(json.dumps(dict(zip(columns, r)), ensure_ascii=False) + '\n' for r in rows)
+
+
+ENCODERS = {'csv': csv_lines, 'jsonl': jsonl_lines}
+
+
+def counted(chunks, result, table, progress=None, cancel=None):
+    for rows in chunks:
+        if cancel is not None and cancel.is_set():
+            raise ExportCancelled()
+        result.rows[table] = result.rows.get(table, 0) + len(rows)
+        yield rows
+        if progress:
+            progress(result)
+
+
+def write_file(path, lines, compress=False):
+    tmp = path + '.tmp'
+    opener = gzip.open if compress else open
+    f = opener(tmp, 'wt', encoding='utf-8', newline='')
+    try:
+        with f:
+            for text in lines:
+                f.write(text)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return tmp
+
+
+def load_state(out_dir):
+    try:
+        with open(os.path.join(out_dir, STATE_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(out_dir, state):
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+@timed('export', category='job')
+def run_export(conn, out_dir, fmt='csv', compress=False, full=False, tables=tuple(TABLES),
+               progress=None, cancel=None):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if conn.in_transaction:
+        raise sqlite3.OperationalError("export needs a connection without an open transaction")
+    os.makedirs(out_dir, exist_ok=True)
+    state = load_state(out_dir)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    ext = fmt + ('.gz' if compress else '')
+    written = []
+    # one read transaction so that sales, sale_items and products agree with each other
+    conn.execute('BEGIN')
+    try:
+        high = conn.execute("SELECT IFNULL(MAX(id), 0) FROM sales").fetchone()[0]
+        result = ExportResult(high)
+        for table in tables:
+            columns, sql = TABLES[table]
+            if table == 'products':
+                params, name = (), f"products-{stamp}.{ext}"
+            else:
+                low = 0 if full else state.get(table, 0)
+                if high <= low:
+                    continue
+                params, name = (low, high), f"{table}-{low + 1:09d}-{high:09d}.{ext}"
+            chunks = counted(stream_rows(conn, sql, params), result, table, progress, cancel)
+            tmp = write_file(os.path.join(out_dir, name), ENCODERS[fmt](columns, chunks), compress)
+            written.append((table, tmp, os.path.join(out_dir, name)))
+    except BaseException:
+        for _, tmp, _ in written:
+            os.remove(tmp)
+        raise
+    finally:
+        conn.rollback()
+    for table, tmp, path in written:
+        os.replace(tmp, path)
+        result.files.append(path)
+        if table != 'products':
+            state[table] = max(high, state.get(table, 0))
+    if written:
+        state['exported_at'] = stamp
+        save_state(out_dir, state)
+    return result
@@ -0,0 +1,219 @@
+import functools
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+ENABLED = os.environ.get('CASHIER_INSTRUMENT', '') not in ('', '0')
+BUCKETS = 32  # bucket i holds samples below 2**i microseconds
+MAX_SQL_LEN = 160
+
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def enable(on=True):
+    global ENABLED
+    ENABLED = on
+
+
+def enabled():
+    return ENABLED
+
+
+class Histogram:
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        us = int(seconds * 1e6)
+        self.buckets[min(BUCKETS - 1, us.bit_length())] += 1
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        want = self.count * pct / 100
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= want:
+                return min(self.max, (2 ** i) / 1e6)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_ms': round(self.total / self.count * 1000, 4) if self.count else 0.0,
+            'min_ms': round(self.min * 1000, 4) if self.count else 0.0,
+            'p50_ms': round(self.percentile(50) * 1000, 4),
+            'p95_ms': round(self.percentile(95) * 1000, 4),
+            'p99_ms': round(self.percentile(99) * 1000, 4),
+            'max_ms': round(self.max * 1000, 4),
+            'buckets_us_pow2': self.buckets,
+        }
+
+
+class Collector:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.started = time.time()
+
+    def record(self, category, name, seconds):
+        key = (category, name)
+        with self._lock:
+            h = self._stats.get(key)
+            if h is None:
+                h = self._stats[key] = Histogram()
+            h.add(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            items = [(k, h.to_dict()) for k, h in self._stats.items()]
+        out = {'started': self.started, 'taken': time.time(), 'stats': {}}
+        for (category, name), d in sorted(items):
+            out['stats'].setdefault(category, {})[name] = d
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started = time.time()
+
+
+COLLECTOR = Collector()
+
+
+def record(category, name, seconds):
+    if ENABLED:
+        COLLECTOR.record(category, name, seconds)
+
+
+def timed(name, category='ui'):
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                COLLECTOR.record(category, name, time.perf_counter() - t0)
+        return wrapper
+    return deco
+
+
+def normalize_sql(sql):
+    sql = _SPACES.sub(' ', _IN_LIST.sub('(?...)', sql)).strip()
+    return sql if len(sql) <= MAX_SQL_LEN else sql[:MAX_SQL_LEN] + '...'
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    _sql = None
+
+    def _timed(self, method, sql, *args):
+        self._sql = normalize_sql(sql)
+        t0 = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            COLLECTOR.record('sql', self._sql, time.perf_counter() - t0)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, script):
+        return self._timed(super().executescript, script)
+
+    def _fetch(self, method, *args):
+        t0 = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._sql:
+                COLLECTOR.record('sql_fetch', self._sql, time.perf_counter() - t0)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+    def commit(self):
+        t0 = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            COLLECTOR.record('sql', 'COMMIT', time.perf_counter() - t0)
+
+
+def connection_factory():
+    return InstrumentedConnection if ENABLED else sqlite3.Connection
+
+
+def dump(path):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(COLLECTOR.snapshot(), f, indent=1)
+    os.replace(tmp, path)
+
+
+class PeriodicDumper:
+    def __init__(self, path, interval=60.0):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stats-dumper', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._dump()
+
+    def _dump(self):
+        try:
+            dump(self.path)
+        except OSError:
+            pass
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._dump()
@@ -0,0 +1,159 @@
+import os
+from datetime import datetime, timedelta
+
+KINDS = ('sale', 'restock', 'adjustment', 'import')
+SNAPSHOT_INTERVAL_HOURS = float(os.environ.get('CASHIER_SNAPSHOT_HOURS', 24))
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS stock_movements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        at TEXT NOT NULL,
+        kind TEXT NOT NULL CHECK (kind IN ('sale', 'restock', 'adjustment', 'import')),
+        qty INTEGER NOT NULL,
+        ref INTEGER
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_stock_movements_at ON stock_movements(at)",
+    "CREATE INDEX IF NOT EXISTS idx_stock_movements_product ON stock_movements(product_id, id)",
+    '''
+    CREATE TABLE IF NOT EXISTS stock_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        taken_at TEXT NOT NULL,
+        last_movement_id INTEGER NOT NULL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_stock_snapshots_taken ON stock_snapshots(taken_at)",
+    '''
+    CREATE TABLE IF NOT EXISTS snapshot_items (
+        snapshot_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        stock INTEGER NOT NULL,
+        PRIMARY KEY (snapshot_id, product_id)
+    ) WITHOUT ROWID
+    ''',
+]
+
+
+def now():
+    return datetime.now().isoformat(' ', 'seconds')
+
+
+def ensure_schema(conn):
+    for sql in SCHEMA:
+        conn.execute(sql)
+
+
+def record(cur, movements, at=None):
+    # movements: (product_id, qty delta, kind, ref); zero deltas are dropped
+    at = at or now()
+    rows = [(pid, at, kind, qty, ref) for pid, qty, kind, ref in movements if qty]
+    if rows:
+        cur.executemany("INSERT INTO stock_movements (product_id, at, kind, qty, ref) VALUES (?,?,?,?,?)", rows)
+    return len(rows)
+
+
+def write_snapshot(cur, at=None):
+    last = cur.execute("SELECT IFNULL(MAX(id), 0) FROM stock_movements").fetchone()[0]
+    cur.execute("INSERT INTO stock_snapshots (taken_at, last_movement_id) VALUES (?,?)", (at or now(), last))
+    snapshot_id = cur.lastrowid
+    cur.execute("INSERT INTO snapshot_items (snapshot_id, product_id, stock) SELECT ?, id, stock FROM products",
+                (snapshot_id,))
+    return snapshot_id
+
+
+def take_snapshot(conn, at=None):
+    cur = conn.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        snapshot_id = write_snapshot(cur, at)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return snapshot_id
+
+
+def snapshot_due(conn, hours=SNAPSHOT_INTERVAL_HOURS):
+    last = conn.execute("SELECT MAX(taken_at) FROM stock_snapshots").fetchone()[0]
+    cutoff = (datetime.now() - timedelta(hours=hours)).isoformat(' ', 'seconds')
+    return last is None or last <= cutoff
+
+
+def snapshot_before(conn, at):
+    return conn.execute('''
+        SELECT id, taken_at, last_movement_id FROM stock_snapshots
+        WHERE taken_at <= ? ORDER BY taken_at DESC, id DESC LIMIT 1
+    ''', (at,)).fetchone()
+
+
+def end_of_day(day):
+    return day + ' 23:59:59' if len(day) == 10 else day
+
+
+def stock_at(conn, at, product_ids=None):
+    # nearest snapshot at or before `at`, plus the movements recorded after it
+    snap = snapshot_before(conn, at)
+    if snap is None:
+        return None
+    snapshot_id, _, last_id = snap
+    sql = '''
+        SELECT p.id, p.sku, p.name, p.price, IFNULL(si.stock, 0) + IFNULL(t.delta, 0) AS stock
+        FROM products p
+        LEFT JOIN snapshot_items si ON si.snapshot_id = ? AND si.product_id = p.id
+        LEFT JOIN (SELECT product_id, SUM(qty) AS delta FROM stock_movements
+                   WHERE id > ? AND at <= ? GROUP BY product_id) t ON t.product_id = p.id
+        WHERE (si.product_id IS NOT NULL OR t.product_id IS NOT NULL)
+    '''
+    params = [snapshot_id, last_id, at]
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return []
+        sql += f" AND p.id IN ({','.join('?' * len(product_ids))})"
+        params.extend(product_ids)
+    return conn.execute(sql + " ORDER BY p.name, p.id", params).fetchall()
+
+
+def shrinkage_report(conn, start, end):
+    rows = conn.execute('''
+        SELECT m.product_id, IFNULL(p.sku, '?') AS sku, IFNULL(p.name, '(deleted)') AS name,
+               IFNULL(p.price, 0) AS price,
+               SUM(CASE WHEN m.kind IN ('restock', 'import') THEN m.qty ELSE 0 END) AS received,
+               -SUM(CASE WHEN m.kind = 'sale' THEN m.qty ELSE 0 END) AS sold,
+               -SUM(CASE WHEN m.kind = 'adjustment' AND m.qty < 0 THEN m.qty ELSE 0 END) AS lost,
+               SUM(CASE WHEN m.kind = 'adjustment' AND m.qty > 0 THEN m.qty ELSE 0 END) AS found
+        FROM stock_movements m LEFT JOIN products p ON p.id = m.product_id
+        WHERE m.at BETWEEN ? AND ?
+        GROUP BY m.product_id
+        HAVING lost > 0 OR found > 0
+    ''', (start, end_of_day(end))).fetchall()
+    ids = [r['product_id'] for r in rows]
+    opening = {r['id']: r['stock'] for r in stock_at(conn, start, ids) or ()}
+    closing = {r['id']: r['stock'] for r in stock_at(conn, end_of_day(end), ids) or ()}
+    out = []
+    for r in rows:
+        d = dict(r)
+        d['opening'] = opening.get(r['product_id'])
+        d['closing'] = closing.get(r['product_id'])
+        d['loss_value'] = (r['lost'] - r['found']) * r['price']
+        out.append(d)
+    out.sort(key=lambda d: -d['loss_value'])
+    return out
+
+
+def verify(conn):
+    # products whose stock no longer matches snapshot + ledger, i.e. a write bypassed the ledger
+    snap = conn.execute("SELECT id, last_movement_id FROM stock_snapshots ORDER BY id DESC LIMIT 1").fetchone()
+    if snap is None:
+        return None
+    return conn.execute('''
+        SELECT p.id, p.sku, p.name, p.stock, IFNULL(si.stock, 0) + IFNULL(t.delta, 0) AS ledger
+        FROM products p
+        LEFT JOIN snapshot_items si ON si.snapshot_id = ? AND si.product_id = p.id
+        LEFT JOIN (SELECT product_id, SUM(qty) AS delta FROM stock_movements
+                   WHERE id > ? GROUP BY product_id) t ON t.product_id = p.id
+        WHERE p.stock != IFNULL(si.stock, 0) + IFNULL(t.delta, 0)
+        ORDER BY p.id
+    ''', tuple(snap)).fetchall()
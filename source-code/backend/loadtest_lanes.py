@@ -0,0 +1,152 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+
+def lane(lane_no, sales, max_lines, seed, out):
+    import main
+    from db import run_write, is_busy_error
+    from checkout_service import commit_sale
+
+    rnd = random.Random(seed + lane_no)
+    conn = main.get_db_conn()
+    reader = main.get_db_conn(readonly=True)
+    products = [tuple(r) for r in reader.execute("SELECT id, price FROM products")]
+    max_lines = min(max_lines, len(products))
+    stats = {'lane': lane_no, 'latencies': [], 'committed': 0, 'rejected': 0, 'partial': 0,
+             'busy_errors': 0, 'error': None}
+    try:
+        for _ in range(sales if max_lines else 0):
+            cart = [(pid, rnd.randint(1, 3), price)
+                    for pid, price in rnd.sample(products, rnd.randint(1, max_lines))]
+            t0 = time.perf_counter()
+            try:
+                result = run_write(conn, commit_sale, cart, tax_pct=11.0, policy='partial')
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e):
+                    raise
+                stats['busy_errors'] += 1
+                continue
+            stats['latencies'].append(time.perf_counter() - t0)
+            if not result.ok:
+                stats['rejected'] += 1
+            else:
+                stats['committed'] += 1
+                if result.shortages:
+                    stats['partial'] += 1
+    except Exception as e:
+        stats['error'] = repr(e)
+        raise
+    finally:
+        conn.close()
+        reader.close()
+        out.put(stats)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def prepare_db(path, products, stock):
+    import main
+    conn = main.get_db_conn()
+    conn.execute("DELETE FROM products")
+    conn.executemany("INSERT INTO products (sku, name, price, stock) VALUES (?,?,?,?)",
+                     ((f"LT{i:06d}", f"Load Test Item {i}", 1000 + i % 50 * 500, stock) for i in range(products)))
+    conn.commit()
+    import inventory
+    inventory.take_snapshot(conn)
+    conn.close()
+
+
+def check_consistency(initial_stock):
+    import main
+    conn = main.get_db_conn(readonly=True)
+    bad = conn.execute("""
+        SELECT p.id FROM products p
+        LEFT JOIN (SELECT product_id, SUM(qty) AS sold FROM sale_items GROUP BY product_id) s
+               ON s.product_id = p.id
+        WHERE p.stock < 0 OR p.stock + IFNULL(s.sold, 0) != ?
+    """, (initial_stock,)).fetchall()
+    conn.close()
+    return len(bad)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate several cashier lanes checking out against one database')
+    parser.add_argument('--lanes', type=int, default=4)
+    parser.add_argument('--sales', type=int, default=200, help='sales per lane')
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--max-lines', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', help='database file to use (default: a fresh temporary database)')
+    parser.add_argument('--json', help='write the summary to this file')
+    args = parser.parse_args(argv)
+
+    tmpdir = None
+    if args.db:
+        os.environ['CASHIER_DB'] = os.path.abspath(args.db)
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='cashier-loadtest-')
+        os.environ['CASHIER_DB'] = os.path.join(tmpdir, 'cashier.db')
+    try:
+        import main
+        main.init_db()
+        if tmpdir:
+            prepare_db(os.environ['CASHIER_DB'], args.products, args.stock)
+
+        out = mp.Queue()
+        procs = [mp.Process(target=lane, args=(i, args.sales, args.max_lines, args.seed, out))
+                 for i in range(args.lanes)]
+        t0 = time.perf_counter()
+        for p in procs:
+            p.start()
+        results = [out.get() for _ in procs]
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - t0
+
+        latencies = [x for r in results for x in r['latencies']]
+        summary = {
+            'lanes': args.lanes,
+            'elapsed_s': round(elapsed, 3),
+            'committed': sum(r['committed'] for r in results),
+            'rejected': sum(r['rejected'] for r in results),
+            'partial': sum(r['partial'] for r in results),
+            'busy_errors': sum(r['busy_errors'] for r in results),
+            'lane_errors': [r['error'] for r in results if r['error']],
+            'sales_per_s': round(sum(r['committed'] for r in results) / elapsed, 1),
+            'latency_ms': {
+                'mean': round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+                'p50': round(percentile(latencies, 50) * 1000, 2),
+                'p95': round(percentile(latencies, 95) * 1000, 2),
+                'p99': round(percentile(latencies, 99) * 1000, 2),
+            },
+        }
+        if tmpdir:
+            summary['inconsistent_products'] = check_consistency(args.stock)
+        print(json.dumps(summary, indent=2))
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+        failed = summary['busy_errors'] or summary['lane_errors'] or summary.get('inconsistent_products')
+        return 1 if failed else 0
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
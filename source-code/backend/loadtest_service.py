@@ -0,0 +1,181 @@
+import argparse
+import http.client
+import json
+import multiprocessing as mp
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote, urlsplit
+
+from loadtest_lanes import lane, percentile, prepare_db
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MIX = (('sku', 70), ('stock', 20), ('search', 10))
+
+
+def client(client_no, url, skus, words, duration, seed, out):
+    rnd = random.Random(seed + client_no)
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=10)
+    routes = [r for r, _ in MIX]
+    weights = [w for _, w in MIX]
+    stats = {'latencies': {r: [] for r in routes}, 'errors': 0, 'not_found': 0}
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        route = rnd.choices(routes, weights)[0]
+        if route == 'sku':
+            path = '/sku/' + quote(rnd.choice(skus))
+        elif route == 'stock':
+            path = '/stock?sku=' + ','.join(quote(s) for s in rnd.sample(skus, min(len(skus), 10)))
+        else:
+            path = '/search?q=' + quote(rnd.choice(words)) + '&limit=20'
+        t0 = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            resp = conn.getresponse()
+            resp.read()
+        except (OSError, http.client.HTTPException):
+            stats['errors'] += 1
+            conn.close()
+            continue
+        stats['latencies'][route].append(time.perf_counter() - t0)
+        if resp.status == 404:
+            stats['not_found'] += 1
+        elif resp.status != 200:
+            stats['errors'] += 1
+    conn.close()
+    out.put(stats)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url, timeout=10.0):
+    parts = urlsplit(url)
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def sample_catalog(db_path, count, seed):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    rows = conn.execute("SELECT sku, name FROM products").fetchall()
+    conn.close()
+    rows = random.Random(seed).sample(rows, min(count, len(rows)))
+    words = sorted({w for _, name in rows for w in name.split() if len(w) > 2} or {'item'})
+    return [sku for sku, _ in rows], words
+
+
+def latency_summary(latencies):
+    return {
+        'count': len(latencies),
+        'mean': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        'p50': round(percentile(latencies, 50) * 1000, 3),
+        'p95': round(percentile(latencies, 95) * 1000, 3),
+        'p99': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description='Hammer the price lookup service with shelf-checker style requests')
+    parser.add_argument('--url', help='service to test (default: start one on a fresh temporary database)')
+    parser.add_argument('--db', help='database to sample SKUs from when --url is given')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent keep-alive clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds')
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--hot', type=int, default=1000, help='distinct SKUs the clients ask for')
+    parser.add_argument('--pool', type=int, default=8, help='read connections of the started service')
+    parser.add_argument('--lanes', type=int, default=0,
+                        help='checkout lanes selling against the same database meanwhile')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the summary to this file')
+    args = parser.parse_args(argv)
+
+    tmpdir = server = None
+    lanes = []
+    out = mp.Queue()
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+            db_path = os.path.abspath(args.db or os.environ.get('CASHIER_DB', os.path.join(HERE, 'cashier.db')))
+        else:
+            tmpdir = tempfile.mkdtemp(prefix='cashier-service-')
+            db_path = os.environ['CASHIER_DB'] = os.path.join(tmpdir, 'cashier.db')
+            import main
+            main.init_db()
+            prepare_db(db_path, args.products, 10 ** 6)
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            server = subprocess.Popen([sys.executable, os.path.join(HERE, 'main.py'), 'serve',
+                                       '--port', str(port), '--pool', str(args.pool)])
+        wait_ready(url)
+        skus, words = sample_catalog(db_path, args.hot, args.seed)
+        if not skus:
+            parser.error('the database has no products to ask for')
+
+        if args.lanes and not args.url:
+            lanes = [mp.Process(target=lane, args=(i, 10 ** 6, 8, args.seed, mp.Queue()), daemon=True)
+                     for i in range(args.lanes)]
+            for p in lanes:
+                p.start()
+        procs = [mp.Process(target=client, args=(i, url, skus, words, args.duration, args.seed, out))
+                 for i in range(args.clients)]
+        t0 = time.perf_counter()
+        for p in procs:
+            p.start()
+        results = [out.get() for _ in procs]
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - t0
+
+        by_route = {r: [x for res in results for x in res['latencies'][r]] for r, _ in MIX}
+        latencies = [x for v in by_route.values() for x in v]
+        summary = {
+            'url': url,
+            'clients': args.clients,
+            'lanes': len(lanes),
+            'elapsed_s': round(elapsed, 3),
+            'requests': len(latencies),
+            'requests_per_s': round(len(latencies) / elapsed, 1),
+            'errors': sum(r['errors'] for r in results),
+            'not_found': sum(r['not_found'] for r in results),
+            'latency_ms': latency_summary(latencies),
+            'routes_ms': {r: latency_summary(v) for r, v in by_route.items()},
+        }
+        print(json.dumps(summary, indent=2))
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+        return 1 if summary['errors'] else 0
+    finally:
+        for p in lanes:
+            p.terminate()
+            p.join()
+        if server:
+            server.terminate()
+            server.wait()
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
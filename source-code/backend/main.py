@@ -1,110 +1,125 @@
+import time
+STARTED_AT = time.perf_counter()
+
 import os
+import sys
+import json
+import argparse
+import queue
 import sqlite3
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import tkinter.font as tkfont
-from datetime import datetime
-import csv
+
+import migrations
+from catalog_index import CatalogIndex, SEARCH_LIMIT, changes_since
+from product_list import PRODUCT_COLUMNS, ListPager, VirtualProductList
+from product_cache import ProductCache, CachedPager, SELECT_PRODUCT
+from product_search import ProductSearch
+from column_width import ColumnSizer
+from db import connect, run_write, data_version, CommitWatch
+from checkout_service import commit_sale, plan_sale, read_stock, merge_lines
+import sale_journal
+import reports
+import inventory
+import pricing
+import reorder
+from receipts import ReceiptStore, ReceiptWriter, CorruptReceipt, format_receipt, migrate_text_receipts, rebuild_receipts, sale_ids
+from cart import Cart, CartItem, Product, INSERT, UPDATE, DELETE, CLEAR
+from scanner import parse_scan, ScanError
+import instrument
+from instrument import timed
+from csv_import import import_csv, ImportCancelled, MODES as IMPORT_MODES, CHUNK_SIZE
+from export import run_export, ExportCancelled, FORMATS as EXPORT_FORMATS, TABLES as EXPORT_TABLES
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, 'cashier.db')
-RECEIPT_DIR = os.path.join(BASE_DIR, 'receipts')
+DB_PATH = os.environ.get('CASHIER_DB') or os.path.join(BASE_DIR, 'cashier.db')
+RECEIPT_DIR = os.environ.get('CASHIER_RECEIPTS') or os.path.join(BASE_DIR, 'receipts')
+RECEIPT_JOURNAL_DIR = os.path.join(RECEIPT_DIR, 'journal')
+EXPORT_DIR = os.environ.get('CASHIER_EXPORTS') or os.path.join(BASE_DIR, 'exports')
+JOURNAL_DIR = os.environ.get('CASHIER_JOURNAL_DIR') or os.path.join(BASE_DIR, 'journal')
+SEARCH_DEBOUNCE_MS = 150
+STATS_FILE = os.environ.get('CASHIER_STATS_FILE') or os.path.join(BASE_DIR, 'stats.json')
+STATS_INTERVAL = float(os.environ.get('CASHIER_STATS_INTERVAL', 60))
+STARTUP_BUDGET_MS = float(os.environ.get('CASHIER_STARTUP_BUDGET_MS', 1500))
+CATALOG_POLL_MS = 50
+# more catalog changes than this from other lanes and the index is rebuilt in the background instead
+CATALOG_SYNC_LIMIT = 1000
+DATA_VERSION_POLL_MS = 2000
+JOURNAL_POLL_MS = 100
+PRICING_POLL_MS = 60000
+SNAPSHOT_POLL_MS = 10 * 60 * 1000
 
 os.makedirs(RECEIPT_DIR, exist_ok=True)
 
-def get_db_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sku TEXT UNIQUE,
-            name TEXT NOT NULL,
-            price INTEGER NOT NULL,
-            stock INTEGER NOT NULL
-        )
-    ''')
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS sales (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            datetime TEXT NOT NULL,
-            total INTEGER NOT NULL
-        )
-    ''')
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS sale_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sale_id INTEGER,
-            product_id INTEGER,
-            qty INTEGER,
-            subtotal INTEGER,
-            FOREIGN KEY(sale_id) REFERENCES sales(id),
-            FOREIGN KEY(product_id) REFERENCES products(id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-def seed_sample_products():
-    conn = get_db_conn()
-    cur = conn.cursor()
-    sample = [
-        ('E026', 'Mizone', 3000, 20),
-        ('E027', 'Bubble Gum', 4000, 15),
-        ('E028', 'Sunpride Banana', 5000, 10),
-        ('B051', 'Crackers', 12000, 30),
-        ('C076', 'Ketchup', 12000, 25),
-    ]
-    for sku, name, price, stock in sample:
-        try:
-            cur.execute('INSERT INTO products (sku,name,price,stock) VALUES (?,?,?,?)',
-                        (sku, name, price, stock))
-        except sqlite3.IntegrityError:
-            pass
-    conn.commit()
-    conn.close()
-
-class Product:
-    def __init__(self, row):
-        self.id = row['id']
-        self.sku = row['sku']
-        self.name = row['name']
-        self.price = row['price']
-        self.stock = row['stock']
-
-class CartItem:
-    def __init__(self, product: Product, qty: int):
-        self.product = product
-        self.qty = qty
-
-    @property
-    def subtotal(self):
-        return self.qty * self.product.price
-
-def auto_adjust_treeview(tree):
-    tree.update_idletasks()
-    for col in tree["columns"]:
-        max_width = tkfont.Font().measure(col) + 20
-        for item in tree.get_children():
-            cell_text = tree.set(item, col)
-            cell_width = tkfont.Font().measure(cell_text) + 20
-            if cell_width > max_width:
-                max_width = cell_width
-        tree.column(col, width=max_width)
+def get_db_conn(readonly=False):
+    return connect(DB_PATH, readonly=readonly)
+
+def init_db(conn=None):
+    own = conn is None
+    if own:
+        conn = get_db_conn()
+    try:
+        return migrations.migrate(conn)
+    finally:
+        if own:
+            conn.close()
+
+class StartupProbe:
+    def __init__(self, budget_ms=STARTUP_BUDGET_MS):
+        self.budget_ms = budget_ms
+        self.marks = {}
+
+    def mark(self, name):
+        elapsed = time.perf_counter() - STARTED_AT
+        self.marks[name] = round(elapsed * 1000, 1)
+        instrument.record('startup', name, elapsed)
+
+    def report(self):
+        shown = self.marks.get('window_shown')
+        over = shown is None or shown > self.budget_ms
+        print(json.dumps({'marks_ms': self.marks, 'budget_ms': self.budget_ms, 'over_budget': over}, indent=2))
+        return 1 if over else 0
 
 class CashierApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, conn=None, probe=None):
         super().__init__()
         self.title('Kasir Minimarket')
         self.geometry('1000x700')
         self.resizable(False, False)
         self.config(bg="#FFE7FC")
-        self.conn = get_db_conn()
+        self.conn = conn or get_db_conn()
+        self.read_conn = get_db_conn(readonly=True)
+        self.receipts = ReceiptStore(RECEIPT_JOURNAL_DIR)
+        self.receipt_writer = ReceiptWriter(self.receipts, on_error=self.on_receipt_error)
+        self.journal = self.journal_writer = None
+        self._journal_events = queue.Queue()
+        if sale_journal.MODE != 'off':
+            try:
+                self.journal = sale_journal.SaleJournal(JOURNAL_DIR, sale_journal.MODE)
+            except sale_journal.JournalInUse as e:
+                messagebox.showerror("Sale Journal", str(e), parent=self)
+                self.destroy()
+                raise
+            # sales journaled before a crash go in before anything new is sold
+            self.on_journal_applied(sale_journal.replay(self.conn, self.journal))
+            self.journal_writer = sale_journal.JournalWriter(self.journal, DB_PATH, on_applied=self.on_journal_applied,
+                                                             on_error=self.on_journal_error)
+        # this lane writes through self.conn and the journal writer; both apply their changes to the
+        # caches themselves, so only commits that moved both connections' data_version are news
+        watched = [lambda: data_version(self.conn)]
+        if self.journal_writer is not None:
+            watched.append(self.journal_writer.data_version)
+        self.commits = CommitWatch(*watched)
+        self.products = ProductCache(self.read_conn, watch=self.commits.current)
+        self.prices = pricing.PriceBook(self.read_conn, watch=self.commits.current)
+        self.alerts = reorder.ReorderAlerts(self.read_conn, watch=self.commits.current)
+        self.search = ProductSearch(self.read_conn,
+                                    fetch=lambda sql, params: self.products.query(sql, params, depends=('sku', 'name')))
+        self.protocol('WM_DELETE_WINDOW', self.on_close)
+        self.stats_dumper = None
+        if instrument.enabled():
+            self.stats_dumper = instrument.PeriodicDumper(STATS_FILE, STATS_INTERVAL)
 
         self.left_frame = tk.Frame(self, bg="#FCB7F2", bd=2, relief='groove')
         self.left_frame.place(x=20, y=20, width=600, height=660)
@@ -112,7 +127,22 @@ class CashierApp(tk.Tk):
         self.right_frame = tk.Frame(self, bg="#FCBBF6", bd=2, relief='groove')
         self.right_frame.place(x=640, y=20, width=340, height=660)
 
+        self.scan_var = tk.StringVar()
+        self.scan_status = tk.StringVar(value='Ready to scan (F2)')
+        scan_frame = tk.Frame(self.left_frame, bg="#f9d6f1")
+        scan_frame.pack(fill='x', padx=10, pady=(8, 0))
+        tk.Label(scan_frame, text='Scan:', bg="#f9d6f1").pack(side='left')
+        self.scan_entry = tk.Entry(scan_frame, textvariable=self.scan_var, width=18)
+        self.scan_entry.pack(side='left', padx=6)
+        self.scan_entry.bind('<Return>', self.on_scan)
+        self.scan_entry.bind('<KP_Enter>', self.on_scan)
+        self.scan_label = tk.Label(scan_frame, textvariable=self.scan_status, bg="#f9d6f1", anchor='w')
+        self.scan_label.pack(side='left', fill='x', expand=True)
+        self.bind('<F2>', lambda e: self.scan_entry.focus_set())
+
         self.search_var = tk.StringVar()
+        self._search_job = None
+        self.search_var.trace_add('write', self.on_search_changed)
         tk.Label(self.left_frame, text='Search Product:', bg="#f9d6f1").pack(anchor='nw', padx=10, pady=(8, 0))
         sframe = tk.Frame(self.left_frame, bg="#ffe0f8")
         sframe.pack(fill='x', padx=10)
@@ -120,17 +150,23 @@ class CashierApp(tk.Tk):
         tk.Button(sframe, text='Search', command=self.load_products).pack(side='left', padx=6)
         tk.Button(sframe, text='Refresh', command=self.load_products).pack(side='left', padx=6)
 
-        cols = ('id', 'sku', 'name', 'price', 'stock')
-        self.tree = ttk.Treeview(self.left_frame, columns=cols, show='headings', height=20)
-        for c in cols:
+        tree_frame = tk.Frame(self.left_frame)
+        tree_frame.pack(padx=10, pady=8, fill='both', expand=True)
+        self.tree = ttk.Treeview(tree_frame, columns=PRODUCT_COLUMNS, show='headings', height=18)
+        for c in PRODUCT_COLUMNS:
             self.tree.heading(c, text=c.title())
         self.tree.column('id', width=40)
         self.tree.column('sku', width=100)
         self.tree.column('name', width=220)
         self.tree.column('price', width=80)
         self.tree.column('stock', width=60)
-        self.tree.pack(padx=10, pady=8, fill='both', expand=True)
+        tree_vsb = ttk.Scrollbar(tree_frame, orient='vertical')
+        tree_vsb.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
         self.tree.bind('<Double-1>', self.on_product_double_click)
+        self.product_list = VirtualProductList(self.tree, tree_vsb, sizer=ColumnSizer(self.tree, shrink=False),
+                                               display=self.display_row)
+        self.product_pager = CachedPager(self.products)
 
         ctl = tk.Frame(self.left_frame, bg="#ffb5ff")
         ctl.pack(fill='x', padx=10, pady=6)
@@ -138,6 +174,11 @@ class CashierApp(tk.Tk):
         tk.Button(ctl, text='Edit Product', command=self.open_edit_product).pack(side='left', padx=6)
         tk.Button(ctl, text='Delete Product', command=self.delete_selected_product).pack(side='left', padx=6)
         tk.Button(ctl, text='Import CSV', command=self.import_products_csv).pack(side='left', padx=6)
+        tk.Button(ctl, text='Reports', command=self.open_reports).pack(side='left', padx=6)
+        tk.Button(ctl, text='Diagnostics', command=lambda: DiagnosticsWindow(self)).pack(side='left', padx=6)
+        self.low_stock_btn = tk.Button(ctl, command=lambda: LowStockWindow(self))
+        self.low_stock_btn.pack(side='left', padx=6)
+        self.update_low_stock()
 
         cart_top = tk.Frame(self.right_frame, bg="#fadef3")
         cart_top.pack(fill='both', expand=False, padx=4, pady=(6, 0))
@@ -157,12 +198,14 @@ class CashierApp(tk.Tk):
         self.cart_box.column('price', width=80)
         self.cart_box.column('subtotal', width=100)
         self.cart_box.pack(padx=8, pady=6, fill='both')
+        self.cart_sizer = ColumnSizer(self.cart_box)
 
         btns = tk.Frame(cart_top, bg="#f8b4e3")
         btns.pack(fill='x', padx=8)
         tk.Button(btns, text='Delete Item', command=self.remove_cart_item).pack(side='left', padx=4)
         tk.Button(btns, text='Update Qty', command=self.update_cart_qty).pack(side='left', padx=4)
         tk.Button(btns, text='Clear Cart', command=self.clear_cart).pack(side='left', padx=4)
+        tk.Button(btns, text='Reprint', command=self.reprint_receipt).pack(side='left', padx=4)
 
         self.var_sub = tk.IntVar(value=0)
         self.var_tax = tk.DoubleVar(value=11.0)
@@ -197,28 +240,211 @@ class CashierApp(tk.Tk):
         vsb.pack(side='right', fill='y')
         self.receipt_text['yscrollcommand'] = vsb.set
 
-        self.cart = []
+        self.cart = Cart(tax_pct=self.var_tax.get())
+        self.scan_entry.focus_set()
+        self.probe = probe
+        self.catalog = CatalogIndex()
+        self.catalog_ready = False
+        self._catalog_events = queue.Queue()
+        self._catalog_loading = False
+        self.start_catalog_build()
+        self.after(DATA_VERSION_POLL_MS, self.poll_products)
+        self.after(JOURNAL_POLL_MS, self.poll_journal)
+        self.after(DATA_VERSION_POLL_MS, self.poll_pricing)
+        self.after(DATA_VERSION_POLL_MS, self.poll_snapshot)
         self.load_products()
+        if probe is not None:
+            self.update()
+            probe.mark('window_shown')
+
+    def start_catalog_build(self):
+        # scans go through the product cache until the new index is in
+        self.catalog_ready = False
+        if self._catalog_loading:
+            return
+        self._catalog_loading = True
+        threading.Thread(target=self.build_catalog, name='catalog-loader', daemon=True).start()
+        self.after(CATALOG_POLL_MS, self.poll_catalog)
 
+    def build_catalog(self):
+        try:
+            conn = get_db_conn(readonly=True)
+            try:
+                self._catalog_events.put(CatalogIndex.from_db(conn))
+            finally:
+                conn.close()
+        except Exception as e:
+            self._catalog_events.put(e)
+
+    def poll_catalog(self):
+        try:
+            catalog = self._catalog_events.get_nowait()
+        except queue.Empty:
+            self.after(CATALOG_POLL_MS, self.poll_catalog)
+            return
+        self._catalog_loading = False
+        if isinstance(catalog, Exception):
+            print(f"Could not load the product index, using SQL lookups: {catalog}", file=sys.stderr)
+        else:
+            self.set_catalog(catalog)
+            if self.search_var.get().strip():
+                self.load_products()
+        if self.probe is not None:
+            self.probe.mark('catalog_ready')
+            self.after_idle(self.on_close)
+
+    def poll_pricing(self):
+        # scheduled price lists and promotions start and end on their own
+        if pricing.refresh_due(self.read_conn):
+            threading.Thread(target=self.refresh_prices, name='pricing-refresh', daemon=True).start()
+        self.after(PRICING_POLL_MS, self.poll_pricing)
+
+    def poll_snapshot(self):
+        # lanes run for days; keep point-in-time stock a short replay away
+        if inventory.snapshot_due(self.read_conn):
+            threading.Thread(target=self.take_stock_snapshot, name='stock-snapshot', daemon=True).start()
+        self.after(SNAPSHOT_POLL_MS, self.poll_snapshot)
+
+    def refresh_prices(self):
+        try:
+            conn = get_db_conn()
+            try:
+                run_write(conn, pricing.refresh)
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Could not refresh prices: {e}", file=sys.stderr)
+
+    def take_stock_snapshot(self):
+        try:
+            conn = get_db_conn()
+            try:
+                run_write(conn, inventory.take_snapshot)
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Could not take a stock snapshot: {e}", file=sys.stderr)
+
+    def set_catalog(self, catalog):
+        self.catalog = catalog
+        self.catalog_ready = True
+        self.sync_catalog()
+
+    def sync_catalog(self):
+        # the index only answers sku and name; price and stock are read through the product cache,
+        # so sales on other lanes leave it alone and only catalog_changes since its build are applied
+        if not self.catalog_ready:
+            return
+        seq, ids = changes_since(self.read_conn, self.catalog.seq, limit=CATALOG_SYNC_LIMIT)
+        if ids is None:
+            # e.g. a large import on another lane
+            return self.start_catalog_build()
+        rows = self.products.get_many(ids)
+        for pid in ids:
+            if pid in rows:
+                self.catalog.upsert(rows[pid])
+            else:
+                self.catalog.remove(pid)
+        self.catalog.seq = seq
+
+    def catalog_rows(self, rows):
+        found = self.products.get_many([r[0] for r in rows])
+        return [found[r[0]] for r in rows if r[0] in found]
+
+    def refresh_products(self, ids):
+        ids = list(ids)
+        self.products.reload(ids)
+        self.prices.discard(ids)
+        self.alerts.refresh(ids)
+        self.update_low_stock()
+        self.sync_catalog()
+
+    def poll_products(self):
+        if self.products.check():
+            self.sync_catalog()
+            self.load_products()
+        if self.alerts.check():
+            self.update_low_stock()
+        self.after(DATA_VERSION_POLL_MS, self.poll_products)
+
+    def on_journal_applied(self, applied):
+        # runs on the journal writer thread; Tk is only touched from poll_journal
+        receipts = [(r.sale_id, r.sale_time, e['receipt']) for _, e, r in applied if r.ok and e.get('receipt')]
+        if receipts:
+            self.receipt_writer.submit_many(receipts)
+        if applied:
+            self._journal_events.put(applied)
+
+    def on_journal_error(self, exc, batch):
+        print(f"Could not save journaled sale(s) {batch[0][0]}..{batch[-1][0]}: {exc}", file=sys.stderr)
+
+    def poll_journal(self):
+        ids, last = set(), None
+        while True:
+            try:
+                applied = self._journal_events.get_nowait()
+            except queue.Empty:
+                break
+            for _, _, result in applied:
+                ids.update(ln.product_id for ln in result.lines)
+                last = result if result.ok else last
+        if ids:
+            self.refresh_products(ids)
+            self.load_products()
+        if last is not None:
+            self.scan_status.set(f"Saved as receipt no. {last.sale_id}")
+        if self.journal_writer is not None and self.journal_writer.failed is not None:
+            self.scan_status.set(f"Sales are not being saved: {self.journal_writer.failed}")
+        self.after(JOURNAL_POLL_MS, self.poll_journal)
+
+    def update_low_stock(self):
+        n = len(self.alerts)
+        self.low_stock_btn.config(text=f'Low Stock ({n})', fg='#B00020' if n else 'black')
+
+    def lookup_sku(self, sku):
+        if self.catalog_ready:
+            row = self.catalog.lookup_sku(sku)
+            return self.products.get(row[0]) if row else None
+        # matched like the index does, so a scan works the same before and after it has loaded
+        rows = self.products.query(f"{SELECT_PRODUCT} WHERE sku = ? COLLATE NOCASE", (sku.strip(),),
+                                   depends=('sku',))
+        return rows[0] if rows else None
+
+    def search_products(self, q):
+        if self.search.enabled:
+            return self.search.search(q, limit=SEARCH_LIMIT)
+        if self.catalog_ready:
+            return self.catalog_rows(self.catalog.search(q, limit=SEARCH_LIMIT))
+        like = f"%{q}%"
+        return self.products.query(f"{SELECT_PRODUCT} WHERE sku LIKE ? OR name LIKE ? ORDER BY name LIMIT ?",
+                                   (like, like, SEARCH_LIMIT), depends=('sku', 'name'))
+
+    def on_search_changed(self, *args):
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(SEARCH_DEBOUNCE_MS, self.load_products)
+
+    @timed('load_products')
     def load_products(self):
+        self._search_job = None
         q = self.search_var.get().strip()
-        cur = self.conn.cursor()
         if q:
-            cur.execute("SELECT * FROM products WHERE sku LIKE ? OR name LIKE ?", (f'%{q}%', f'%{q}%'))
+            self.product_list.show(ListPager(self.search_products(q)))
+        elif self.product_list.pager is self.product_pager:
+            self.product_list.refresh()
         else:
-            cur.execute("SELECT * FROM products ORDER BY name")
-        rows = cur.fetchall()
-        self.tree.delete(*self.tree.get_children())
-        for r in rows:
-            self.tree.insert('', 'end', values=(r["id"], r["sku"], r["name"], r["price"], r["stock"]))
+            self.product_list.show(self.product_pager)
 
     def on_product_double_click(self, event):
         sel = self.tree.focus()
         if not sel: return
         vals = self.tree.item(sel)['values']
         pid = vals[0]
-        r = self.conn.execute("SELECT * FROM products WHERE id=?", (pid,)).fetchone()
-        prod = Product(r)
+        r = self.products.get(pid)
+        if r is None:
+            self.load_products()
+            return
+        prod = self.priced(r)
 
         qty = simple_qty_dialog(self, f"Enter The Amount {prod.name} (stock {prod.stock}):")
         if qty is None: return
@@ -228,55 +454,101 @@ class CashierApp(tk.Tk):
 
         self.add_to_cart(prod, qty)
 
+    @timed('on_scan')
+    def on_scan(self, event=None):
+        text = self.scan_var.get()
+        self.scan_var.set('')
+        try:
+            qty, sku = parse_scan(text)
+        except ScanError as e:
+            return self.scan_feedback(str(e), ok=False)
+        row = self.lookup_sku(sku)
+        if row is None:
+            return self.scan_feedback(f"Unknown SKU: {sku}", ok=False)
+        item = self.cart.get(row[0])
+        in_cart = item.qty if item else 0
+        if in_cart + qty > row[4]:
+            return self.scan_feedback(f"Not enough stock for {row[2]} (stock {row[4]})", ok=False)
+        self.add_to_cart(item.product if item else self.priced(row), qty)
+        self.scan_feedback(f"{in_cart + qty} x {row[2]}", ok=True)
+        return 'break'
+
+    def scan_feedback(self, message, ok):
+        self.scan_status.set(message)
+        self.scan_label.config(fg='#006400' if ok else '#B00020')
+        if not ok:
+            self.bell()
+        return 'break'
+
+    def display_row(self, row):
+        # the list shows what the till charges, not products.price
+        return row[:3] + (self.prices.get(row[0], row[3])[0],) + tuple(row[4:])
+
+    def priced(self, row):
+        price, deal = self.prices.get(row[0], row[3])
+        return Product(row, price, deal)
+
     def add_to_cart(self, prod, qty):
-        for it in self.cart:
-            if it.product.id == prod.id:
-                it.qty += qty
-                self.refresh_cart_view()
-                return
-        self.cart.append(CartItem(prod, qty))
-        self.refresh_cart_view()
+        self.apply_cart_changes(self.cart.add(prod, qty))
+
+    def cart_row(self, item):
+        return (item.product.sku, item.product.name, item.qty, item.product.price, item.subtotal)
+
+    @timed('apply_cart_changes')
+    def apply_cart_changes(self, changes):
+        for op, pid, item in changes:
+            iid = str(pid)
+            if op == INSERT:
+                values = self.cart_row(item)
+                self.cart_box.insert('', 'end', iid=iid, values=values)
+                self.cart_sizer.add_row(iid, values)
+            elif op == UPDATE:
+                values = self.cart_row(item)
+                self.cart_box.item(iid, values=values)
+                self.cart_sizer.update_row(iid, values)
+            elif op == DELETE:
+                self.cart_box.delete(iid)
+                self.cart_sizer.remove_row(iid)
+            elif op == CLEAR:
+                self.cart_box.delete(*self.cart_box.get_children())
+                self.cart_sizer.clear()
+        self.var_sub.set(self.cart.subtotal)
+        self.calculate_total(update_only=True)
+        self.cart_sizer.apply()
 
+    @timed('refresh_cart_view')
     def refresh_cart_view(self):
         self.cart_box.delete(*self.cart_box.get_children())
-        sub = 0
+        self.cart_sizer.clear()
         for it in self.cart:
-            self.cart_box.insert('', 'end', values=(it.product.sku, it.product.name,
-                                                    it.qty, it.product.price, it.subtotal))
-            sub += it.subtotal
-        self.var_sub.set(sub)
+            iid, values = str(it.product.id), self.cart_row(it)
+            self.cart_box.insert('', 'end', iid=iid, values=values)
+            self.cart_sizer.add_row(iid, values)
+        self.var_sub.set(self.cart.subtotal)
         self.calculate_total(update_only=True)
-        auto_adjust_treeview(self.cart_box)
+        self.cart_sizer.apply()
 
     def remove_cart_item(self):
         sel = self.cart_box.focus()
         if not sel:
             messagebox.showinfo("Info", "Select item to delete.")
             return
-        sku = self.cart_box.item(sel)['values'][0]
-        self.cart = [it for it in self.cart if it.product.sku != sku]
-        self.refresh_cart_view()
+        self.apply_cart_changes(self.cart.remove(int(sel)))
 
     def update_cart_qty(self):
         sel = self.cart_box.focus()
         if not sel:
             messagebox.showinfo("Info", "Select item.")
             return
-        sku = self.cart_box.item(sel)['values'][0]
-        current = next((it for it in self.cart if it.product.sku == sku), None)
+        current = self.cart.get(int(sel))
 
         qty = simple_qty_dialog(self, f"Add new product for {current.product.name}:", default=current.qty)
         if qty is None: return
-        if qty <= 0:
-            self.cart = [it for it in self.cart if it.product.sku != sku]
-        else:
-            current.qty = qty
-        self.refresh_cart_view()
+        self.apply_cart_changes(self.cart.set_qty(current.product.id, qty))
 
     def clear_cart(self):
         if self.cart and messagebox.askyesno("Confirm", "Clear the cart?"):
-            self.cart.clear()
-            self.refresh_cart_view()
+            self.apply_cart_changes(self.cart.clear())
 
     def open_add_product(self):
         ProductDialog(self, mode='add').wait_window()
@@ -291,6 +563,9 @@ class CashierApp(tk.Tk):
         ProductDialog(self, mode='edit', product_id=pid).wait_window()
         self.load_products()
 
+    def open_reports(self):
+        ReportsWindow(self)
+
     def delete_selected_product(self):
         sel = self.tree.focus()
         if not sel:
@@ -299,65 +574,57 @@ class CashierApp(tk.Tk):
         pid = self.tree.item(sel)['values'][0]
         if not messagebox.askyesno("Confirm", "Are you sure you want to delete the product?"):
             return
-        self.conn.execute("DELETE FROM products WHERE id=?", (pid,))
-        self.conn.commit()
+        def delete(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                old = conn.execute("SELECT stock FROM products WHERE id=?", (pid,)).fetchone()
+                if old:
+                    inventory.record(conn.cursor(), [(pid, -old[0], 'adjustment', None)])
+                conn.execute("DELETE FROM products WHERE id=?", (pid,))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        run_write(self.conn, delete)
+        self.refresh_products([pid])
         self.load_products()
 
     def import_products_csv(self):
         path = filedialog.askopenfilename(filetypes=[('CSV Files', '*.csv')])
         if not path: return
-        imported = 0
-        with open(path, newline='', encoding='utf-8') as f:
-            rdr = csv.DictReader(f)
-            for row in rdr:
-                sku = row.get('sku')
-                name = row.get('name')
-                price = int(row.get('price', 0))
-                stock = int(row.get('stock', 0))
-                try:
-                    self.conn.execute(
-                        "INSERT INTO products (sku, name, price, stock) VALUES (?,?,?,?)",
-                        (sku, name, price, stock)
-                    )
-                    imported += 1
-                except sqlite3.IntegrityError:
-                    pass
-        self.conn.commit()
-        messagebox.showinfo("Import", f"Imported successfully {imported} product.")
+        update = messagebox.askyesnocancel(
+            "Import", "Update products whose SKU already exists?\n(No = keep the existing products)")
+        if update is None: return
+        ImportDialog(self, path, 'upsert' if update else 'skip')
+
+    @timed('on_import_finished')
+    def on_import_finished(self):
+        self.products.clear()
+        self.prices.clear()
+        self.sync_catalog()
         self.load_products()
 
     def calculate_total(self, update_only=False):
-        sub = self.var_sub.get()
+        sub = self.cart.subtotal
         try:
             tax = float(self.var_tax.get())
         except:
             tax = 0.0
             self.var_tax.set(0.0)
-        total = sub + int(sub * tax / 100)
+        self.cart.tax_pct = tax
+        total = self.cart.total
         self.var_total.set(total)
 
         if not update_only:
             messagebox.showinfo("Total", f"Subtotal: Rp{sub:,}\nTotal: Rp{total:,}")
 
     def generate_receipt_text(self, sale_time, total, cart_items):
-        lines = []
-        lines.append("      === RECEIPT ===")
-        lines.append("")
-        lines.append(f"Time: {sale_time}")
-        lines.append("-" * 26)
-        lines.append(f"{'Item':15} {'Qty':>3} {'Subtotal':>9}")
-        lines.append("-" * 26)
-        for it in cart_items:
-            name = it.product.name
-            name_display = name[:12] + "..." if len(name) > 15 else name.ljust(15)
-            qty = str(it.qty).rjust(3)
-            subtotal = f"Rp{it.subtotal:,}".rjust(9)
-            lines.append(f"{name_display} {qty} {subtotal}")
-        lines.append("-" * 26)
-        lines.append(f"{'TOTAL':>20} {f'Rp{total:,}':>9}")
-        lines.append("")
-        lines.append("Thank you for your purchase!")
-        return "\n".join(lines)
+        return format_receipt(sale_time, total, ((it.product.name, it.qty, it.subtotal) for it in cart_items))
+
+    def receipt_for(self, result):
+        products = {it.product.id: it.product for it in self.cart}
+        sold = [CartItem(products[ln.product_id], ln.filled) for ln in result.sold]
+        return self.generate_receipt_text(result.sale_time, result.total, sold)
 
     def render_receipt_to_gui(self, receipt_text):
         self.receipt_text.config(state='normal')
@@ -376,38 +643,93 @@ class CashierApp(tk.Tk):
         if not messagebox.askyesno("Checkout", f"Total: Rp{total:,}\nContinue?"):
             return
 
-        cur = self.conn.cursor()
-        now = datetime.now().isoformat(' ', 'seconds')
-        cur.execute("INSERT INTO sales (datetime, total) VALUES (?,?)", (now, total))
-        sale_id = cur.lastrowid
-
-        for it in self.cart:
-            cur.execute(
-                "INSERT INTO sale_items (sale_id, product_id, qty, subtotal) VALUES (?,?,?,?)",
-                (sale_id, it.product.id, it.qty, it.subtotal)
-            )
-            cur.execute("UPDATE products SET stock = stock - ? WHERE id=?", (it.qty, it.product.id))
-
-        self.conn.commit()
-
-        receipt_text = self.generate_receipt_text(now, total, list(self.cart))
+        result = self.commit_cart('reject')
+        if result.shortages:
+            products = {it.product.id: it.product for it in self.cart}
+            short = "\n".join(f"{products[ln.product_id].name}: wanted {ln.requested}, in stock {ln.available}"
+                              for ln in result.shortages)
+            if not messagebox.askyesno("Stock", f"Not enough stock:\n{short}\n\nSell the available quantities?"):
+                self.refresh_products(products)
+                self.load_products()
+                return
+            result = self.commit_cart('partial')
+        if not result.ok:
+            messagebox.showwarning("Stock", "Nothing left in stock to sell.")
+            self.load_products()
+            return
 
-        fname = f"receipt_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        fpath = os.path.join(RECEIPT_DIR, fname)
-        with open(fpath, 'w', encoding='utf-8') as f:
-            f.write(receipt_text + "\n")
+        self.finish_checkout(result)
+        if result.sale_id is None:
+            messagebox.showinfo("Success", "Checkout was successful!")
+        else:
+            messagebox.showinfo("Success", f"Checkout was successful!\nReceipt no. {result.sale_id}")
+
+    @timed('checkout.commit')
+    def commit_cart(self, policy):
+        if self.journal_writer is not None:
+            return self.journal_cart(policy)
+        result = run_write(self.conn, commit_sale, self.cart.lines(), tax_pct=self.cart.tax_pct, policy=policy)
+        self.refresh_products([ln.product_id for ln in result.lines])
+        return result
+
+    def journal_cart(self, policy):
+        # the sale goes to the local journal now and into the database with the next group commit
+        merged = merge_lines(self.cart.lines())
+        if not merged:
+            return plan_sale(merged, {}, self.cart.tax_pct, policy, inventory.now())
+        stock = read_stock(self.read_conn, merged)
+        for pid, qty in self.journal_writer.pending_qty().items():
+            if pid in stock:
+                stock[pid] -= qty
+        result = plan_sale(merged, stock, self.cart.tax_pct, policy, inventory.now())
+        if result.sold and not (policy == 'reject' and result.shortages):
+            result.journal_seq = self.journal_writer.submit(sale_journal.make_entry(result, self.receipt_for(result)))
+        return result
+
+    @timed('checkout.finish')
+    def finish_checkout(self, result):
+        receipt_text = self.receipt_for(result)
+        if result.sale_id is not None:
+            self.receipt_writer.submit(result.sale_id, result.sale_time, receipt_text)
 
         self.render_receipt_to_gui(receipt_text)
 
-        messagebox.showinfo("Success", f"Checkout was successful!\nReceipt saved in:\n{fpath}")
-
-        self.cart.clear()
-        self.refresh_cart_view()
+        self.apply_cart_changes(self.cart.clear())
         self.load_products()
 
-def simple_qty_dialog(parent, prompt, default=1):
+    def reprint_receipt(self):
+        sale_id = simple_qty_dialog(self, "Receipt number:", default='', title="Reprint")
+        if sale_id is None: return
+        try:
+            text = self.receipts.get(sale_id)
+        except CorruptReceipt:
+            text = None
+        if text is None:
+            # lost from or damaged in the receipt journal: render it again from the frozen sale lines
+            rebuilt = [r for chunk in rebuild_receipts(self.read_conn, [sale_id], workers=1) for r in chunk]
+            if not rebuilt:
+                messagebox.showwarning("Reprint", f"Receipt no. {sale_id} was not found.")
+                return
+            self.receipt_writer.submit(*rebuilt[0])
+            text = rebuilt[0][2]
+        self.render_receipt_to_gui(text)
+
+    def on_receipt_error(self, exc, batch):
+        print(f"Could not save receipt(s) {[b[0] for b in batch]}: {exc}", file=sys.stderr)
+
+    def on_close(self):
+        if self.stats_dumper is not None:
+            self.stats_dumper.stop()
+        if self.journal_writer is not None:
+            self.journal_writer.close()
+            self.journal.close()
+        self.receipt_writer.close()
+        self.receipts.close()
+        self.destroy()
+
+def simple_qty_dialog(parent, prompt, default=1, title="Total"):
     d = tk.Toplevel(parent)
-    d.title("Total")
+    d.title(title)
     d.geometry("300x140")
     v = tk.StringVar(value=str(default))
 
@@ -437,32 +759,39 @@ class ProductDialog(tk.Toplevel):
         self.mode = mode
         self.product_id = product_id
         self.title('Add Product' if mode == 'add' else 'Edit Product')
-        self.geometry('360x200')
+        self.geometry('360x230')
 
         tk.Label(self, text='SKU:').place(x=10, y=12)
         tk.Label(self, text='Name:').place(x=10, y=42)
         tk.Label(self, text='Price:').place(x=10, y=72)
         tk.Label(self, text='Stock:').place(x=10, y=102)
+        tk.Label(self, text='Reorder at:').place(x=10, y=132)
 
         self.sku_var = tk.StringVar()
         self.name_var = tk.StringVar()
         self.price_var = tk.StringVar()
         self.stock_var = tk.StringVar(value='0')
+        self.reorder_var = tk.StringVar()
 
         tk.Entry(self, textvariable=self.sku_var).place(x=90, y=12, width=240)
         tk.Entry(self, textvariable=self.name_var).place(x=90, y=42, width=240)
         tk.Entry(self, textvariable=self.price_var).place(x=90, y=72, width=240)
         tk.Entry(self, textvariable=self.stock_var).place(x=90, y=102, width=240)
+        tk.Entry(self, textvariable=self.reorder_var).place(x=90, y=132, width=240)
 
-        tk.Button(self, text='Save', command=self.save).place(x=130, y=150)
+        tk.Button(self, text='Save', command=self.save).place(x=130, y=180)
 
         if mode == 'edit' and product_id:
-            r = self.parent.conn.execute("SELECT * FROM products WHERE id=?", (product_id,)).fetchone()
+            r = self.parent.products.get(product_id)
             if r:
-                self.sku_var.set(r['sku'])
-                self.name_var.set(r['name'])
-                self.price_var.set(str(r['price']))
-                self.stock_var.set(str(r['stock']))
+                _, sku, name, price, stock = r
+                self.sku_var.set(sku)
+                self.name_var.set(name)
+                self.price_var.set(str(price))
+                self.stock_var.set(str(stock))
+                level = self.parent.products.reorder_level(product_id)
+                if level is not None:
+                    self.reorder_var.set(str(level))
 
     def save(self):
         sku = self.sku_var.get().strip()
@@ -470,31 +799,365 @@ class ProductDialog(tk.Toplevel):
         try:
             price = int(self.price_var.get())
             stock = int(self.stock_var.get())
+            level = int(self.reorder_var.get()) if self.reorder_var.get().strip() else None
         except:
-            messagebox.showerror("Error", "Price and stock must be numbers.")
+            messagebox.showerror("Error", "Price, stock and reorder level must be numbers.")
             return
         if not sku or not name:
             messagebox.showerror("Error", "All field must be filled in.")
             return
 
-        cur = self.parent.conn.cursor()
-        if self.mode == 'add':
+        def write(conn):
+            conn.execute('BEGIN IMMEDIATE')
             try:
-                cur.execute("INSERT INTO products (sku,name,price,stock) VALUES (?,?,?,?)",
-                            (sku, name, price, stock))
-                self.parent.conn.commit()
-                messagebox.showinfo("OK", "The product has been successfully saved.")
-                self.destroy()
-            except sqlite3.IntegrityError:
-                messagebox.showerror("Error", "SKU already used.")
+                if self.mode == 'add':
+                    cur = conn.execute("INSERT INTO products (sku,name,price,stock,reorder_level) VALUES (?,?,?,?,?)",
+                                       (sku, name, price, stock, level))
+                    pid, delta = cur.lastrowid, stock
+                else:
+                    pid = self.product_id
+                    old = conn.execute("SELECT stock FROM products WHERE id=?", (pid,)).fetchone()
+                    conn.execute("UPDATE products SET sku=?,name=?,price=?,stock=?,reorder_level=? WHERE id=?",
+                                 (sku, name, price, stock, level, pid))
+                    delta = stock - old[0] if old else 0
+                inventory.record(conn.cursor(), [(pid, delta, 'restock' if delta > 0 else 'adjustment', None)])
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            return pid
+
+        try:
+            pid = run_write(self.parent.conn, write)
+        except sqlite3.IntegrityError:
+            messagebox.showerror("Error", "SKU already used.")
+            return
+        self.parent.refresh_products([pid])
+        if self.mode == 'add':
+            messagebox.showinfo("OK", "The product has been successfully saved.")
         else:
-            cur.execute("UPDATE products SET sku=?,name=?,price=?,stock=? WHERE id=?",
-                        (sku, name, price, stock, self.product_id))
-            self.parent.conn.commit()
             messagebox.showinfo("OK", "The product has been successfully updated.")
+        self.destroy()
+
+class ImportDialog(tk.Toplevel):
+    def __init__(self, parent, path, mode):
+        super().__init__(parent)
+        self.parent = parent
+        self.title('Import CSV')
+        self.geometry('360x140')
+        self.resizable(False, False)
+        self.transient(parent)
+
+        self.status_var = tk.StringVar(value=f"Importing {os.path.basename(path)}...")
+        tk.Label(self, textvariable=self.status_var, wraplength=330).pack(pady=(12, 6))
+        self.bar = ttk.Progressbar(self, length=320, maximum=1.0)
+        self.bar.pack(pady=6)
+        self.cancel_btn = tk.Button(self, text='Cancel', command=self.cancel)
+        self.cancel_btn.pack(pady=6)
+        self.protocol('WM_DELETE_WINDOW', self.cancel)
+
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+        threading.Thread(target=self.run, args=(path, mode), daemon=True).start()
+        self.after(100, self.poll)
+
+    def run(self, path, mode):
+        conn = get_db_conn()
+        try:
+            result = import_csv(conn, path, mode=mode,
+                                progress=lambda r: self.events.put(('progress', r.fraction, r.rows)),
+                                cancel=self.cancelled)
+            self.events.put(('done', result))
+        except ImportCancelled:
+            self.events.put(('cancelled',))
+        except Exception as e:
+            self.events.put(('error', e))
+        finally:
+            conn.close()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.cancel_btn.config(state='disabled')
+        self.status_var.set("Cancelling...")
+
+    def poll(self):
+        try:
+            while True:
+                ev = self.events.get_nowait()
+                if ev[0] == 'progress':
+                    self.bar['value'] = ev[1]
+                    self.status_var.set(f"{ev[2]:,} rows processed")
+                else:
+                    self.finish(ev)
+                    return
+        except queue.Empty:
+            pass
+        self.after(100, self.poll)
+
+    def finish(self, ev):
+        self.destroy()
+        if ev[0] == 'done':
+            result = ev[1]
+            self.parent.on_import_finished()
+            msg = (f"Imported successfully {result.written} product.\n"
+                   f"Unchanged: {result.skipped}, errors: {len(result.errors)}")
+            if result.errors:
+                msg += "\n\n" + "\n".join(f"line {line or '?'}: {err}" for line, err in result.errors[:10])
+            messagebox.showinfo("Import", msg)
+        elif ev[0] == 'cancelled':
+            messagebox.showinfo("Import", "Import cancelled, no product was changed.")
+        else:
+            messagebox.showerror("Import", f"Import failed: {ev[1]}")
+
+class ExportDialog(tk.Toplevel):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title('Export')
+        self.geometry('380x200')
+        self.resizable(False, False)
+        self.transient(parent)
+
+        self.dir_var = tk.StringVar(value=EXPORT_DIR)
+        self.format_var = tk.StringVar(value='csv')
+        self.gzip_var = tk.BooleanVar(value=True)
+        self.full_var = tk.BooleanVar(value=False)
+        row = tk.Frame(self)
+        row.pack(fill='x', padx=10, pady=(10, 4))
+        tk.Entry(row, textvariable=self.dir_var).pack(side='left', fill='x', expand=True)
+        tk.Button(row, text='...', command=self.choose_dir).pack(side='left', padx=4)
+        opts = tk.Frame(self)
+        opts.pack(fill='x', padx=10)
+        for fmt in EXPORT_FORMATS:
+            tk.Radiobutton(opts, text=fmt.upper(), value=fmt, variable=self.format_var).pack(side='left')
+        tk.Checkbutton(opts, text='gzip', variable=self.gzip_var).pack(side='left', padx=6)
+        tk.Checkbutton(opts, text='Everything (ignore last export)', variable=self.full_var).pack(side='left')
+
+        self.status_var = tk.StringVar(value="Only sales newer than the last export are written.")
+        tk.Label(self, textvariable=self.status_var, wraplength=350).pack(pady=6)
+        self.bar = ttk.Progressbar(self, length=340, mode='indeterminate')
+        self.bar.pack(pady=4)
+        self.button = tk.Button(self, text='Start', command=self.start)
+        self.button.pack(pady=6)
+        self.protocol('WM_DELETE_WINDOW', self.cancel)
+
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+        self.running = False
+
+    def choose_dir(self):
+        path = filedialog.askdirectory(initialdir=self.dir_var.get(), parent=self)
+        if path:
+            self.dir_var.set(path)
+
+    def start(self):
+        self.running = True
+        self.button.config(text='Cancel', command=self.cancel)
+        self.bar.start(50)
+        args = (self.dir_var.get(), self.format_var.get(), self.gzip_var.get(), self.full_var.get())
+        threading.Thread(target=self.run, args=args, daemon=True).start()
+        self.after(100, self.poll)
+
+    def run(self, out_dir, fmt, compress, full):
+        conn = get_db_conn(readonly=True)
+        try:
+            result = run_export(conn, out_dir, fmt=fmt, compress=compress, full=full,
+                                progress=lambda r: self.events.put(('progress', r.total_rows)),
+                                cancel=self.cancelled)
+            self.events.put(('done', result))
+        except ExportCancelled:
+            self.events.put(('cancelled',))
+        except Exception as e:
+            self.events.put(('error', e))
+        finally:
+            conn.close()
+
+    def cancel(self):
+        if not self.running:
             self.destroy()
+            return
+        self.cancelled.set()
+        self.button.config(state='disabled')
+        self.status_var.set("Cancelling...")
+
+    def poll(self):
+        try:
+            while True:
+                ev = self.events.get_nowait()
+                if ev[0] == 'progress':
+                    self.status_var.set(f"{ev[1]:,} rows written")
+                else:
+                    self.finish(ev)
+                    return
+        except queue.Empty:
+            pass
+        self.after(100, self.poll)
+
+    def finish(self, ev):
+        self.destroy()
+        if ev[0] == 'done':
+            result = ev[1]
+            files = "\n".join(os.path.basename(f) for f in result.files)
+            messagebox.showinfo("Export", f"Exported {result.total_rows:,} rows "
+                                          f"up to sale no. {result.last_sale_id}.\n\n{files}")
+        elif ev[0] == 'cancelled':
+            messagebox.showinfo("Export", "Export cancelled, nothing was written.")
+        else:
+            messagebox.showerror("Export", f"Export failed: {ev[1]}")
+
+class ReportsWindow(tk.Toplevel):
+    TABLES = {
+        'Daily': ('day', 'sales_count', 'items', 'revenue'),
+        'Top Products': ('sku', 'name', 'units', 'revenue'),
+        'Hourly': ('hour', 'baskets', 'items', 'avg_items', 'revenue'),
+        'Shrinkage': ('sku', 'name', 'opening', 'received', 'sold', 'lost', 'found', 'closing', 'loss_value'),
+    }
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.parent = parent
+        self.title('Reports')
+        self.geometry('900x420')
+
+        start, end = reports.default_range()
+        self.start_var = tk.StringVar(value=start)
+        self.end_var = tk.StringVar(value=end)
+        top = tk.Frame(self)
+        top.pack(fill='x', padx=10, pady=8)
+        tk.Label(top, text='From:').pack(side='left')
+        tk.Entry(top, textvariable=self.start_var, width=12).pack(side='left', padx=4)
+        tk.Label(top, text='To:').pack(side='left')
+        tk.Entry(top, textvariable=self.end_var, width=12).pack(side='left', padx=4)
+        tk.Button(top, text='Show', command=self.refresh).pack(side='left', padx=6)
+        tk.Button(top, text='Export...', command=lambda: ExportDialog(self)).pack(side='right')
+
+        notebook = ttk.Notebook(self)
+        notebook.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+        self.trees = {}
+        for title, cols in self.TABLES.items():
+            tree = ttk.Treeview(notebook, columns=cols, show='headings')
+            for c in cols:
+                tree.heading(c, text=c.replace('_', ' ').title())
+                tree.column(c, width=100)
+            notebook.add(tree, text=title)
+            self.trees[title] = tree
+        self.refresh()
+
+    def refresh(self):
+        start, end = self.start_var.get().strip(), self.end_var.get().strip()
+        conn = self.parent.read_conn
+        data = {
+            'Daily': reports.daily_report(conn, start, end),
+            'Top Products': reports.top_products(conn, start, end),
+            'Hourly': reports.hourly_report(conn, start, end),
+            'Shrinkage': inventory.shrinkage_report(conn, start, end),
+        }
+        for title, rows in data.items():
+            tree = self.trees[title]
+            tree.delete(*tree.get_children())
+            cols = self.TABLES[title]
+            for r in rows:
+                values = [r[c] for c in cols]
+                if 'avg_items' in cols:
+                    values[cols.index('avg_items')] = f"{r['avg_items']:.1f}"
+                tree.insert('', 'end', values=values)
+
+class LowStockWindow(tk.Toplevel):
+    COLUMNS = ('sku', 'name', 'stock', 'reorder_level', 'since')
+    LIMIT = 200
+    REFRESH_MS = 2000
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.parent = parent
+        self.title('Low Stock')
+        self.geometry('640x420')
+
+        self.summary = tk.StringVar()
+        tk.Label(self, textvariable=self.summary, anchor='w').pack(fill='x', padx=10, pady=8)
+        frame = tk.Frame(self)
+        frame.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+        self.tree = ttk.Treeview(frame, columns=self.COLUMNS, show='headings')
+        for c in self.COLUMNS:
+            self.tree.heading(c, text=c.replace('_', ' ').title())
+            self.tree.column(c, width=80)
+        self.tree.column('name', width=220)
+        self.tree.column('since', width=140)
+        self.tree.tag_configure('out', foreground='#B00020')
+        vsb = ttk.Scrollbar(frame, orient='vertical', command=self.tree.yview)
+        vsb.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.tree['yscrollcommand'] = vsb.set
+        self.refresh()
+
+    def refresh(self):
+        if not self.winfo_exists():
+            return
+        alerts = self.parent.alerts
+        if alerts.check():
+            self.parent.update_low_stock()
+        rows = alerts.top(self.LIMIT)
+        self.summary.set(f"{len(alerts)} product(s) at or below their reorder level, most urgent first")
+        self.tree.delete(*self.tree.get_children())
+        for pid, sku, name, stock, level, _, since in rows:
+            self.tree.insert('', 'end', values=(sku, name, stock, level, since), tags=('out',) if stock <= 0 else ())
+        self.after(self.REFRESH_MS, self.refresh)
 
-def create_opening_window_and_start():
+class DiagnosticsWindow(tk.Toplevel):
+    COLUMNS = ('category', 'name', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+    REFRESH_MS = 2000
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title('Diagnostics')
+        self.geometry('900x420')
+
+        top = tk.Frame(self)
+        top.pack(fill='x', padx=10, pady=8)
+        self.enabled_var = tk.BooleanVar(value=instrument.enabled())
+        tk.Checkbutton(top, text='Collect timings', variable=self.enabled_var,
+                       command=lambda: instrument.enable(self.enabled_var.get())).pack(side='left')
+        tk.Button(top, text='Reset', command=self.reset).pack(side='left', padx=6)
+        tk.Button(top, text='Save JSON', command=self.save).pack(side='left', padx=6)
+        tk.Label(top, text='SQL timings need CASHIER_INSTRUMENT=1 or --instrument at start-up.').pack(side='left', padx=6)
+
+        frame = tk.Frame(self)
+        frame.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+        self.tree = ttk.Treeview(frame, columns=self.COLUMNS, show='headings')
+        for c in self.COLUMNS:
+            self.tree.heading(c, text=c)
+            self.tree.column(c, width=70, anchor='e')
+        self.tree.column('category', width=70, anchor='w')
+        self.tree.column('name', width=360, anchor='w')
+        vsb = ttk.Scrollbar(frame, orient='vertical', command=self.tree.yview)
+        vsb.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.tree['yscrollcommand'] = vsb.set
+        self.refresh()
+
+    def refresh(self):
+        if not self.winfo_exists():
+            return
+        self.tree.delete(*self.tree.get_children())
+        rows = []
+        for category, stats in instrument.COLLECTOR.snapshot()['stats'].items():
+            for name, d in stats.items():
+                rows.append((category, name) + tuple(d[c] for c in self.COLUMNS[2:]))
+        rows.sort(key=lambda r: -r[2] * r[3])
+        for r in rows:
+            self.tree.insert('', 'end', values=r)
+        self.after(self.REFRESH_MS, self.refresh)
+
+    def reset(self):
+        instrument.COLLECTOR.reset()
+        self.tree.delete(*self.tree.get_children())
+
+    def save(self):
+        path = filedialog.asksaveasfilename(defaultextension='.json', initialfile='stats.json',
+                                            filetypes=[('JSON Files', '*.json')])
+        if path:
+            instrument.dump(path)
+
+def create_opening_window_and_start(conn=None, probe=None):
     opener = tk.Tk()
     opener.title("Welcome - Fun Mart")
     opener.geometry("520x300")
@@ -514,7 +1177,10 @@ def create_opening_window_and_start():
 
     def start_app():
         opener.destroy()
-        app = CashierApp()
+        try:
+            app = CashierApp(conn=conn, probe=probe)
+        except sale_journal.JournalInUse:
+            return
         app.mainloop()
 
     start_btn = tk.Button(btns_frame, text="Start", font=('Helvetica', 14), width=12, command=start_app)
@@ -535,7 +1201,8 @@ def create_opening_window_and_start():
         "How to use the application:\n"
         "1. Click 'Start' to enter the application.\n"
         "2. Seaarch products through the search field.\n"
-        "3. Double-click product to add to cart, then enter the quantity.\n"
+        "3. Double-click product to add to cart, then enter the quantity,\n"
+        "   or scan a barcode into the Scan field (F2). Type 3*SKU to add 3 at once.\n"
         "4. Manage the contents of the cart (Update/Delete/Clear).\n"
         "5. Click 'Grand Total' to see the subtotal(Price before tax) and total(Price after tax).\n"
         "6. Click 'Checkout' to save the transaction and print the receipt.\n"
@@ -558,12 +1225,393 @@ def create_opening_window_and_start():
 
     tutorial_btn.config(command=open_tutorial)
 
+    if probe is not None:
+        opener.update()
+        probe.mark('opener_shown')
+        start_app()
+        return
     opener.mainloop()
 
-def main():
-    init_db()
-    seed_sample_products()
-    create_opening_window_and_start()
+def cli_import_csv(args):
+    conn = get_db_conn()
+    def progress(r):
+        print(f"\r{r.fraction:6.1%}  {r.rows:,} rows", end='', file=sys.stderr, flush=True)
+    try:
+        result = import_csv(conn, args.path, mode=args.mode, chunk_size=args.chunk_size, progress=progress)
+    finally:
+        conn.close()
+    print(file=sys.stderr)
+    for line, err in result.errors:
+        print(f"line {line or '?'}: {err}", file=sys.stderr)
+    print(f"rows={result.rows} written={result.written} unchanged={result.skipped} errors={len(result.errors)}")
+    return 1 if result.errors else 0
+
+def cli_report(args):
+    if args.kind == 'rebuild':
+        conn = get_db_conn()
+        days = reports.rebuild(conn)
+        conn.close()
+        print(f"Rebuilt summaries for {days} day(s).")
+        return 0
+    start, end = reports.default_range(args.days)
+    start, end = args.start or start, args.end or end
+    conn = get_db_conn(readonly=True)
+    if args.kind == 'daily':
+        rows = reports.daily_report(conn, start, end)
+    elif args.kind == 'top':
+        rows = reports.top_products(conn, start, end, args.limit)
+    else:
+        rows = reports.hourly_report(conn, start, end)
+    conn.close()
+    if rows:
+        print('\t'.join(rows[0].keys()))
+    for r in rows:
+        print('\t'.join(f"{v:.1f}" if isinstance(v, float) else str(v) for v in r))
+    return 0
+
+def cli_receipts(args):
+    store = ReceiptStore(RECEIPT_JOURNAL_DIR)
+    try:
+        if args.action == 'show':
+            for sale_id in args.ids:
+                try:
+                    text = store.get(sale_id)
+                except CorruptReceipt as e:
+                    print(f"Receipt no. {sale_id}: {e}. Run 'receipts rebuild' to write it again.", file=sys.stderr)
+                    return 1
+                if text is None:
+                    print(f"Receipt no. {sale_id} not found.", file=sys.stderr)
+                    return 1
+                print(text + "\n")
+        elif args.action == 'list':
+            start, end = reports.default_range(args.days)
+            start, end = args.start or start, args.end or end
+            for sale_id, sale_time in store.find(start, end + '~'):
+                print(f"{sale_id}\t{sale_time}")
+        elif args.action == 'migrate':
+            conn = get_db_conn(readonly=True)
+            migrated, unmatched = migrate_text_receipts(store, conn, RECEIPT_DIR, delete=args.delete)
+            conn.close()
+            print(f"Migrated {migrated} receipt(s).")
+            for path in unmatched:
+                print(f"No matching sale for {path}", file=sys.stderr)
+        elif args.action == 'rebuild':
+            conn = get_db_conn(readonly=True)
+            try:
+                ids = args.ids
+                if not ids:
+                    start, end = reports.default_range(args.days)
+                    ids = sale_ids(conn, args.start or start, (args.end or end) + '~')
+                if not (args.print or args.replace):
+                    ids = [i for i in ids if i not in store]
+                done = 0
+                for chunk in rebuild_receipts(conn, ids, workers=args.workers):
+                    if args.print:
+                        for _, _, text in chunk:
+                            print(text + "\n")
+                    else:
+                        store.append_many(chunk)
+                    done += len(chunk)
+            finally:
+                conn.close()
+            print(f"Rebuilt {done} receipt(s).", file=sys.stderr)
+        elif args.action == 'reindex':
+            conn = get_db_conn(readonly=True)
+            times = dict(conn.execute("SELECT id, datetime FROM sales"))
+            conn.close()
+            print(f"Indexed {store.reindex(times)} receipt(s).")
+    finally:
+        store.close()
+    return 0
+
+def cli_stock(args):
+    if args.action == 'snapshot':
+        conn = get_db_conn()
+        snapshot_id = run_write(conn, inventory.take_snapshot)
+        conn.close()
+        print(f"Took stock snapshot {snapshot_id}.")
+        return 0
+    conn = get_db_conn(readonly=True)
+    try:
+        if args.action == 'at':
+            at = inventory.end_of_day(args.at or inventory.now())
+            ids = None
+            if args.sku:
+                ids = [r[0] for r in conn.execute(
+                    f"SELECT id FROM products WHERE sku IN ({','.join('?' * len(args.sku))})", args.sku)]
+            rows = inventory.stock_at(conn, at, ids)
+            if rows is None:
+                print(f"No stock history before {at}.", file=sys.stderr)
+                return 1
+            cols = ('sku', 'name', 'stock')
+        elif args.action == 'shrinkage':
+            start, end = reports.default_range(args.days)
+            rows = inventory.shrinkage_report(conn, args.start or start, args.end or end)
+            cols = ReportsWindow.TABLES['Shrinkage']
+        else:
+            rows = inventory.verify(conn)
+            if rows:
+                print(f"{len(rows)} product(s) do not match the stock ledger:", file=sys.stderr)
+            cols = ('sku', 'name', 'stock', 'ledger')
+    finally:
+        conn.close()
+    print('\t'.join(cols))
+    for r in rows or ():
+        print('\t'.join(str(r[c]) for c in cols))
+    return 1 if args.action == 'verify' and rows else 0
+
+def cli_export(args):
+    conn = get_db_conn(readonly=True)
+    try:
+        result = run_export(conn, args.out, fmt=args.format, compress=args.gzip, full=args.full,
+                            tables=args.tables or tuple(EXPORT_TABLES))
+    finally:
+        conn.close()
+    for path in result.files:
+        print(path)
+    print(f"rows={result.total_rows} last_sale_id={result.last_sale_id}", file=sys.stderr)
+    return 0
+
+def cli_journal(args):
+    try:
+        journal = sale_journal.SaleJournal(JOURNAL_DIR)
+    except sale_journal.JournalInUse as e:
+        print(e, file=sys.stderr)
+        return 1
+    conn = get_db_conn()
+    try:
+        if args.action == 'replay':
+            applied = sale_journal.replay(conn, journal)
+            receipts = [(r.sale_id, r.sale_time, e['receipt']) for _, e, r in applied if r.ok and e.get('receipt')]
+            if receipts:
+                store = ReceiptStore(RECEIPT_JOURNAL_DIR)
+                store.append_many(receipts)
+                store.close()
+            print(f"Applied {len(applied)} journaled sale(s).")
+            return 0
+        done = sale_journal.applied_seq(conn, journal.journal_id)
+        print(json.dumps({'journal_id': journal.journal_id, 'mode': sale_journal.MODE, 'last_seq': journal.seq,
+                          'applied_seq': done, 'pending': len(journal.entries_after(done))}, indent=2))
+        return 0
+    finally:
+        conn.close()
+        journal.close()
+
+def cli_pricing(args):
+    scope = next(((s, getattr(args, s)) for s in pricing.SCOPES if getattr(args, s, None)), (None, None))
+    kind = next(((k, getattr(args, k)) for k in pricing.KINDS if getattr(args, k, None) is not None), (None, None))
+    ends = inventory.end_of_day(args.end) if getattr(args, 'end', None) else None
+    conn = get_db_conn()
+    try:
+        if args.action == 'rule':
+            rule_id = run_write(conn, pricing.add_rule, *scope, *kind, args.start, ends, args.priority, args.name)
+            print(f"Added price rule {rule_id}.")
+        elif args.action == 'promo':
+            promo_id = run_write(conn, pricing.add_promotion, *scope, args.buy, args.pay, args.bundle_price,
+                                 args.start, ends, args.priority, args.name)
+            print(f"Added promotion {promo_id}.")
+        elif args.action == 'reprice':
+            changed = run_write(conn, pricing.reprice, *scope, *kind)
+            print(f"Repriced {changed} product(s).")
+        elif args.action == 'remove':
+            table = 'price_rules' if args.what == 'rule' else 'promotions'
+            if not run_write(conn, pricing.remove, table, args.id):
+                print(f"No {args.what} {args.id}.", file=sys.stderr)
+                return 1
+        elif args.action == 'refresh':
+            print(f"{run_write(conn, pricing.refresh)} product(s) have a rule or promotion.")
+        else:
+            for title, rows in (('Price rules', pricing.list_rules(conn)), ('Promotions', pricing.list_promotions(conn))):
+                print(title)
+                for r in rows:
+                    print('\t'.join('' if v is None else str(v) for v in r))
+    except (ValueError, sqlite3.IntegrityError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        conn.close()
+    return 0
+
+def cli_reorder(args):
+    if args.action == 'report':
+        conn = get_db_conn(readonly=True)
+        try:
+            rows = reorder.report(conn, args.limit)
+        finally:
+            conn.close()
+        cols = ('sku', 'name', 'stock', 'reorder_level', 'since')
+        print('\t'.join(cols))
+        for r in rows:
+            print('\t'.join(str(r[c]) for c in cols))
+        return 0
+    conn = get_db_conn()
+    try:
+        if args.action == 'set':
+            if args.level is None:
+                print("Error: reorder set needs --level", file=sys.stderr)
+                return 2
+            level = None if args.level < 0 else args.level
+            try:
+                changed = run_write(conn, reorder.set_level, level, args.sku, args.prefix, args.category)
+            except ValueError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                return 2
+            print(f"Set the reorder level of {changed} product(s).")
+        else:
+            def rebuild(c):
+                c.execute('BEGIN IMMEDIATE')
+                try:
+                    n = reorder.rebuild(c.cursor())
+                    c.commit()
+                except BaseException:
+                    c.rollback()
+                    raise
+                return n
+            print(f"{run_write(conn, rebuild)} product(s) at or below their reorder level.")
+    finally:
+        conn.close()
+    return 0
+
+def cli_serve(args):
+    import price_service
+    return price_service.serve(DB_PATH, args.host, args.port, args.pool, args.verbose)
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='Minimarket Cashier System')
+    parser.add_argument('--instrument', action='store_true',
+                        help=f'record SQL and UI timings and dump them to {os.path.basename(STATS_FILE)}')
+    parser.add_argument('--startup-time', action='store_true',
+                        help='start the GUI without waiting for input, print start-up timings and exit')
+    parser.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS,
+                        help='with --startup-time, exit 1 if the main window takes longer than this to appear')
+    sub = parser.add_subparsers(dest='command')
+
+    p = sub.add_parser('import-csv', help='import products from a CSV file')
+    p.add_argument('path')
+    p.add_argument('--mode', choices=IMPORT_MODES, default='upsert',
+                   help='what to do with rows whose SKU already exists')
+    p.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    p.set_defaults(func=cli_import_csv)
+
+    p = sub.add_parser('report', help='sales reports from the summary tables')
+    p.add_argument('kind', choices=('daily', 'top', 'hourly', 'rebuild'))
+    p.add_argument('--from', dest='start', help='first day, YYYY-MM-DD')
+    p.add_argument('--to', dest='end', help='last day, YYYY-MM-DD')
+    p.add_argument('--days', type=int, default=7, help='number of days when --from is not given')
+    p.add_argument('--limit', type=int, default=20)
+    p.set_defaults(func=cli_report)
+
+    p = sub.add_parser('receipts', help='look up, rebuild or migrate receipts')
+    p.add_argument('action', choices=('show', 'list', 'migrate', 'reindex', 'rebuild'))
+    p.add_argument('ids', nargs='*', type=int, help='sale ids for show and rebuild')
+    p.add_argument('--from', dest='start', help='first day for list and rebuild, YYYY-MM-DD')
+    p.add_argument('--to', dest='end', help='last day for list and rebuild, YYYY-MM-DD')
+    p.add_argument('--days', type=int, default=1)
+    p.add_argument('--delete', action='store_true', help='delete .txt files once migrated')
+    p.add_argument('--print', action='store_true', help='rebuild: print the receipts instead of storing them')
+    p.add_argument('--replace', action='store_true', help='rebuild: also re-store receipts already in the journal')
+    p.add_argument('--workers', type=int, help='rebuild: render processes (default: one per CPU)')
+    p.set_defaults(func=cli_receipts)
+
+    p = sub.add_parser('stock', help='point-in-time stock, shrinkage and stock snapshots')
+    p.add_argument('action', choices=('at', 'shrinkage', 'snapshot', 'verify'))
+    p.add_argument('--at', help='date or time for "at", YYYY-MM-DD [HH:MM:SS], default now')
+    p.add_argument('--sku', nargs='*', help='only these products')
+    p.add_argument('--from', dest='start', help='first day for shrinkage, YYYY-MM-DD')
+    p.add_argument('--to', dest='end', help='last day for shrinkage, YYYY-MM-DD')
+    p.add_argument('--days', type=int, default=30)
+    p.set_defaults(func=cli_stock)
+
+    p = sub.add_parser('export', help='export new sales and the product list to CSV or JSON Lines')
+    p.add_argument('--out', default=EXPORT_DIR, help='output directory, also holds the export watermark')
+    p.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    p.add_argument('--gzip', action='store_true')
+    p.add_argument('--full', action='store_true', help='export all sales, not only those since the last export')
+    p.add_argument('--tables', nargs='*', choices=tuple(EXPORT_TABLES))
+    p.set_defaults(func=cli_export)
+
+    p = sub.add_parser('pricing', help='price rules, scheduled price lists, multi-buy promotions and bulk repricing')
+    psub = p.add_subparsers(dest='action', required=True)
+
+    def add_scope(q):
+        g = q.add_mutually_exclusive_group(required=True)
+        g.add_argument('--prefix', help='SKU prefix, e.g. A01')
+        g.add_argument('--category')
+        g.add_argument('--sku')
+
+    def add_kind(q):
+        g = q.add_mutually_exclusive_group(required=True)
+        g.add_argument('--percent', type=float, help='markup in percent, negative for a discount')
+        g.add_argument('--amount', type=int, help='added to the price, negative for a discount')
+        g.add_argument('--fixed', type=int, help='replaces the price')
+
+    def add_schedule(q):
+        q.add_argument('--from', dest='start', help='YYYY-MM-DD[ HH:MM:SS]')
+        q.add_argument('--to', dest='end', help='last day, YYYY-MM-DD[ HH:MM:SS]')
+        q.add_argument('--priority', type=int, default=0)
+        q.add_argument('--name')
+
+    q = psub.add_parser('rule', help='add a markup or discount, optionally only for a period')
+    add_scope(q)
+    add_kind(q)
+    add_schedule(q)
+    q = psub.add_parser('promo', help='add a multi-buy promotion: --buy 3 --pay 2 or --buy 3 --bundle-price 10000')
+    add_scope(q)
+    q.add_argument('--buy', type=int, required=True)
+    g = q.add_mutually_exclusive_group(required=True)
+    g.add_argument('--pay', type=int)
+    g.add_argument('--bundle-price', type=int)
+    add_schedule(q)
+    q = psub.add_parser('reprice', help='change the base price of every matching product at once')
+    add_scope(q)
+    add_kind(q)
+    q = psub.add_parser('remove')
+    q.add_argument('what', choices=('rule', 'promo'))
+    q.add_argument('id', type=int)
+    psub.add_parser('refresh', help='recompute effective prices now')
+    psub.add_parser('list')
+    p.set_defaults(func=cli_pricing)
+
+    p = sub.add_parser('reorder', help='low-stock report and per-product reorder levels')
+    p.add_argument('action', choices=('report', 'set', 'rebuild'))
+    p.add_argument('--limit', type=int, default=50, help='report: most urgent N products (0 for all)')
+    p.add_argument('--level', type=int, help='set: alert when stock is at or below this, -1 to switch off')
+    p.add_argument('--sku', nargs='+')
+    p.add_argument('--prefix', help='set: every SKU starting with this')
+    p.add_argument('--category')
+    p.set_defaults(func=cli_reorder)
+
+    p = sub.add_parser('journal', help='show or replay the write-behind sale journal')
+    p.add_argument('action', choices=('status', 'replay'))
+    p.set_defaults(func=cli_journal)
+
+    p = sub.add_parser('serve', help='run the HTTP/JSON price and stock lookup service')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8765)
+    p.add_argument('--pool', type=int, default=8, help='read-only database connections')
+    p.add_argument('--verbose', action='store_true', help='log every request')
+    p.set_defaults(func=cli_serve)
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.instrument:
+        instrument.enable()
+    probe = StartupProbe(args.budget_ms) if args.startup_time else None
+    if args.command:
+        init_db()
+        try:
+            return args.func(args)
+        finally:
+            if instrument.enabled():
+                instrument.dump(STATS_FILE)
+    conn = get_db_conn()
+    init_db(conn)
+    if probe is not None:
+        probe.mark('migrated')
+    create_opening_window_and_start(conn, probe)
+    if probe is not None:
+        return probe.report()
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import inventory
+import reports
+import product_search
+import sale_journal
+import pricing
+import reorder
+import catalog_index
+
+SAMPLE_PRODUCTS = [
+    ('E026', 'Mizone', 3000, 20),
+    ('E027', 'Bubble Gum', 4000, 15),
+    ('E028', 'Sunpride Banana', 5000, 10),
+    ('B051', 'Crackers', 12000, 30),
+    ('C076', 'Ketchup', 12000, 25),
+]
+
+
+def m001_base_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sku TEXT UNIQUE,
+            name TEXT NOT NULL,
+            price INTEGER NOT NULL,
+            stock INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            datetime TEXT NOT NULL,
+            total INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sale_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sale_id INTEGER,
+            product_id INTEGER,
+            qty INTEGER,
+            subtotal INTEGER,
+            FOREIGN KEY(sale_id) REFERENCES sales(id),
+            FOREIGN KEY(product_id) REFERENCES products(id)
+        )
+    ''')
+
+
+def m002_seed_sample_products(conn):
+    conn.executemany('INSERT OR IGNORE INTO products (sku,name,price,stock) VALUES (?,?,?,?)', SAMPLE_PRODUCTS)
+
+
+def m003_product_sort_indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_name ON products(name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_price ON products(price)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_stock ON products(stock)')
+
+
+def m004_report_rollups(conn):
+    reports.ensure_schema(conn)
+    # databases from before the rollups existed already have sales to summarize
+    reports.fill_summaries(conn)
+
+
+def m005_product_search(conn):
+    columns = [r[1] for r in conn.execute('PRAGMA table_info(products)')]
+    if 'category' not in columns:
+        conn.execute('ALTER TABLE products ADD COLUMN category TEXT')
+    # silently skipped when this SQLite has no FTS5, search then uses CatalogIndex
+    product_search.ensure_schema(conn)
+
+
+def m006_stock_ledger(conn):
+    inventory.ensure_schema(conn)
+    # the baseline that point-in-time stock is counted from
+    if conn.execute('SELECT 1 FROM stock_snapshots LIMIT 1').fetchone() is None:
+        inventory.write_snapshot(conn.cursor())
+
+
+def m007_sale_journal(conn):
+    sale_journal.ensure_schema(conn)
+
+
+def m008_pricing(conn):
+    pricing.ensure_schema(conn)
+    pricing.fill(conn.cursor())
+
+
+def m009_reorder_alerts(conn):
+    columns = [r[1] for r in conn.execute('PRAGMA table_info(products)')]
+    if 'reorder_level' not in columns:
+        conn.execute('ALTER TABLE products ADD COLUMN reorder_level INTEGER')
+    reorder.ensure_schema(conn)
+    reorder.rebuild(conn.cursor())
+
+
+def m010_frozen_sale_lines(conn):
+    columns = [r[1] for r in conn.execute('PRAGMA table_info(sale_items)')]
+    for name, kind in (('sku', 'TEXT'), ('name', 'TEXT'), ('price', 'INTEGER')):
+        if name not in columns:
+            conn.execute(f'ALTER TABLE sale_items ADD COLUMN {name} {kind}')
+    # older sales only have the current product row; the unit price actually charged is subtotal / qty
+    conn.execute('''
+        UPDATE sale_items SET
+            sku = (SELECT sku FROM products WHERE id = sale_items.product_id),
+            name = (SELECT name FROM products WHERE id = sale_items.product_id),
+            price = CASE WHEN qty > 0 THEN subtotal / qty END
+        WHERE name IS NULL
+    ''')
+
+
+def m011_catalog_changes(conn):
+    catalog_index.ensure_schema(conn)
+
+
+def m012_sku_nocase_index(conn):
+    # scans before the product index is loaded match SKUs without regard to case
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_sku_nocase ON products(sku COLLATE NOCASE)')
+
+
+MIGRATIONS = [
+    m001_base_schema,
+    m002_seed_sample_products,
+    m003_product_sort_indexes,
+    m004_report_rollups,
+    m005_product_search,
+    m006_stock_ledger,
+    m007_sale_journal,
+    m008_pricing,
+    m009_reorder_alerts,
+    m010_frozen_sale_lines,
+    m011_catalog_changes,
+    m012_sku_nocase_index,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    if schema_version(conn) >= len(migrations):
+        return []
+    applied = []
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # another lane may have migrated while we waited for the write lock
+        version = schema_version(conn)
+        for n, step in enumerate(migrations[version:], version + 1):
+            step(conn)
+            conn.execute(f'PRAGMA user_version = {n}')
+            applied.append(step.__name__)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return applied
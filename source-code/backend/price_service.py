@@ -0,0 +1,255 @@
+import json
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import instrument
+from db import connect
+from product_search import ProductSearch
+
+POOL_SIZE = 8
+HOT_CACHE_SIZE = 20000
+VERSION_POLL_S = 0.5
+MAX_LIMIT = 200
+MAX_BATCH = 500
+FIELDS = ('id', 'sku', 'name', 'price', 'stock', 'base_price')
+# the price the till charges: price rules and promotions from effective_prices win over products.price
+SELECT_PRODUCT = '''SELECT p.id, p.sku, p.name, IFNULL(e.price, p.price), p.stock, p.price, e.deal_qty, e.deal_price
+    FROM products p LEFT JOIN effective_prices e ON e.product_id = p.id'''
+
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue()
+        self.conns = [self._open() for _ in range(size)]
+        for conn in self.conns:
+            self._idle.put(conn)
+
+    def _open(self):
+        conn = connect(self.path, readonly=True, check_same_thread=False)
+        conn.row_factory = None
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        for conn in self.conns:
+            conn.close()
+
+
+class HotCache:
+    def __init__(self, maxsize=HOT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._rows = OrderedDict()
+
+    def get(self, sku):
+        with self._lock:
+            row = self._rows.get(sku)
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._rows.move_to_end(sku)
+            return row
+
+    def put(self, sku, row, generation):
+        # a row read before the last clear may already be stale, drop it
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._rows[sku] = row
+            if len(self._rows) > self.maxsize:
+                self._rows.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._rows.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._rows), 'hits': self.hits, 'misses': self.misses}
+
+
+class VersionWatcher(threading.Thread):
+    # any commit from a lane moves data_version; drop the hot cache when it does
+    def __init__(self, path, cache, interval=VERSION_POLL_S):
+        super().__init__(name='data-version-watcher', daemon=True)
+        self.conn = connect(path, readonly=True, check_same_thread=False)
+        self.cache = cache
+        self.interval = interval
+        self._stopped = threading.Event()
+        self.version = self._version()
+
+    def _version(self):
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            version = self._version()
+            if version != self.version:
+                self.version = version
+                self.cache.clear()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.conn.close()
+
+
+class Catalog:
+    def __init__(self, path, pool_size=POOL_SIZE, cache_size=HOT_CACHE_SIZE):
+        self.pool = ConnectionPool(path, pool_size)
+        self.cache = HotCache(cache_size)
+        self.watcher = VersionWatcher(path, self.cache)
+        self.watcher.start()
+        self.searchers = {id(conn): ProductSearch(conn) for conn in self.pool.conns}
+        self.fts = all(s.enabled for s in self.searchers.values())
+
+    def lookup(self, sku):
+        row = self.cache.get(sku)
+        if row is not None:
+            return row or None
+        generation = self.cache.generation
+        with self.pool.connection() as conn:
+            row = conn.execute(f"{SELECT_PRODUCT} WHERE p.sku = ?", (sku,)).fetchone()
+        # unknown SKUs are cached too, as an empty tuple, so a bad barcode cannot hammer the pool
+        self.cache.put(sku, row or (), generation)
+        return row
+
+    def stock(self, skus):
+        out, missing = {}, []
+        for sku in skus:
+            row = self.cache.get(sku)
+            if row is None:
+                missing.append(sku)
+            elif row:
+                out[sku] = row
+        if missing:
+            generation = self.cache.generation
+            marks = ','.join('?' * len(missing))
+            with self.pool.connection() as conn:
+                found = {r[1]: r for r in conn.execute(f"{SELECT_PRODUCT} WHERE p.sku IN ({marks})", missing)}
+            for sku in missing:
+                self.cache.put(sku, found.get(sku, ()), generation)
+            out.update(found)
+        return out
+
+    def search(self, q, limit):
+        with self.pool.connection() as conn:
+            if self.fts:
+                return priced(conn, self.searchers[id(conn)].search(q, limit))
+            like = f"%{q}%"
+            return conn.execute(f"{SELECT_PRODUCT} WHERE p.sku LIKE ? OR p.name LIKE ? ORDER BY p.name LIMIT ?",
+                                (like, like, limit)).fetchall()
+
+    def close(self):
+        self.watcher.stop()
+        self.pool.close()
+
+
+def priced(conn, rows):
+    # search ranks plain product rows; read them again with their effective price, keeping the order
+    ids = [r[0] for r in rows]
+    if not ids:
+        return []
+    found = {r[0]: r for r in conn.execute(f"{SELECT_PRODUCT} WHERE p.id IN ({','.join('?' * len(ids))})", ids)}
+    return [found[pid] for pid in ids if pid in found]
+
+
+def as_dict(row):
+    out = dict(zip(FIELDS, row))
+    out['deal'] = {'qty': row[6], 'price': row[7]} if row[6] else None
+    return out
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'CashierPriceService/1.0'
+    # headers and body go out as two writes; with Nagle on, keep-alive clients wait ~40 ms on each reply
+    disable_nagle_algorithm = True
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            sys.stderr.write("%s - %s\n" % (self.address_string(), fmt % args))
+
+    def send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        t0 = time.perf_counter()
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        parts = [unquote(p) for p in url.path.split('/') if p]
+        route = parts[0] if parts else ''
+        catalog = self.server.catalog
+        try:
+            if route == 'sku' and len(parts) == 2:
+                row = catalog.lookup(parts[1])
+                if row is None:
+                    self.send_json(404, {'error': f"unknown sku {parts[1]}"})
+                else:
+                    self.send_json(200, as_dict(row))
+            elif route == 'search':
+                q = query.get('q', [''])[0].strip()
+                limit = min(MAX_LIMIT, max(1, int(query.get('limit', ['20'])[0])))
+                rows = catalog.search(q, limit) if q else []
+                self.send_json(200, {'query': q, 'results': [as_dict(r) for r in rows]})
+            elif route == 'stock':
+                skus = [s for v in query.get('sku', []) for s in v.split(',') if s][:MAX_BATCH]
+                found = catalog.stock(skus)
+                self.send_json(200, {'stock': {s: found[s][4] for s in skus if s in found},
+                                     'unknown': [s for s in skus if s not in found]})
+            elif route == 'health':
+                self.send_json(200, {'ok': True, 'fts': catalog.fts, 'cache': catalog.cache.stats()})
+            else:
+                route = 'not_found'
+                self.send_json(404, {'error': 'not found'})
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+        instrument.record('http', route, time.perf_counter() - t0)
+
+
+class PriceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, catalog, verbose=False):
+        super().__init__(address, Handler)
+        self.catalog = catalog
+        self.verbose = verbose
+
+
+def serve(db_path, host='127.0.0.1', port=8765, pool_size=POOL_SIZE, verbose=False):
+    catalog = Catalog(db_path, pool_size)
+    server = PriceServer((host, port), catalog, verbose)
+    print(f"Serving {db_path} on http://{host}:{server.server_address[1]}/", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        catalog.close()
+    return 0
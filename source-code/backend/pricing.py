@@ -0,0 +1,281 @@
+from datetime import datetime
+
+from db import data_version
+
+SCOPES = ('prefix', 'category', 'sku')
+KINDS = ('percent', 'amount', 'fixed')
+NOW_SQL = "datetime('now', 'localtime')"
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS price_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        scope TEXT NOT NULL CHECK (scope IN ('prefix', 'category', 'sku')),
+        pattern TEXT NOT NULL,
+        kind TEXT NOT NULL CHECK (kind IN ('percent', 'amount', 'fixed')),
+        value REAL NOT NULL,
+        starts_at TEXT,
+        ends_at TEXT,
+        priority INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS promotions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        scope TEXT NOT NULL CHECK (scope IN ('prefix', 'category', 'sku')),
+        pattern TEXT NOT NULL,
+        buy_qty INTEGER NOT NULL CHECK (buy_qty > 1),
+        pay_qty INTEGER CHECK (pay_qty > 0),
+        bundle_price INTEGER CHECK (bundle_price >= 0),
+        starts_at TEXT,
+        ends_at TEXT,
+        priority INTEGER NOT NULL DEFAULT 0,
+        CHECK ((pay_qty IS NULL) != (bundle_price IS NULL))
+    )
+    ''',
+    # only products that a rule or promotion touches have a row; everything else sells at products.price
+    '''
+    CREATE TABLE IF NOT EXISTS effective_prices (
+        product_id INTEGER PRIMARY KEY,
+        price INTEGER NOT NULL,
+        rule_id INTEGER,
+        promo_id INTEGER,
+        deal_qty INTEGER,
+        deal_price INTEGER
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS pricing_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        computed_at TEXT NOT NULL,
+        valid_until TEXT
+    )
+    ''',
+]
+
+MATCH = '''({t}.scope = 'prefix' AND substr({p}.sku, 1, length({t}.pattern)) = {t}.pattern
+            OR {t}.scope = 'category' AND {p}.category = {t}.pattern
+            OR {t}.scope = 'sku' AND {p}.sku = {t}.pattern)'''
+ACTIVE = "({t}.starts_at IS NULL OR {t}.starts_at <= {at}) AND ({t}.ends_at IS NULL OR {t}.ends_at > {at})"
+
+# the winning rule and promotion per product, highest priority then newest, in one INSERT ... SELECT
+RESOLVE = '''
+INSERT OR REPLACE INTO effective_prices (product_id, price, rule_id, promo_id, deal_qty, deal_price)
+SELECT e.id, e.price, e.rule_id, d.id, d.buy_qty, IFNULL(d.bundle_price, d.pay_qty * e.price)
+FROM (
+    SELECT p.id, p.sku, p.category, r.id AS rule_id,
+           MAX(0, CASE r.kind
+                      WHEN 'percent' THEN CAST(ROUND(p.price * (100 + r.value) / 100.0) AS INTEGER)
+                      WHEN 'amount' THEN p.price + CAST(r.value AS INTEGER)
+                      WHEN 'fixed' THEN CAST(r.value AS INTEGER)
+                      ELSE p.price END) AS price
+    FROM products p
+    LEFT JOIN price_rules r ON r.id = (
+        SELECT r.id FROM price_rules r WHERE {rule_active} AND {rule_match}
+        ORDER BY r.priority DESC, r.id DESC LIMIT 1)
+    {where}
+) e
+LEFT JOIN promotions d ON d.id = (
+    SELECT d.id FROM promotions d WHERE {promo_active} AND {promo_match}
+    ORDER BY d.priority DESC, d.id DESC LIMIT 1)
+WHERE e.rule_id IS NOT NULL OR d.id IS NOT NULL
+'''
+
+
+def resolve_sql(at, where=''):
+    return RESOLVE.format(rule_active=ACTIVE.format(t='r', at=at), rule_match=MATCH.format(t='r', p='p'),
+                          promo_active=ACTIVE.format(t='d', at=at), promo_match=MATCH.format(t='d', p='e'),
+                          where=where)
+
+
+def _triggers():
+    one = resolve_sql(NOW_SQL, 'WHERE p.id = new.id')
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS effective_prices_ai AFTER INSERT ON products BEGIN
+            {one};
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS effective_prices_ad AFTER DELETE ON products BEGIN
+            DELETE FROM effective_prices WHERE product_id = old.id;
+        END''',
+        # stock updates at checkout do not touch pricing
+        f'''CREATE TRIGGER IF NOT EXISTS effective_prices_au AFTER UPDATE OF sku, price, category ON products
+        WHEN old.sku IS NOT new.sku OR old.price IS NOT new.price OR old.category IS NOT new.category BEGIN
+            DELETE FROM effective_prices WHERE product_id = old.id;
+            {one};
+        END''',
+    ]
+
+
+def now():
+    return datetime.now().isoformat(' ', 'seconds')
+
+
+def ensure_schema(conn):
+    for sql in SCHEMA + _triggers():
+        conn.execute(sql)
+
+
+def line_total(qty, price, deal=None):
+    # deal: (group size, price of a full group), e.g. (3, 10000) for "3 for Rp10,000"
+    if deal:
+        n, group_price = deal
+        return qty // n * group_price + qty % n * price
+    return qty * price
+
+
+def _match_args(scope, pattern):
+    if scope not in SCOPES:
+        raise ValueError(f"Unknown pricing scope: {scope}")
+    if not pattern:
+        raise ValueError("A pricing rule needs a SKU prefix, category or SKU")
+    return scope, pattern
+
+
+def next_change(cur, at):
+    return cur.execute('''
+        SELECT MIN(t) FROM (
+            SELECT starts_at AS t FROM price_rules WHERE starts_at > ?1
+            UNION ALL SELECT ends_at FROM price_rules WHERE ends_at > ?1
+            UNION ALL SELECT starts_at FROM promotions WHERE starts_at > ?1
+            UNION ALL SELECT ends_at FROM promotions WHERE ends_at > ?1)
+    ''', (at,)).fetchone()[0]
+
+
+def fill(cur, at=None):
+    at = at or now()
+    cur.execute("DELETE FROM effective_prices")
+    cur.execute(resolve_sql('?1'), (at,))
+    count = cur.rowcount
+    cur.execute("INSERT OR REPLACE INTO pricing_state (id, computed_at, valid_until) VALUES (1, ?, ?)",
+                (at, next_change(cur, at)))
+    return count
+
+
+def _write(conn, fn, *args):
+    cur = conn.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        out = fn(cur, *args)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return out
+
+
+def refresh(conn, at=None):
+    return _write(conn, fill, at)
+
+
+def refresh_due(conn, at=None):
+    state = conn.execute("SELECT valid_until FROM pricing_state WHERE id = 1").fetchone()
+    return state is None or (state[0] is not None and state[0] <= (at or now()))
+
+
+def add_rule(conn, scope, pattern, kind, value, starts_at=None, ends_at=None, priority=0, name=None):
+    _match_args(scope, pattern)
+    if kind not in KINDS:
+        raise ValueError(f"Unknown price rule kind: {kind}")
+
+    def write(cur):
+        cur.execute('''INSERT INTO price_rules (name, scope, pattern, kind, value, starts_at, ends_at, priority)
+                       VALUES (?,?,?,?,?,?,?,?)''', (name, scope, pattern, kind, value, starts_at, ends_at, priority))
+        rule_id = cur.lastrowid
+        fill(cur)
+        return rule_id
+    return _write(conn, write)
+
+
+def add_promotion(conn, scope, pattern, buy_qty, pay_qty=None, bundle_price=None, starts_at=None, ends_at=None,
+                  priority=0, name=None):
+    _match_args(scope, pattern)
+    if (pay_qty is None) == (bundle_price is None):
+        raise ValueError("A promotion needs either a quantity to pay for or a bundle price")
+    if pay_qty is not None and not 0 < pay_qty < buy_qty:
+        raise ValueError("A promotion must pay for fewer items than it gives")
+
+    def write(cur):
+        cur.execute('''INSERT INTO promotions (name, scope, pattern, buy_qty, pay_qty, bundle_price,
+                                               starts_at, ends_at, priority)
+                       VALUES (?,?,?,?,?,?,?,?,?)''',
+                    (name, scope, pattern, buy_qty, pay_qty, bundle_price, starts_at, ends_at, priority))
+        promo_id = cur.lastrowid
+        fill(cur)
+        return promo_id
+    return _write(conn, write)
+
+
+def remove(conn, table, row_id):
+    if table not in ('price_rules', 'promotions'):
+        raise ValueError(f"Unknown pricing table: {table}")
+
+    def write(cur):
+        cur.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+        removed = cur.rowcount
+        if removed:
+            fill(cur)
+        return removed
+    return _write(conn, write)
+
+
+def reprice(conn, scope, pattern, kind, value):
+    # permanent change of products.price for a whole group, as one UPDATE
+    scope, pattern = _match_args(scope, pattern)
+    new_price = {
+        'percent': "CAST(ROUND(price * (100 + ?) / 100.0) AS INTEGER)",
+        'amount': "price + CAST(? AS INTEGER)",
+        'fixed': "CAST(? AS INTEGER)",
+    }.get(kind)
+    if new_price is None:
+        raise ValueError(f"Unknown price rule kind: {kind}")
+    where = {'prefix': "sku >= ? AND sku < ? || char(1114111)", 'category': "category = ?", 'sku': "sku = ?"}[scope]
+    params = (pattern, pattern) if scope == 'prefix' else (pattern,)
+    return _write(conn, lambda cur: cur.execute(
+        f"UPDATE products SET price = MAX(0, {new_price}) WHERE {where}", (value,) + params).rowcount)
+
+
+def list_rules(conn):
+    return conn.execute("SELECT * FROM price_rules ORDER BY priority DESC, id").fetchall()
+
+
+def list_promotions(conn):
+    return conn.execute("SELECT * FROM promotions ORDER BY priority DESC, id").fetchall()
+
+
+class PriceBook:
+    # effective price and multi-buy deal per product id; a dict hit is all add_to_cart pays for
+    def __init__(self, conn, watch=None):
+        self.conn = conn
+        self.watch = watch or (lambda: data_version(conn))
+        self._prices = {}
+        self._version = self._data_version()
+
+    def _data_version(self):
+        return self.watch()
+
+    def check(self):
+        version = self._data_version()
+        if version == self._version:
+            return False
+        self._version = version
+        self._prices.clear()
+        return True
+
+    def clear(self):
+        self._prices.clear()
+
+    def discard(self, ids):
+        for pid in ids:
+            self._prices.pop(pid, None)
+
+    def get(self, pid, base_price):
+        # (price, deal) for one product; deal is None or (group size, group price)
+        self.check()
+        entry = self._prices.get(pid)
+        if entry is None:
+            row = self.conn.execute(
+                "SELECT price, deal_qty, deal_price FROM effective_prices WHERE product_id = ?", (pid,)).fetchone()
+            entry = self._prices[pid] = (row[0], (row[1], row[2]) if row[1] else None) if row else ()
+        return entry or (base_price, None)
@@ -0,0 +1,182 @@
+from collections import OrderedDict
+
+from db import data_version
+from product_list import PRODUCT_COLUMNS, ProductPager
+
+ROW_CACHE_SIZE = 5000
+QUERY_CACHE_SIZE = 128
+SELECT_PRODUCT = "SELECT id, sku, name, price, stock FROM products"
+
+
+class ProductCache:
+    def __init__(self, conn, watch=None, maxsize=ROW_CACHE_SIZE, max_queries=QUERY_CACHE_SIZE):
+        self.conn = conn
+        # watch returns a number that moves when someone else changed the data (see db.CommitWatch);
+        # our own writes are applied with put/reload and must not move it
+        self.watch = watch or (lambda: data_version(conn))
+        self.maxsize = maxsize
+        self.max_queries = max_queries
+        self.hits = 0
+        self.misses = 0
+        self._rows = OrderedDict()
+        self._queries = OrderedDict()
+        self._levels = {}  # reorder levels, only for rows in _rows
+        self._count = None
+        self._version = self._data_version()
+
+    def _data_version(self):
+        return self.watch()
+
+    def check(self):
+        version = self._data_version()
+        if version == self._version:
+            return False
+        self._version = version
+        self.clear()
+        return True
+
+    def clear(self):
+        self._rows.clear()
+        self._queries.clear()
+        self._levels.clear()
+        self._count = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _store(self, row):
+        rows = self._rows
+        rows[row[0]] = row
+        rows.move_to_end(row[0])
+        if len(rows) > self.maxsize:
+            self._levels.pop(rows.popitem(last=False)[0], None)
+
+    def _invalidate(self, changed=None):
+        if changed is None:
+            self._queries.clear()
+            self._count = None
+            return
+        for key in [k for k, (_, depends) in self._queries.items() if depends & changed]:
+            del self._queries[key]
+
+    def _fetch_ids(self, ids):
+        found = {}
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            marks = ','.join('?' * len(chunk))
+            for r in self.conn.execute(f"{SELECT_PRODUCT} WHERE id IN ({marks})", chunk):
+                found[r[0]] = tuple(r)
+        return found
+
+    def get(self, pid):
+        self.check()
+        row = self._rows.get(pid)
+        if row is not None:
+            self.hits += 1
+            self._rows.move_to_end(pid)
+            return row
+        self.misses += 1
+        row = self._fetch_ids([pid]).get(pid)
+        if row is not None:
+            self._store(row)
+        return row
+
+    def _lookup(self, ids):
+        out, missing = {}, []
+        for pid in ids:
+            row = self._rows.get(pid)
+            if row is None:
+                missing.append(pid)
+            else:
+                self._rows.move_to_end(pid)
+                out[pid] = row
+        if missing:
+            for pid, row in self._fetch_ids(missing).items():
+                self._store(row)
+                out[pid] = row
+        return out, len(missing)
+
+    def get_many(self, ids):
+        self.check()
+        ids = list(ids)
+        out, missed = self._lookup(ids)
+        self.hits += len(ids) - missed
+        self.misses += missed
+        return out
+
+    def query(self, sql, params=(), depends=PRODUCT_COLUMNS):
+        # sql must select the product columns; results are kept as ids so that
+        # in-place updates of the rows show up without re-running the query
+        self.check()
+        key = (sql, tuple(params))
+        entry = self._queries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._queries.move_to_end(key)
+            ids = entry[0]
+            rows = self._lookup(ids)[0]
+            return [rows[pid] for pid in ids if pid in rows]
+        self.misses += 1
+        rows = [tuple(r) for r in self.conn.execute(sql, params)]
+        for r in rows:
+            self._store(r)
+        self._queries[key] = ([r[0] for r in rows], frozenset(depends))
+        if len(self._queries) > self.max_queries:
+            self._queries.popitem(last=False)
+        return rows
+
+    def reorder_level(self, pid):
+        # only the product dialog needs it, so it is kept next to the row instead of widening every row
+        if self.get(pid) is None:
+            return None
+        if pid not in self._levels:
+            row = self.conn.execute("SELECT reorder_level FROM products WHERE id = ?", (pid,)).fetchone()
+            self._levels[pid] = row[0] if row else None
+        return self._levels[pid]
+
+    def count(self):
+        self.check()
+        if self._count is None:
+            self._count = self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        return self._count
+
+    def put(self, row):
+        row = tuple(row)
+        old = self._rows.get(row[0])
+        self._levels.pop(row[0], None)
+        if old is None:
+            self._invalidate()
+        else:
+            changed = {c for c, a, b in zip(PRODUCT_COLUMNS, old, row) if a != b}
+            if changed:
+                self._invalidate(changed)
+        self._store(row)
+
+    def discard(self, pid):
+        self._rows.pop(pid, None)
+        self._levels.pop(pid, None)
+        self._invalidate()
+
+    def reload(self, ids):
+        ids = list(ids)
+        found = self._fetch_ids(ids)
+        for pid in ids:
+            row = found.get(pid)
+            if row is None:
+                self.discard(pid)
+            else:
+                self.put(row)
+        return found
+
+
+class CachedPager(ProductPager):
+    def __init__(self, cache, sort='name', desc=False):
+        super().__init__(cache.conn, sort, desc)
+        self.cache = cache
+
+    def count(self):
+        return self.cache.count()
+
+    def _fetch(self, sql, params):
+        return self.cache.query(sql, params, depends=(self.sort,))
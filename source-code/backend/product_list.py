@@ -0,0 +1,217 @@
+PRODUCT_COLUMNS = ('id', 'sku', 'name', 'price', 'stock')
+OVERSCAN = 40
+
+
+class ProductPager:
+    def __init__(self, conn, sort='name', desc=False):
+        self.conn = conn
+        self.sort = sort
+        self.desc = desc
+
+    def set_sort(self, col, desc=False):
+        if col not in PRODUCT_COLUMNS:
+            raise ValueError(f"Unknown column: {col}")
+        self.sort = col
+        self.desc = desc
+
+    def key_of(self, row):
+        return (row[PRODUCT_COLUMNS.index(self.sort)], row[0])
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def _fetch(self, sql, params):
+        return self.conn.execute(sql, params).fetchall()
+
+    def page_after(self, key, n):
+        return self._page(key, n, backwards=False)
+
+    def page_before(self, key, n):
+        return self._page(key, n, backwards=True)[::-1]
+
+    def page_at(self, offset, n):
+        return self._fetch(
+            f"SELECT id, sku, name, price, stock FROM products {self._order(False)} LIMIT ? OFFSET ?",
+            (n, offset))
+
+    def _order(self, backwards):
+        direction = 'DESC' if self.desc != backwards else 'ASC'
+        return f"ORDER BY {self.sort} {direction}, id {direction}"
+
+    def _page(self, key, n, backwards):
+        sql = "SELECT id, sku, name, price, stock FROM products"
+        params = []
+        if key is not None:
+            op = '<' if self.desc != backwards else '>'
+            sql += f" WHERE ({self.sort}, id) {op} (?, ?)"
+            params.extend(key)
+        sql += f" {self._order(backwards)} LIMIT ?"
+        params.append(n)
+        return self._fetch(sql, params)
+
+
+class ListPager:
+    def __init__(self, rows, sort=None, desc=False):
+        self.rows = list(rows)
+        self.sort = sort
+        self.desc = desc
+        if sort:
+            self.set_sort(sort, desc)
+
+    def set_sort(self, col, desc=False):
+        i = PRODUCT_COLUMNS.index(col)
+        self.rows.sort(key=lambda r: (r[i], r[0]), reverse=desc)
+        self.sort = col
+        self.desc = desc
+
+    def count(self):
+        return len(self.rows)
+
+    def page_at(self, offset, n):
+        return self.rows[offset:offset + n]
+
+
+class VirtualProductList:
+    def __init__(self, tree, scrollbar, sizer=None, on_change=None, display=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.sizer = sizer
+        self.on_change = on_change
+        self.display = display
+        self.pager = None
+        self.total = 0
+        self.offset = 0
+        self._buf_start = 0
+        self._buf = []
+
+        scrollbar.config(command=self.on_scrollbar)
+        for col in PRODUCT_COLUMNS:
+            tree.heading(col, command=lambda c=col: self.sort_by(c))
+        tree.bind('<MouseWheel>', self.on_wheel)
+        tree.bind('<Button-4>', lambda e: self.scroll(-3))
+        tree.bind('<Button-5>', lambda e: self.scroll(3))
+        tree.bind('<Prior>', lambda e: self.scroll(-self.visible_rows) or 'break')
+        tree.bind('<Next>', lambda e: self.scroll(self.visible_rows) or 'break')
+        tree.bind('<Up>', self.on_key_up)
+        tree.bind('<Down>', self.on_key_down)
+
+    @property
+    def visible_rows(self):
+        return int(self.tree['height'])
+
+    def show(self, pager, keep_position=False):
+        self.pager = pager
+        self.total = pager.count()
+        self._buf_start, self._buf = 0, []
+        if self.sizer is not None:
+            self.sizer.clear()
+        self._update_headings()
+        self._render(self.offset if keep_position else 0)
+
+    def refresh(self):
+        if self.pager is not None:
+            self.show(self.pager, keep_position=True)
+
+    def sort_by(self, col):
+        if self.pager is None:
+            return
+        desc = self.pager.sort == col and not self.pager.desc
+        self.pager.set_sort(col, desc)
+        self._update_headings()
+        self._buf_start, self._buf = 0, []
+        self._render(0)
+
+    def _update_headings(self):
+        for c in PRODUCT_COLUMNS:
+            arrow = ''
+            if c == self.pager.sort:
+                arrow = ' ▼' if self.pager.desc else ' ▲'
+            self.tree.heading(c, text=c.title() + arrow)
+
+    def scroll(self, delta):
+        self._render(self.offset + delta)
+
+    def on_wheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+
+    def on_scrollbar(self, action, *args):
+        if action == 'moveto':
+            self._render(int(float(args[0]) * self.total))
+        elif action == 'scroll':
+            step = int(args[0]) * (self.visible_rows if args[1] == 'pages' else 1)
+            self.scroll(step)
+
+    def on_key_up(self, event):
+        children = self.tree.get_children()
+        if children and self.tree.focus() == children[0] and self.offset > 0:
+            self.scroll(-1)
+            self._focus(self.tree.get_children()[0])
+            return 'break'
+
+    def on_key_down(self, event):
+        children = self.tree.get_children()
+        if children and self.tree.focus() == children[-1]:
+            self.scroll(1)
+            self._focus(self.tree.get_children()[-1])
+            return 'break'
+
+    def _focus(self, iid):
+        self.tree.focus(iid)
+        self.tree.selection_set(iid)
+
+    def _render(self, offset):
+        n = self.visible_rows
+        offset = max(0, min(offset, self.total - n))
+        self.offset = offset
+        rows = self._window(offset, n)
+
+        selected = self.tree.focus()
+        shown = self.tree.get_children()
+        self.tree.delete(*shown)
+        if self.sizer is not None:
+            # the sizer only tracks the rows on screen
+            for iid in shown:
+                self.sizer.remove_row(iid)
+        for r in rows:
+            iid = str(r[0])
+            values = self.display(r) if self.display else tuple(r)
+            self.tree.insert('', 'end', iid=iid, values=values)
+            if self.sizer is not None:
+                self.sizer.add_row(iid, values)
+        if selected and self.tree.exists(selected):
+            self._focus(selected)
+        if self.sizer is not None:
+            self.sizer.apply()
+
+        if self.total:
+            self.scrollbar.set(offset / self.total, min(1.0, (offset + n) / self.total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        if self.on_change:
+            self.on_change()
+
+    def _window(self, offset, n):
+        buf_end = self._buf_start + len(self._buf)
+        if not (self._buf_start <= offset and offset + n <= buf_end):
+            self._fill(offset, n)
+        i = offset - self._buf_start
+        return self._buf[i:i + n]
+
+    def _fill(self, offset, n):
+        pager = self.pager
+        start = max(0, offset - OVERSCAN)
+        size = n + 2 * OVERSCAN
+        buf_end = self._buf_start + len(self._buf)
+        keyset = isinstance(pager, ProductPager) and self._buf
+        if keyset and self._buf_start < offset <= buf_end:
+            # scrolling forward: continue after the last row we already have
+            keep = self._buf[offset - self._buf_start - 1:]
+            more = pager.page_after(pager.key_of(keep[-1]), size - len(keep) + 1)
+            self._buf_start, self._buf = offset - 1, keep + more
+        elif keyset and offset < self._buf_start <= offset + n + OVERSCAN:
+            # scrolling backward: fetch the rows just before the first one we have
+            prev = pager.page_before(pager.key_of(self._buf[0]), self._buf_start - start)
+            self._buf_start = self._buf_start - len(prev)
+            self._buf = prev + self._buf[:size]
+        else:
+            self._buf_start, self._buf = start, pager.page_at(start, size)
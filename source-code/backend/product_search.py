@@ -0,0 +1,141 @@
+import re
+import sqlite3
+
+from catalog_index import SEARCH_LIMIT, SCAN_FACTOR
+
+FTS_TABLE = 'products_fts'
+TRIGRAM_TABLE = 'products_trigram'
+SKU_WEIGHT, NAME_WEIGHT, CATEGORY_WEIGHT = 10.0, 4.0, 1.0
+MIN_FUZZY_SHARE = 1 / 3  # share of the query's trigrams a fuzzy hit must contain
+
+TOKEN = re.compile(r'\w+')
+
+FTS_SCHEMA = [
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        sku, name, category,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON products BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, sku, name, category) VALUES (new.id, new.sku, new.name, new.category);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON products BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, sku, name, category)
+        VALUES ('delete', old.id, old.sku, old.name, old.category);
+    END''',
+    # upserts rewrite every column, only re-index when the text really changed
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF sku, name, category ON products
+    WHEN old.sku IS NOT new.sku OR old.name IS NOT new.name OR old.category IS NOT new.category BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, sku, name, category)
+        VALUES ('delete', old.id, old.sku, old.name, old.category);
+        INSERT INTO {FTS_TABLE}(rowid, sku, name, category) VALUES (new.id, new.sku, new.name, new.category);
+    END''',
+]
+
+TRIGRAM_SCHEMA = [
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS {TRIGRAM_TABLE} USING fts5(
+        name, content='products', content_rowid='id', tokenize='trigram', detail='none')''',
+    f'''CREATE TRIGGER IF NOT EXISTS {TRIGRAM_TABLE}_ai AFTER INSERT ON products BEGIN
+        INSERT INTO {TRIGRAM_TABLE}(rowid, name) VALUES (new.id, new.name);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {TRIGRAM_TABLE}_ad AFTER DELETE ON products BEGIN
+        INSERT INTO {TRIGRAM_TABLE}({TRIGRAM_TABLE}, rowid, name) VALUES ('delete', old.id, old.name);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {TRIGRAM_TABLE}_au AFTER UPDATE OF name ON products
+    WHEN old.name IS NOT new.name BEGIN
+        INSERT INTO {TRIGRAM_TABLE}({TRIGRAM_TABLE}, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO {TRIGRAM_TABLE}(rowid, name) VALUES (new.id, new.name);
+    END''',
+]
+
+# rank is bm25 with the column weights; ORDER BY rank LIMIT scores every match but only keeps the best
+SELECT_MATCH = '''SELECT p.id, p.sku, p.name, p.price, p.stock
+    FROM (SELECT rowid, rank FROM {table} WHERE {table} MATCH ? AND rank MATCH '{rank}' ORDER BY rank LIMIT ?) f
+    JOIN products p ON p.id = f.rowid ORDER BY f.rank'''
+
+
+def fts5_available(conn, tokenizer='unicode61'):
+    try:
+        conn.execute(f"CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x, tokenize='{tokenizer}')")
+    except sqlite3.OperationalError:
+        return False
+    conn.execute("DROP TABLE temp.fts5_probe")
+    return True
+
+
+def ensure_schema(conn):
+    created = []
+    if fts5_available(conn):
+        for sql in FTS_SCHEMA:
+            conn.execute(sql)
+        conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        created.append(FTS_TABLE)
+        if fts5_available(conn, 'trigram'):
+            for sql in TRIGRAM_SCHEMA:
+                conn.execute(sql)
+            conn.execute(f"INSERT INTO {TRIGRAM_TABLE}({TRIGRAM_TABLE}) VALUES ('rebuild')")
+            created.append(TRIGRAM_TABLE)
+    return created
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class ProductSearch:
+    def __init__(self, conn, fetch=None):
+        self.conn = conn
+        self.fetch = fetch or (lambda sql, params: conn.execute(sql, params).fetchall())
+        tables = {r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE name IN (?, ?)", (FTS_TABLE, TRIGRAM_TABLE))}
+        self.enabled = FTS_TABLE in tables and self._usable(FTS_TABLE)
+        self.fuzzy = self.enabled and TRIGRAM_TABLE in tables and self._usable(TRIGRAM_TABLE)
+        self._ranked_sql = SELECT_MATCH.format(
+            table=FTS_TABLE, rank=f'bm25({SKU_WEIGHT}, {NAME_WEIGHT}, {CATEGORY_WEIGHT})')
+        self._fuzzy_sql = SELECT_MATCH.format(table=TRIGRAM_TABLE, rank='bm25()')
+
+    def _usable(self, table):
+        # the tables exist but this SQLite build may lack fts5 or the trigram tokenizer
+        try:
+            self.conn.execute(f"SELECT rowid FROM {table} LIMIT 0").fetchall()
+        except sqlite3.OperationalError:
+            return False
+        return True
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        tokens = TOKEN.findall(query.lower())
+        if not tokens or not self.enabled:
+            return []
+        rows = self.exact_sku(query.strip()) + self.ranked(tokens, limit)
+        if len(rows) > 1 and rows[0][0] in {r[0] for r in rows[1:]}:
+            rows = [rows[0]] + [r for r in rows[1:] if r[0] != rows[0][0]]
+        if not rows and self.fuzzy:
+            rows = self.fuzzy_match(tokens, limit)
+        return rows
+
+    def exact_sku(self, sku):
+        return [tuple(r) for r in self.fetch(
+            "SELECT id, sku, name, price, stock FROM products WHERE sku = ?", (sku,))]
+
+    def ranked(self, tokens, limit=SEARCH_LIMIT):
+        expr = ' '.join(_quote(t) + '*' for t in tokens)
+        return [tuple(r) for r in self.fetch(self._ranked_sql, (expr, limit))]
+
+    def fuzzy_match(self, tokens, limit=SEARCH_LIMIT):
+        grams = set()
+        for t in tokens:
+            grams |= trigrams(t)
+        if not grams:
+            return []
+        expr = ' OR '.join(_quote(g) for g in sorted(grams))
+        need = max(1, round(len(grams) * MIN_FUZZY_SHARE))
+        out = []
+        for r in self.fetch(self._fuzzy_sql, (expr, limit * SCAN_FACTOR)):
+            if len(grams & trigrams(r[2].lower())) >= need:
+                out.append(tuple(r))
+                if len(out) == limit:
+                    break
+        return out
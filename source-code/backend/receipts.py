@@ -0,0 +1,359 @@
+import glob
+import os
+import queue
+import re
+import sqlite3
+import struct
+import threading
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+SEGMENT_SIZE = 64 * 1024 * 1024
+MAGIC = b'RCPT'
+HEADER = struct.Struct('<4sBqII')  # magic, flags, sale_id, payload length, crc32
+FLAG_ZLIB = 1
+
+
+def format_receipt(sale_time, total, items):
+    lines = []
+    lines.append("      === RECEIPT ===")
+    lines.append("")
+    lines.append(f"Time: {sale_time}")
+    lines.append("-" * 26)
+    lines.append(f"{'Item':15} {'Qty':>3} {'Subtotal':>9}")
+    lines.append("-" * 26)
+    for name, qty, subtotal in items:
+        name_display = name[:12] + "..." if len(name) > 15 else name.ljust(15)
+        qty = str(qty).rjust(3)
+        subtotal = f"Rp{subtotal:,}".rjust(9)
+        lines.append(f"{name_display} {qty} {subtotal}")
+    lines.append("-" * 26)
+    lines.append(f"{'TOTAL':>20} {f'Rp{total:,}':>9}")
+    lines.append("")
+    lines.append("Thank you for your purchase!")
+    return "\n".join(lines)
+
+
+class CorruptReceipt(Exception):
+    pass
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ReceiptStore:
+    def __init__(self, directory, compress=True, segment_size=SEGMENT_SIZE, fsync=False):
+        self.directory = directory
+        self.compress = compress
+        self.segment_size = segment_size
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._readers = {}
+        self._out = None
+        # the till and the receipts/journal commands may append at the same time; appends hold this lock
+        self._lock_handle = open(os.path.join(directory, 'append.lock'), 'a+b')
+        self._index = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self._index.execute('PRAGMA journal_mode=WAL')
+        self._index.execute('''
+            CREATE TABLE IF NOT EXISTS receipts (
+                sale_id INTEGER PRIMARY KEY,
+                sale_time TEXT NOT NULL,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            )
+        ''')
+        self._index.execute('CREATE INDEX IF NOT EXISTS idx_receipts_time ON receipts(sale_time)')
+        self._index.commit()
+        self._segment = max(self._segments(), default=1)
+
+    def _segments(self):
+        out = []
+        for path in glob.glob(os.path.join(self.directory, 'segment-*.log')):
+            m = re.search(r'segment-(\d+)\.log$', path)
+            if m:
+                out.append(int(m.group(1)))
+        return sorted(out)
+
+    def _segment_path(self, n):
+        return os.path.join(self.directory, f'segment-{n:06d}.log')
+
+    def _writer(self):
+        # called with the append lock held: another process may have moved on to a newer segment
+        # or written past our position, so find the real end before taking an offset
+        last = max(self._segments(), default=self._segment)
+        if self._out is not None and last != self._segment:
+            self._out.close()
+            self._out = None
+        self._segment = max(self._segment, last)
+        if self._out is None:
+            self._out = open(self._segment_path(self._segment), 'ab')
+        self._out.seek(0, os.SEEK_END)
+        if self._out.tell() >= self.segment_size:
+            self._out.close()
+            self._segment += 1
+            self._out = open(self._segment_path(self._segment), 'ab')
+        return self._out
+
+    def _encode(self, sale_id, text):
+        payload = text.encode('utf-8')
+        flags = 0
+        if self.compress:
+            payload, flags = zlib.compress(payload, 6), FLAG_ZLIB
+        return HEADER.pack(MAGIC, flags, sale_id, len(payload), zlib.crc32(payload)) + payload
+
+    def append(self, sale_id, sale_time, text):
+        return self.append_many([(sale_id, sale_time, text)])
+
+    def append_many(self, receipts):
+        receipts = list(receipts)
+        if not receipts:
+            return 0
+        with self._lock:
+            _lock_file(self._lock_handle)
+            try:
+                rows = []
+                out = self._writer()
+                for sale_id, sale_time, text in receipts:
+                    if out.tell() >= self.segment_size:
+                        out = self._writer()
+                    record = self._encode(sale_id, text)
+                    offset = out.tell()
+                    out.write(record)
+                    rows.append((sale_id, sale_time, self._segment, offset, len(record)))
+                out.flush()
+                if self.fsync:
+                    os.fsync(out.fileno())
+                self._index.executemany('INSERT OR REPLACE INTO receipts VALUES (?,?,?,?,?)', rows)
+                self._index.commit()
+            finally:
+                _unlock_file(self._lock_handle)
+            return len(rows)
+
+    def _read(self, segment, offset, length):
+        f = self._readers.get(segment)
+        if f is None:
+            f = self._readers[segment] = open(self._segment_path(segment), 'rb')
+        if self._out is not None:
+            self._out.flush()
+        f.seek(offset)
+        return f.read(length)
+
+    def _decode(self, record, expected=None):
+        if len(record) < HEADER.size:
+            raise CorruptReceipt(f"truncated receipt record for sale {expected}")
+        magic, flags, sale_id, size, crc = HEADER.unpack_from(record)
+        payload = record[HEADER.size:HEADER.size + size]
+        if magic != MAGIC or len(payload) != size or zlib.crc32(payload) != crc:
+            raise CorruptReceipt(f"bad receipt record for sale {sale_id}")
+        if expected is not None and sale_id != expected:
+            raise CorruptReceipt(f"index points sale {expected} at the record of sale {sale_id}")
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        return sale_id, payload.decode('utf-8')
+
+    def get(self, sale_id):
+        with self._lock:
+            loc = self._index.execute(
+                'SELECT segment, offset, length FROM receipts WHERE sale_id=?', (sale_id,)).fetchone()
+            if loc is None:
+                return None
+            return self._decode(self._read(*loc), sale_id)[1]
+
+    def find(self, start, end, limit=None):
+        sql = 'SELECT sale_id, sale_time FROM receipts WHERE sale_time >= ? AND sale_time < ? ORDER BY sale_time'
+        params = [start, end]
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            return self._index.execute(sql, params).fetchall()
+
+    def __contains__(self, sale_id):
+        with self._lock:
+            return self._index.execute('SELECT 1 FROM receipts WHERE sale_id=?', (sale_id,)).fetchone() is not None
+
+    def reindex(self, sale_times=None):
+        # rebuild the offset index from the segments, e.g. after a crash between append and index update
+        with self._lock:
+            _lock_file(self._lock_handle)
+            try:
+                known = dict(self._index.execute('SELECT sale_id, sale_time FROM receipts'))
+                if sale_times:
+                    known.update(sale_times)
+                rows = []
+                for seg in self._segments():
+                    with open(self._segment_path(seg), 'rb') as f:
+                        data = f.read()
+                    pos = 0
+                    while pos + HEADER.size <= len(data):
+                        magic, flags, sale_id, size, crc = HEADER.unpack_from(data, pos)
+                        end = pos + HEADER.size + size
+                        if magic != MAGIC or end > len(data):
+                            break
+                        rows.append((sale_id, known.get(sale_id, ''), seg, pos, end - pos))
+                        pos = end
+                self._index.execute('DELETE FROM receipts')
+                self._index.executemany('INSERT OR REPLACE INTO receipts VALUES (?,?,?,?,?)', rows)
+                self._index.commit()
+            finally:
+                _unlock_file(self._lock_handle)
+            return len(rows)
+
+    def close(self):
+        with self._lock:
+            if self._out is not None:
+                self._out.close()
+                self._out = None
+            for f in self._readers.values():
+                f.close()
+            self._readers.clear()
+            self._index.close()
+            self._lock_handle.close()
+
+
+class ReceiptWriter:
+    def __init__(self, store, on_error=None):
+        self.store = store
+        self.on_error = on_error
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='receipt-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, sale_id, sale_time, text):
+        self._queue.put((sale_id, sale_time, text))
+
+    def submit_many(self, receipts):
+        for item in receipts:
+            self._queue.put(tuple(item))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write(batch)
+                    return
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self.store.append_many(batch)
+        except Exception as e:
+            if self.on_error:
+                self.on_error(e, batch)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+RENDER_CHUNK = 2000
+
+SELECT_LINES = '''
+    SELECT s.id, s.datetime, s.total, IFNULL(i.name, IFNULL(p.name, '(deleted)')), i.qty, i.subtotal
+    FROM sales s
+    JOIN sale_items i ON i.sale_id = s.id
+    LEFT JOIN products p ON p.id = i.product_id
+    WHERE s.id IN ({marks})
+    ORDER BY s.id, i.id
+'''
+
+
+def sale_ids(conn, start, end):
+    return [r[0] for r in conn.execute(
+        "SELECT id FROM sales WHERE datetime >= ? AND datetime < ? ORDER BY id", (start, end))]
+
+
+def load_sales(conn, ids, chunk_size=RENDER_CHUNK):
+    # one joined query per chunk of sales: [(sale_id, sale_time, total, [(name, qty, subtotal)...])]
+    for i in range(0, len(ids), chunk_size):
+        part = ids[i:i + chunk_size]
+        sales = {}
+        for sale_id, sale_time, total, name, qty, subtotal in conn.execute(
+                SELECT_LINES.format(marks=','.join('?' * len(part))), part):
+            sale = sales.get(sale_id)
+            if sale is None:
+                sale = sales[sale_id] = (sale_id, sale_time, total, [])
+            sale[3].append((name, qty, subtotal))
+        yield list(sales.values())
+
+
+def render_sales(sales):
+    # module level so that a process pool can pickle it
+    return [(sale_id, sale_time, format_receipt(sale_time, total, items)) for sale_id, sale_time, total, items in sales]
+
+
+def rebuild_receipts(conn, ids, workers=None, chunk_size=RENDER_CHUNK):
+    # yields lists of (sale_id, sale_time, text), chunk by chunk, in sale id order
+    chunks = load_sales(conn, list(ids), chunk_size)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for sales in chunks:
+            yield render_sales(sales)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for sales in chunks:
+            pending.append(pool.submit(render_sales, sales))
+            # keep only a few chunks in flight so memory stays flat on long ranges
+            if len(pending) > 2 * workers:
+                yield pending.pop(0).result()
+        for fut in pending:
+            yield fut.result()
+
+
+TIME_LINE = re.compile(r'^Time: (.+)$', re.M)
+TOTAL_LINE = re.compile(r'TOTAL\s+Rp([\d,]+)')
+
+
+def migrate_text_receipts(store, conn, receipt_dir, delete=False):
+    migrated, unmatched = 0, []
+    paths = sorted(glob.glob(os.path.join(receipt_dir, 'receipt_*.txt')))
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            text = f.read().rstrip('\n')
+        t, total = TIME_LINE.search(text), TOTAL_LINE.search(text)
+        if not t or not total:
+            unmatched.append(path)
+            continue
+        sale_time, total = t.group(1).strip(), int(total.group(1).replace(',', ''))
+        candidates = conn.execute('SELECT id FROM sales WHERE datetime=? AND total=? ORDER BY id',
+                                  (sale_time, total)).fetchall()
+        sale_id = next((r[0] for r in candidates if r[0] not in store), None)
+        if sale_id is None:
+            unmatched.append(path)
+            continue
+        store.append(sale_id, sale_time, text)
+        migrated += 1
+        if delete:
+            os.remove(path)
+    return migrated, unmatched
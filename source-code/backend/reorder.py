@@ -0,0 +1,155 @@
+import heapq
+
+from db import data_version
+
+SCHEMA = [
+    # products at or below their reorder level; kept by triggers so nothing ever scans the catalog for it
+    '''
+    CREATE TABLE IF NOT EXISTS low_stock (
+        product_id INTEGER PRIMARY KEY,
+        stock INTEGER NOT NULL,
+        reorder_level INTEGER NOT NULL,
+        urgency REAL NOT NULL,
+        since TEXT NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_low_stock_urgency ON low_stock(urgency, product_id)",
+]
+
+BELOW = "{t}.reorder_level IS NOT NULL AND {t}.stock <= {t}.reorder_level"
+UPSERT = '''INSERT INTO low_stock (product_id, stock, reorder_level, urgency, since)
+            VALUES (new.id, new.stock, new.reorder_level,
+                    MAX(new.stock, 0) * 1.0 / MAX(new.reorder_level, 1), datetime('now', 'localtime'))
+            ON CONFLICT(product_id) DO UPDATE SET stock = excluded.stock, reorder_level = excluded.reorder_level,
+                                                  urgency = excluded.urgency'''
+
+TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS low_stock_ai AFTER INSERT ON products WHEN {BELOW.format(t='new')} BEGIN
+        {UPSERT};
+    END''',
+    # checkout updates stock on every sale; only products with a reorder level get past the WHEN
+    f'''CREATE TRIGGER IF NOT EXISTS low_stock_au_below AFTER UPDATE OF stock, reorder_level ON products
+    WHEN {BELOW.format(t='new')} AND (old.stock IS NOT new.stock OR old.reorder_level IS NOT new.reorder_level) BEGIN
+        {UPSERT};
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS low_stock_au_ok AFTER UPDATE OF stock, reorder_level ON products
+    WHEN {BELOW.format(t='old')} AND NOT ({BELOW.format(t='new')}) BEGIN
+        DELETE FROM low_stock WHERE product_id = old.id;
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS low_stock_ad AFTER DELETE ON products WHEN {BELOW.format(t='old')} BEGIN
+        DELETE FROM low_stock WHERE product_id = old.id;
+    END''',
+]
+
+SELECT_LOW = '''SELECT l.product_id, p.sku, p.name, l.stock, l.reorder_level, l.urgency, l.since
+    FROM low_stock l JOIN products p ON p.id = l.product_id'''
+
+
+def ensure_schema(conn):
+    for sql in SCHEMA + TRIGGERS:
+        conn.execute(sql)
+
+
+def rebuild(cur):
+    cur.execute("DELETE FROM low_stock")
+    cur.execute(f'''
+        INSERT INTO low_stock (product_id, stock, reorder_level, urgency, since)
+        SELECT id, stock, reorder_level, MAX(stock, 0) * 1.0 / MAX(reorder_level, 1), datetime('now', 'localtime')
+        FROM products WHERE {BELOW.format(t='products')}
+    ''')
+    return cur.rowcount
+
+
+def report(conn, limit=None):
+    sql = SELECT_LOW + " ORDER BY l.urgency, l.product_id"
+    if limit:
+        return conn.execute(sql + " LIMIT ?", (limit,)).fetchall()
+    return conn.execute(sql).fetchall()
+
+
+def set_level(conn, level, skus=None, prefix=None, category=None):
+    # one UPDATE for the whole group; the triggers move products in and out of low_stock
+    if skus:
+        where, params = f"sku IN ({','.join('?' * len(skus))})", list(skus)
+    elif prefix:
+        where, params = "sku >= ? AND sku < ? || char(1114111)", [prefix, prefix]
+    elif category:
+        where, params = "category = ?", [category]
+    else:
+        raise ValueError("Choose the products by SKU, SKU prefix or category")
+    cur = conn.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        cur.execute(f"UPDATE products SET reorder_level = ? WHERE {where}", [level] + params)
+        changed = cur.rowcount
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return changed
+
+
+class ReorderAlerts:
+    # the low_stock rows in a heap ordered by urgency (stock / reorder level), most urgent first
+    def __init__(self, conn, watch=None):
+        self.conn = conn
+        self.watch = watch or (lambda: data_version(conn))
+        self._items = {}
+        self._heap = []
+        self._version = self._data_version()
+        self.reload()
+
+    def _data_version(self):
+        return self.watch()
+
+    def __len__(self):
+        return len(self._items)
+
+    def check(self):
+        version = self._data_version()
+        if version == self._version:
+            return False
+        self._version = version
+        self.reload()
+        return True
+
+    def reload(self):
+        self._items = {r[0]: tuple(r) for r in self.conn.execute(SELECT_LOW)}
+        self._heap = [(row[5], pid, row) for pid, row in self._items.items()]
+        heapq.heapify(self._heap)
+
+    def refresh(self, ids):
+        ids = list(ids)
+        if not ids:
+            return
+        found = {}
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            found.update((r[0], tuple(r)) for r in self.conn.execute(
+                f"{SELECT_LOW} WHERE l.product_id IN ({','.join('?' * len(part))})", part))
+        for pid in ids:
+            row = found.get(pid)
+            if row is None:
+                self._items.pop(pid, None)
+            else:
+                self._items[pid] = row
+                heapq.heappush(self._heap, (row[5], pid, row))
+        # replaced and removed rows stay in the heap until they surface; compact once they dominate
+        if len(self._heap) > 2 * len(self._items) + 64:
+            self._heap = [e for e in self._heap if self._items.get(e[1]) is e[2]]
+            heapq.heapify(self._heap)
+
+    def _live(self, entry):
+        return self._items.get(entry[1]) is entry[2]
+
+    def top(self, n=20):
+        heap = self._heap
+        while heap and not self._live(heap[0]):
+            heapq.heappop(heap)
+        out = []
+        for entry in heapq.nsmallest(n + len(heap) - len(self._items), heap):
+            if self._live(entry):
+                out.append(entry[2])
+                if len(out) == n:
+                    break
+        return out
@@ -0,0 +1,136 @@
+from datetime import date, timedelta
+
+SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS idx_sales_datetime ON sales(datetime)",
+    "CREATE INDEX IF NOT EXISTS idx_sale_items_sale ON sale_items(sale_id)",
+    "CREATE INDEX IF NOT EXISTS idx_sale_items_product ON sale_items(product_id)",
+    '''
+    CREATE TABLE IF NOT EXISTS daily_sales (
+        day TEXT PRIMARY KEY,
+        sales_count INTEGER NOT NULL,
+        items INTEGER NOT NULL,
+        revenue INTEGER NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS daily_product_sales (
+        day TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        units INTEGER NOT NULL,
+        revenue INTEGER NOT NULL,
+        PRIMARY KEY (day, product_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS hourly_baskets (
+        day TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        baskets INTEGER NOT NULL,
+        items INTEGER NOT NULL,
+        revenue INTEGER NOT NULL,
+        PRIMARY KEY (day, hour)
+    ) WITHOUT ROWID
+    ''',
+]
+
+
+def ensure_schema(conn):
+    for sql in SCHEMA:
+        conn.execute(sql)
+
+
+def record_sale(cur, sale_time, total, lines):
+    day, hour = sale_time[:10], int(sale_time[11:13])
+    lines = list(lines)
+    items = sum(qty for _, qty, _ in lines)
+    cur.execute('''
+        INSERT INTO daily_sales (day, sales_count, items, revenue) VALUES (?, 1, ?, ?)
+        ON CONFLICT(day) DO UPDATE SET sales_count = sales_count + 1,
+            items = items + excluded.items, revenue = revenue + excluded.revenue
+    ''', (day, items, total))
+    cur.execute('''
+        INSERT INTO hourly_baskets (day, hour, baskets, items, revenue) VALUES (?, ?, 1, ?, ?)
+        ON CONFLICT(day, hour) DO UPDATE SET baskets = baskets + 1,
+            items = items + excluded.items, revenue = revenue + excluded.revenue
+    ''', (day, hour, items, total))
+    cur.executemany('''
+        INSERT INTO daily_product_sales (day, product_id, units, revenue) VALUES (?, ?, ?, ?)
+        ON CONFLICT(day, product_id) DO UPDATE SET
+            units = units + excluded.units, revenue = revenue + excluded.revenue
+    ''', [(day, pid, qty, subtotal) for pid, qty, subtotal in lines])
+
+
+def fill_summaries(cur):
+    cur.execute("DELETE FROM daily_sales")
+    cur.execute("DELETE FROM daily_product_sales")
+    cur.execute("DELETE FROM hourly_baskets")
+    cur.execute('''
+        INSERT INTO daily_sales (day, sales_count, items, revenue)
+        SELECT substr(s.datetime, 1, 10), COUNT(*), SUM(IFNULL(i.items, 0)), SUM(s.total)
+        FROM sales s
+        LEFT JOIN (SELECT sale_id, SUM(qty) AS items FROM sale_items GROUP BY sale_id) i ON i.sale_id = s.id
+        GROUP BY 1
+    ''')
+    cur.execute('''
+        INSERT INTO hourly_baskets (day, hour, baskets, items, revenue)
+        SELECT substr(s.datetime, 1, 10), CAST(substr(s.datetime, 12, 2) AS INTEGER),
+               COUNT(*), SUM(IFNULL(i.items, 0)), SUM(s.total)
+        FROM sales s
+        LEFT JOIN (SELECT sale_id, SUM(qty) AS items FROM sale_items GROUP BY sale_id) i ON i.sale_id = s.id
+        GROUP BY 1, 2
+    ''')
+    cur.execute('''
+        INSERT INTO daily_product_sales (day, product_id, units, revenue)
+        SELECT substr(s.datetime, 1, 10), i.product_id, SUM(i.qty), SUM(i.subtotal)
+        FROM sale_items i JOIN sales s ON s.id = i.sale_id
+        GROUP BY 1, 2
+    ''')
+
+
+def rebuild(conn):
+    cur = conn.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        fill_summaries(cur)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return conn.execute("SELECT COUNT(*) FROM daily_sales").fetchone()[0]
+
+
+def default_range(days=7):
+    end = date.today()
+    return (end - timedelta(days=days - 1)).isoformat(), end.isoformat()
+
+
+def daily_report(conn, start, end):
+    return conn.execute('''
+        SELECT day, sales_count, items, revenue FROM daily_sales
+        WHERE day BETWEEN ? AND ? ORDER BY day
+    ''', (start, end)).fetchall()
+
+
+def top_products(conn, start, end, limit=20):
+    # sku and name as frozen on the product's last sale line in the range, not the current product row
+    return conn.execute('''
+        SELECT t.product_id, IFNULL(i.sku, '?') AS sku, IFNULL(i.name, '(deleted)') AS name,
+               t.units, t.revenue
+        FROM (SELECT product_id, SUM(units) AS units, SUM(revenue) AS revenue
+              FROM daily_product_sales WHERE day BETWEEN ? AND ?
+              GROUP BY product_id ORDER BY revenue DESC LIMIT ?) t
+        LEFT JOIN sale_items i ON i.id = (
+            SELECT l.id FROM sale_items l JOIN sales s ON s.id = l.sale_id
+            WHERE l.product_id = t.product_id AND s.datetime < ? || '~'
+            ORDER BY l.id DESC LIMIT 1)
+        ORDER BY t.revenue DESC
+    ''', (start, end, limit, end)).fetchall()
+
+
+def hourly_report(conn, start, end):
+    return conn.execute('''
+        SELECT hour, SUM(baskets) AS baskets, SUM(items) AS items, SUM(revenue) AS revenue,
+               SUM(items) * 1.0 / SUM(baskets) AS avg_items
+        FROM hourly_baskets WHERE day BETWEEN ? AND ?
+        GROUP BY hour ORDER BY hour
+    ''', (start, end)).fetchall()
@@ -0,0 +1,350 @@
+import glob
+import json
+import os
+import queue
+import re
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from checkout_service import plan_sale, write_sale, read_stock, merge_lines
+from db import connect, run_write, is_busy_error, data_version
+from instrument import timed
+
+SYNC_MODES = ('always', 'batch')
+# always: fsync every sale before the cashier sees it; batch: fsync once per group; off: no journal
+MODE = os.environ.get('CASHIER_JOURNAL', 'batch').lower()
+OVERSOLD_POLICIES = ('oversell', 'partial')
+OVERSOLD_POLICY = os.environ.get('CASHIER_JOURNAL_OVERSOLD', 'oversell').lower()
+SEGMENT_SIZE = 4 * 1024 * 1024
+MAX_BATCH = 200
+GROUP_WINDOW_S = 0.02
+RETRY_DELAY_S = 1.0
+MAGIC = b'SALE'
+HEADER = struct.Struct('<4sqII')  # magic, seq, payload length, crc32
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS journal_state (
+        journal_id TEXT PRIMARY KEY,
+        applied_seq INTEGER NOT NULL
+    )
+    ''',
+]
+
+
+def ensure_schema(conn):
+    for sql in SCHEMA:
+        conn.execute(sql)
+
+
+class JournalInUse(Exception):
+    pass
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def applied_seq(conn, journal_id):
+    row = conn.execute("SELECT applied_seq FROM journal_state WHERE journal_id = ?", (journal_id,)).fetchone()
+    return row[0] if row else 0
+
+
+class SaleJournal:
+    # append-only log of finished sales that are not necessarily in the database yet;
+    # journal_state.applied_seq, written in the same transaction as the sales, says how far it got
+    def __init__(self, directory, sync='batch', segment_size=SEGMENT_SIZE):
+        if sync not in SYNC_MODES:
+            raise ValueError(f"Unknown journal sync mode: {sync}")
+        self.directory = directory
+        self.sync_mode = sync
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+        # two processes on one directory would hand out the same seq numbers and one lane's sales
+        # would be skipped as already applied, so the directory belongs to one process at a time
+        self._lock_handle = open(os.path.join(directory, 'journal.lock'), 'a+b')
+        try:
+            _lock_file(self._lock_handle)
+        except OSError:
+            self._lock_handle.close()
+            raise JournalInUse(f"The sale journal in {directory} is in use by another process. "
+                               "Give every lane its own CASHIER_JOURNAL_DIR.") from None
+        self.journal_id = self._load_id()
+        self._lock = threading.Lock()
+        self._out = None
+        self._dirty = False
+        self._last_seq = {}  # segment -> last seq in it
+        for seg in self._segments():
+            self._last_seq[seg] = self._scan(seg, truncate=True)
+        self._segment = max(self._last_seq, default=1)
+        self.seq = max(self._last_seq.values(), default=0)
+
+    def _load_id(self):
+        path = os.path.join(self.directory, 'journal.id')
+        try:
+            with open(path, encoding='utf-8') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            journal_id = uuid.uuid4().hex
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(journal_id)
+            return journal_id
+
+    def _segments(self):
+        out = []
+        for path in glob.glob(os.path.join(self.directory, 'sales-*.log')):
+            m = re.search(r'sales-(\d+)\.log$', path)
+            if m:
+                out.append(int(m.group(1)))
+        return sorted(out)
+
+    def _segment_path(self, n):
+        return os.path.join(self.directory, f'sales-{n:06d}.log')
+
+    def _records(self, seg):
+        with open(self._segment_path(seg), 'rb') as f:
+            data = f.read()
+        pos = 0
+        while pos + HEADER.size <= len(data):
+            magic, seq, size, crc = HEADER.unpack_from(data, pos)
+            payload = data[pos + HEADER.size:pos + HEADER.size + size]
+            if magic != MAGIC or len(payload) != size or zlib.crc32(payload) != crc:
+                break
+            pos += HEADER.size + size
+            yield pos, seq, payload
+
+    def _scan(self, seg, truncate=False):
+        # a crash mid-append leaves a torn record at the end; cut it off so new records follow good ones
+        end, last = 0, 0
+        for end, last, _ in self._records(seg):
+            pass
+        if truncate and end != os.path.getsize(self._segment_path(seg)):
+            with open(self._segment_path(seg), 'r+b') as f:
+                f.truncate(end)
+        return last
+
+    def _writer(self):
+        if self._out is not None and self._out.tell() >= self.segment_size:
+            self._sync()
+            self._out.close()
+            self._out = None
+            self._segment += 1
+        if self._out is None:
+            self._out = open(self._segment_path(self._segment), 'ab')
+        return self._out
+
+    def append(self, entry):
+        payload = json.dumps(entry, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            out = self._writer()
+            seq = self.seq + 1
+            out.write(HEADER.pack(MAGIC, seq, len(payload), zlib.crc32(payload)) + payload)
+            out.flush()
+            self.seq = seq
+            self._last_seq[self._segment] = seq
+            self._dirty = True
+            if self.sync_mode == 'always':
+                self._sync()
+        return seq
+
+    def _sync(self):
+        if self._dirty and self._out is not None:
+            os.fsync(self._out.fileno())
+        self._dirty = False
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def entries_after(self, seq):
+        with self._lock:
+            if self._out is not None:
+                self._out.flush()
+            segments = [s for s, last in sorted(self._last_seq.items()) if last > seq]
+        out = []
+        for seg in segments:
+            for _, n, payload in self._records(seg):
+                if n > seq:
+                    out.append((n, json.loads(payload)))
+        return out
+
+    def compact(self, applied):
+        # whole segments that are in the database already are not needed for recovery
+        with self._lock:
+            for seg, last in list(self._last_seq.items()):
+                if seg != self._segment and last <= applied:
+                    os.remove(self._segment_path(seg))
+                    del self._last_seq[seg]
+
+    def close(self):
+        with self._lock:
+            if self._out is not None:
+                self._sync()
+                self._out.close()
+                self._out = None
+            if self._lock_handle is not None:
+                _unlock_file(self._lock_handle)
+                self._lock_handle.close()
+                self._lock_handle = None
+
+
+def make_entry(result, receipt=None):
+    return {'time': result.sale_time, 'tax_pct': result.tax_pct,
+            'lines': [[ln.product_id, ln.filled, ln.price, ln.deal, ln.sku, ln.name] for ln in result.sold],
+            'receipt': receipt}
+
+
+@timed('journal.apply', category='job')
+def apply_entries(conn, journal_id, entries, policy=OVERSOLD_POLICY):
+    # one transaction for the whole group: the sales and the new watermark commit together
+    if policy not in OVERSOLD_POLICIES:
+        raise ValueError(f"Unknown oversold policy: {policy}")
+    if conn.in_transaction:
+        raise sqlite3.OperationalError("journal replay needs a connection without an open transaction")
+    cur = conn.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        done = applied_seq(cur, journal_id)
+        applied = []
+        for seq, entry in entries:
+            if seq <= done:
+                continue
+            merged = merge_lines(entry['lines'])
+            result = plan_sale(merged, read_stock(cur, merged), entry['tax_pct'], policy, entry['time'])
+            if result.sold:
+                write_sale(cur, result, policy)
+            applied.append((seq, entry, result))
+            done = seq
+        cur.execute("INSERT OR REPLACE INTO journal_state (journal_id, applied_seq) VALUES (?,?)",
+                    (journal_id, done))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return applied
+
+
+def replay(conn, journal, policy=OVERSOLD_POLICY):
+    pending = journal.entries_after(applied_seq(conn, journal.journal_id))
+    applied = []
+    for i in range(0, len(pending), MAX_BATCH):
+        applied += run_write(conn, apply_entries, journal.journal_id, pending[i:i + MAX_BATCH], policy)
+    journal.compact(applied_seq(conn, journal.journal_id))
+    return applied
+
+
+class JournalWriter:
+    # moves journaled sales into the database in groups, off the UI thread
+    def __init__(self, journal, db_path, on_applied=None, on_error=None, policy=OVERSOLD_POLICY):
+        self.journal = journal
+        self.db_path = db_path
+        self.on_applied = on_applied
+        self.on_error = on_error
+        self.policy = policy
+        self.failed = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        # the UI reads data_version on this connection too, see data_version()
+        self._conn = connect(db_path, check_same_thread=False)
+        self._conn_lock = threading.Lock()
+        self._pending = {}  # seq -> entry, journaled but not committed yet
+        self._thread = threading.Thread(target=self._run, name='journal-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, entry):
+        with self._lock:
+            seq = self.journal.append(entry)
+            self._pending[seq] = entry
+        self._queue.put(seq)
+        return seq
+
+    def pending_qty(self):
+        out = {}
+        with self._lock:
+            for entry in self._pending.values():
+                for pid, qty, *_ in entry['lines']:
+                    out[pid] = out.get(pid, 0) + qty
+        return out
+
+    def data_version(self):
+        # moves for every commit except the groups written here; None while a group is being written
+        if not self._conn_lock.acquire(blocking=False):
+            return None
+        try:
+            return data_version(self._conn) if self._conn is not None else None
+        finally:
+            self._conn_lock.release()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            seqs = [self._queue.get()]
+            deadline = time.perf_counter() + GROUP_WINDOW_S
+            while len(seqs) < MAX_BATCH:
+                try:
+                    seqs.append(self._queue.get(timeout=max(0.0, deadline - time.perf_counter())))
+                except queue.Empty:
+                    break
+            if None in seqs:
+                stop = True
+                seqs = [s for s in seqs if s is not None]
+            if seqs:
+                self._apply()
+
+    def _apply(self):
+        # entries must reach the database in journal order, so after a hard error
+        # nothing more is applied until a restart replays the journal
+        while self.failed is None:
+            with self._lock:
+                batch = sorted(self._pending.items())[:MAX_BATCH]
+            if not batch:
+                return
+            if self.journal.sync_mode == 'batch':
+                self.journal.sync()
+            try:
+                with self._conn_lock:
+                    applied = run_write(self._conn, apply_entries, self.journal.journal_id, batch, self.policy)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(e, batch)
+                if not is_busy_error(e):
+                    self.failed = e
+                    return
+                time.sleep(RETRY_DELAY_S)
+                continue
+            with self._lock:
+                for seq, _ in batch:
+                    self._pending.pop(seq, None)
+            # full segments are dropped as soon as they are in the database, not only at start-up
+            self.journal.compact(batch[-1][0])
+            if self.on_applied:
+                self.on_applied(applied)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        with self._conn_lock:
+            self._conn.close()
+            self._conn = None
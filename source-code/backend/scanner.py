@@ -0,0 +1,18 @@
+import re
+
+SCAN_PATTERN = re.compile(r'^\s*(?:(\d+)\s*\*\s*)?(\S+)\s*$')
+MAX_SCAN_QTY = 9999
+
+
+class ScanError(ValueError):
+    pass
+
+
+def parse_scan(text):
+    m = SCAN_PATTERN.match(text)
+    if not m:
+        raise ScanError(f"Cannot read scan: {text!r}")
+    qty = int(m.group(1)) if m.group(1) else 1
+    if not 0 < qty <= MAX_SCAN_QTY:
+        raise ScanError(f"Invalid quantity: {qty}")
+    return qty, m.group(2)
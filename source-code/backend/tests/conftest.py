@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connect  # noqa: E402
+import migrations  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'cashier.db')
+    conn = connect(path)
+    migrations.migrate(conn)
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    # a migrated database with the five sample products, ids 1..5
+    conn = connect(db_path)
+    yield conn
+    conn.close()
+
@@ -0,0 +1,62 @@
+from cart import Cart, Product, INSERT, UPDATE, DELETE, CLEAR
+
+MIZONE = Product((1, 'E026', 'Mizone', 3000, 20))
+GUM = Product((2, 'E027', 'Bubble Gum', 4000, 15))
+
+
+def kinds(changes):
+    return [(kind, pid) for kind, pid, _ in changes]
+
+
+def test_add_inserts_then_updates():
+    cart = Cart()
+    assert kinds(cart.add(MIZONE, 2)) == [(INSERT, 1)]
+    assert kinds(cart.add(MIZONE, 1)) == [(UPDATE, 1)]
+    assert cart.get(1).qty == 3
+    assert cart.subtotal == 9000
+    assert cart.add(GUM, 0) == [] and 2 not in cart
+
+
+def test_set_qty_and_remove():
+    cart = Cart()
+    cart.add(MIZONE, 2)
+    cart.add(GUM, 1)
+    assert cart.set_qty(1, 2) == []
+    assert kinds(cart.set_qty(1, 5)) == [(UPDATE, 1)]
+    assert kinds(cart.set_qty(2, 0)) == [(DELETE, 2)]
+    assert cart.set_qty(42, 1) == [] and cart.remove(42) == []
+    assert len(cart) == 1 and cart.subtotal == 15000
+
+
+def test_clear():
+    cart = Cart()
+    assert cart.clear() == []
+    cart.add(MIZONE, 1)
+    assert kinds(cart.clear()) == [(CLEAR, None)]
+    assert not cart and cart.subtotal == 0
+
+
+def test_totals_with_tax():
+    cart = Cart(tax_pct=11.0)
+    cart.add(MIZONE, 3)
+    cart.add(GUM, 1)
+    assert cart.subtotal == 13000
+    assert cart.total == 14430
+    assert cart.tax == 1430
+
+
+def test_subtotal_follows_multi_buy_deals():
+    deal = Product((3, 'E028', 'Sunpride Banana', 5000, 10), price=4500, deal=(3, 12000))
+    cart = Cart()
+    cart.add(deal, 2)
+    assert cart.subtotal == 9000
+    cart.add(deal, 2)
+    assert cart.subtotal == 12000 + 4500
+    cart.set_qty(3, 6)
+    assert cart.subtotal == 24000
+
+
+def test_lines_carry_what_the_till_showed():
+    cart = Cart()
+    cart.add(MIZONE, 2)
+    assert cart.lines() == [(1, 2, 3000, None, 'E026', 'Mizone')]
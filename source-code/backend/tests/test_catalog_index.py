@@ -0,0 +1,74 @@
+from catalog_index import CatalogIndex, changes_since
+
+
+def make_index():
+    idx = CatalogIndex()
+    for row in [(1, 'E026', 'Mizone', 3000, 20),
+                (2, 'E027', 'Bubble Gum', 4000, 15),
+                (3, 'E028', 'Sunpride Banana', 5000, 10),
+                (4, 'B051', 'Crackers', 12000, 30),
+                (5, 'BAN1', 'Banana Chips', 8000, 5)]:
+        idx.upsert(row)
+    return idx
+
+
+def ids(rows):
+    return [r[0] for r in rows]
+
+
+def test_lookup_sku_ignores_case_and_spaces():
+    idx = make_index()
+    assert idx.lookup_sku(' e026 ')[0] == 1
+    assert idx.lookup_sku('X999') is None
+
+
+def test_search_ranks_sku_then_name_then_word_then_substring():
+    idx = make_index()
+    assert ids(idx.search('ban')) == [5, 3]
+    assert ids(idx.search('e02')) == [2, 1, 3]
+    assert ids(idx.search('anan')) == [5, 3]
+    assert idx.search('  ') == []
+
+
+def test_search_matches_every_term():
+    idx = make_index()
+    assert ids(idx.search('sunpride ban')) == [3]
+    assert ids(idx.search('banana chi')) == [5]
+
+
+def test_search_respects_limit():
+    idx = make_index()
+    assert len(idx.search('e', limit=2)) == 2
+
+
+def test_upsert_replaces_old_sku_and_name():
+    idx = make_index()
+    idx.upsert((1, 'E999', 'Pocari Sweat', 6000, 3))
+    assert idx.lookup_sku('E026') is None
+    assert idx.lookup_sku('e999')[2] == 'Pocari Sweat'
+    assert idx.search('mizone') == []
+    assert ids(idx.search('pocari')) == [1]
+    assert len(idx) == 5
+
+
+def test_remove_drops_every_entry():
+    idx = make_index()
+    idx.remove(3)
+    idx.remove(42)
+    assert idx.get(3) is None
+    assert idx.lookup_sku('E028') is None
+    assert ids(idx.search('banana')) == [5]
+
+
+def test_from_db_and_changes_since(conn):
+    idx = CatalogIndex.from_db(conn)
+    assert len(idx) == 5
+    assert idx.lookup_sku('b051')[2] == 'Crackers'
+    conn.execute("UPDATE products SET stock = stock - 1 WHERE id = 1")
+    conn.execute("UPDATE products SET name = 'Cream Crackers' WHERE id = 4")
+    conn.execute("DELETE FROM products WHERE id = 5")
+    conn.commit()
+    seq, changed = changes_since(conn, idx.seq)
+    assert sorted(changed) == [4, 5]
+    assert changes_since(conn, seq) == (seq, [])
+    assert changes_since(conn, idx.seq, limit=1) == (None, None)
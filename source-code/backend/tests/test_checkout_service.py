@@ -0,0 +1,109 @@
+import sqlite3
+
+import pytest
+
+from checkout_service import (commit_sale, merge_lines, plan_sale, read_stock, write_sale, calculate_total,
+                              StockConflict)
+
+NOW = '2026-10-17 10:00:00'
+
+
+def stock(conn, pid):
+    return conn.execute("SELECT stock FROM products WHERE id = ?", (pid,)).fetchone()[0]
+
+
+def test_merge_lines_adds_up_repeated_products():
+    merged = merge_lines([(1, 2, 3000), (2, 0, 4000), (1, 1, 3000, None, 'E026', 'Mizone'), (3, 3, 5000, (3, 12000))])
+    assert merged == {1: [3, 3000, None, None, None], 3: [3, 5000, (3, 12000), None, None]}
+
+
+@pytest.mark.parametrize('policy, filled', [('reject', [0, 5]), ('partial', [10, 5]), ('oversell', [12, 5])])
+def test_plan_sale_policies(policy, filled):
+    merged = {1: [12, 1000, None, 'A', 'a'], 2: [5, 2000, None, 'B', 'b']}
+    result = plan_sale(merged, {1: 10, 2: 7}, 10.0, policy, NOW)
+    assert [ln.filled for ln in result.lines] == filled
+    assert result.subtotal == filled[0] * 1000 + filled[1] * 2000
+    assert result.total == calculate_total(result.subtotal, 10.0)
+    assert [ln.product_id for ln in result.shortages] == ([] if policy == 'oversell' else [1])
+
+
+def test_plan_sale_treats_negative_stock_as_none():
+    result = plan_sale({1: [1, 1000, None, None, None]}, {1: -3}, 0, 'partial', NOW)
+    assert result.lines[0].available == 0 and not result.sold
+
+
+def test_commit_sale_writes_sale_lines_stock_and_ledger(conn):
+    result = commit_sale(conn, [(1, 2, 3000, None, 'E026', 'Mizone'), (3, 3, 5000, (3, 12000))],
+                         tax_pct=11.0, now=NOW)
+    assert result.sale_id is not None and result.ok
+    assert result.subtotal == 2 * 3000 + 12000
+    assert conn.execute("SELECT total FROM sales WHERE id = ?", (result.sale_id,)).fetchone()[0] == result.total
+    lines = [tuple(r) for r in conn.execute(
+        "SELECT product_id, qty, subtotal, sku, name, price FROM sale_items WHERE sale_id = ? ORDER BY id",
+        (result.sale_id,))]
+    assert lines == [(1, 2, 6000, 'E026', 'Mizone', 3000), (3, 3, 12000, 'E028', 'Sunpride Banana', 5000)]
+    assert (stock(conn, 1), stock(conn, 3)) == (18, 7)
+    assert conn.execute("SELECT SUM(qty) FROM stock_movements WHERE kind = 'sale'").fetchone()[0] == -5
+    assert conn.execute("SELECT revenue FROM daily_sales").fetchone()[0] == result.total
+
+
+def test_reject_writes_nothing_when_short(conn):
+    result = commit_sale(conn, [(1, 21, 3000), (2, 1, 4000)], policy='reject', now=NOW)
+    assert result.sale_id is None and [ln.product_id for ln in result.shortages] == [1]
+    assert conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0] == 0
+    assert stock(conn, 1) == 20
+
+
+def test_partial_sells_what_is_left(conn):
+    result = commit_sale(conn, [(1, 25, 3000)], policy='partial', now=NOW)
+    assert result.sold[0].filled == 20 and result.sold[0].short == 5
+    assert stock(conn, 1) == 0
+
+
+def test_oversell_lets_stock_go_negative(conn):
+    commit_sale(conn, [(1, 25, 3000)], policy='oversell', now=NOW)
+    assert stock(conn, 1) == -5
+
+
+def test_write_sale_detects_stock_changed_after_planning(conn):
+    cur = conn.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    merged = merge_lines([(1, 15, 3000)])
+    result = plan_sale(merged, read_stock(cur, merged), 0, 'partial', NOW)
+    # another lane sold most of it in the meantime
+    cur.execute("UPDATE products SET stock = 10 WHERE id = 1")
+    with pytest.raises(StockConflict):
+        write_sale(cur, result, 'partial')
+    conn.rollback()
+    assert stock(conn, 1) == 20
+
+
+def test_oversell_ignores_stock_changed_after_planning(conn):
+    cur = conn.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    merged = merge_lines([(1, 15, 3000)])
+    result = plan_sale(merged, read_stock(cur, merged), 0, 'oversell', NOW)
+    cur.execute("UPDATE products SET stock = 10 WHERE id = 1")
+    write_sale(cur, result, 'oversell')
+    conn.commit()
+    assert stock(conn, 1) == -5
+
+
+def test_deleted_product_keeps_frozen_line(conn):
+    conn.execute("DELETE FROM products WHERE id = 2")
+    conn.commit()
+    result = commit_sale(conn, [(2, 1, 4000, None, 'E027', 'Bubble Gum')], policy='oversell', now=NOW)
+    row = conn.execute("SELECT sku, name, subtotal FROM sale_items WHERE sale_id = ?", (result.sale_id,)).fetchone()
+    assert tuple(row) == ('E027', 'Bubble Gum', 4000)
+
+
+def test_commit_sale_refuses_open_transaction(conn):
+    conn.execute("UPDATE products SET stock = stock WHERE id = 1")
+    with pytest.raises(sqlite3.OperationalError, match='transaction'):
+        commit_sale(conn, [(1, 1, 3000)], now=NOW)
+    conn.rollback()
+
+
+def test_unknown_policy(conn):
+    with pytest.raises(ValueError):
+        commit_sale(conn, [(1, 1, 3000)], policy='maybe')
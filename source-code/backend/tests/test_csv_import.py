@@ -0,0 +1,99 @@
+import pytest
+
+from csv_import import import_csv, parse_rows, ImportResult, ImportCancelled
+
+
+def write_csv(tmp_path, text, name='products.csv'):
+    path = tmp_path / name
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def stock_of(conn, sku):
+    row = conn.execute("SELECT price, stock FROM products WHERE sku = ?", (sku,)).fetchone()
+    return tuple(row) if row else None
+
+
+def movements(conn):
+    return [tuple(r) for r in conn.execute(
+        "SELECT p.sku, m.kind, m.qty FROM stock_movements m JOIN products p ON p.id = m.product_id ORDER BY m.id")]
+
+
+def test_parse_rows_reads_aliases_and_prices(tmp_path):
+    path = write_csv(tmp_path, 'Barcode,Product Name,Price,Qty,Min Stock\n'
+                               'X1, Tea ,"Rp12.500",4,2\n'
+                               '\n'
+                               'X2,Coffee,abc,1,\n'
+                               ',Nameless,100,1,\n')
+    result = ImportResult()
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(parse_rows(f, result))
+    assert rows == [('X1', 'Tea', 12500, 4, None, 2)]
+    assert result.rows == 3
+    assert [line for line, _ in result.errors] == [4, 5]
+
+
+def test_missing_required_column(conn, tmp_path):
+    path = write_csv(tmp_path, 'sku,price\nX1,100\n')
+    with pytest.raises(ValueError, match='name'):
+        import_csv(conn, path)
+    assert not conn.in_transaction
+
+
+def test_upsert_updates_and_counts_unchanged(conn, tmp_path):
+    path = write_csv(tmp_path, 'sku,name,price,stock\nE026,Mizone,3500,25\nE027,Bubble Gum,4000,15\nN1,New,100,3\n')
+    result = import_csv(conn, path, mode='upsert')
+    assert (result.rows, result.written, result.skipped) == (3, 2, 1)
+    assert stock_of(conn, 'E026') == (3500, 25)
+    assert stock_of(conn, 'N1') == (100, 3)
+    assert movements(conn) == [('E026', 'import', 5), ('N1', 'import', 3)]
+    again = import_csv(conn, path, mode='upsert')
+    assert (again.written, again.skipped) == (0, 3)
+
+
+def test_upsert_without_stock_column_keeps_stock(conn, tmp_path):
+    path = write_csv(tmp_path, 'sku,name,price\nB051,Crackers,12500\nE026,Mizone,3000\nN1,New,100\n')
+    result = import_csv(conn, path, mode='upsert')
+    assert stock_of(conn, 'B051') == (12500, 30)
+    assert stock_of(conn, 'E026') == (3000, 20)
+    assert stock_of(conn, 'N1') == (100, 0)
+    assert (result.written, result.skipped) == (2, 1)
+    assert movements(conn) == []
+
+
+def test_empty_stock_cell_keeps_stock(conn, tmp_path):
+    path = write_csv(tmp_path, 'sku,name,price,stock\nE026,Mizone,3000,\n')
+    import_csv(conn, path, mode='upsert')
+    assert stock_of(conn, 'E026') == (3000, 20)
+
+
+def test_skip_leaves_existing_products(conn, tmp_path):
+    path = write_csv(tmp_path, 'sku,name,price,stock\nE026,Other,1,1\nN1,New,100,3\n')
+    result = import_csv(conn, path, mode='skip')
+    assert (result.written, result.skipped) == (1, 1)
+    assert stock_of(conn, 'E026') == (3000, 20)
+    assert stock_of(conn, 'N1') == (100, 3)
+
+
+def test_insert_reports_duplicates_and_keeps_the_rest(conn, tmp_path):
+    path = write_csv(tmp_path, 'sku,name,price,stock\nN1,New,100,3\nE026,Dup,1,1\nN2,Newer,200,4\n')
+    result = import_csv(conn, path, mode='insert', chunk_size=10)
+    assert result.written == 2
+    assert len(result.errors) == 1 and result.errors[0][1].startswith('E026')
+    assert stock_of(conn, 'N2') == (200, 4)
+    assert conn.execute("SELECT name FROM products WHERE sku = 'E026'").fetchone()[0] == 'Mizone'
+
+
+def test_cancel_rolls_back_everything(conn, tmp_path):
+    import threading
+    path = write_csv(tmp_path, 'sku,name,price,stock\n' + ''.join(f'N{i},Item {i},100,1\n' for i in range(50)))
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(ImportCancelled):
+        import_csv(conn, path, chunk_size=10, cancel=cancel)
+    assert conn.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 5
+
+
+def test_unknown_mode(conn, tmp_path):
+    with pytest.raises(ValueError):
+        import_csv(conn, write_csv(tmp_path, 'sku,name,price\n'), mode='merge')
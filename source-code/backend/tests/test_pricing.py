@@ -0,0 +1,111 @@
+import pytest
+
+import pricing
+from pricing import line_total, PriceBook
+
+
+def effective(conn, pid):
+    row = conn.execute("SELECT price, deal_qty, deal_price FROM effective_prices WHERE product_id = ?",
+                       (pid,)).fetchone()
+    return tuple(row) if row else None
+
+
+@pytest.mark.parametrize('qty, deal, expected', [
+    (5, None, 5000),
+    (2, (3, 2500), 2000),
+    (3, (3, 2500), 2500),
+    (7, (3, 2500), 2 * 2500 + 1000),
+    (0, (3, 2500), 0),
+])
+def test_line_total(qty, deal, expected):
+    assert line_total(qty, 1000, deal) == expected
+
+
+def test_rule_kinds(conn):
+    pricing.add_rule(conn, 'sku', 'E026', 'percent', 10)
+    pricing.add_rule(conn, 'sku', 'E027', 'amount', -500)
+    pricing.add_rule(conn, 'sku', 'E028', 'fixed', 4200)
+    pricing.add_rule(conn, 'sku', 'B051', 'amount', -50000)
+    assert [effective(conn, pid)[0] for pid in (1, 2, 3, 4)] == [3300, 3500, 4200, 0]
+    assert effective(conn, 5) is None
+
+
+def test_highest_priority_then_newest_rule_wins(conn):
+    pricing.add_rule(conn, 'prefix', 'E', 'percent', -10, priority=1)
+    pricing.add_rule(conn, 'prefix', 'E02', 'fixed', 100)
+    assert effective(conn, 1)[0] == 2700
+    pricing.add_rule(conn, 'sku', 'E026', 'fixed', 999, priority=1)
+    assert effective(conn, 1)[0] == 999
+    assert effective(conn, 2)[0] == 3600
+
+
+def test_category_scope(conn):
+    conn.execute("UPDATE products SET category = 'drinks' WHERE id IN (1, 2)")
+    conn.commit()
+    pricing.add_rule(conn, 'category', 'drinks', 'amount', 100)
+    assert [effective(conn, pid) and effective(conn, pid)[0] for pid in (1, 2, 3)] == [3100, 4100, None]
+
+
+def test_promotions_use_the_rule_price(conn):
+    pricing.add_rule(conn, 'sku', 'E026', 'fixed', 2000)
+    pricing.add_promotion(conn, 'sku', 'E026', 3, pay_qty=2)
+    pricing.add_promotion(conn, 'sku', 'E027', 2, bundle_price=7000)
+    assert effective(conn, 1) == (2000, 3, 4000)
+    assert effective(conn, 2) == (4000, 2, 7000)
+
+
+def test_schedule_window(conn):
+    pricing.add_rule(conn, 'sku', 'E026', 'fixed', 1000, starts_at='2026-10-20 00:00:00',
+                     ends_at='2026-10-21 00:00:00')
+    assert pricing.refresh(conn, at='2026-10-19 12:00:00') == 0
+    assert pricing.refresh_due(conn, at='2026-10-20 00:00:00')
+    assert pricing.refresh(conn, at='2026-10-20 12:00:00') == 1
+    assert effective(conn, 1)[0] == 1000
+    pricing.refresh(conn, at='2026-10-21 00:00:00')
+    assert effective(conn, 1) is None
+    assert not pricing.refresh_due(conn, at='2026-12-31 00:00:00')
+
+
+def test_product_edits_reprice_through_triggers(conn):
+    pricing.add_rule(conn, 'prefix', 'E', 'percent', 50)
+    conn.execute("UPDATE products SET price = 2000 WHERE id = 1")
+    conn.execute("UPDATE products SET sku = 'X026' WHERE id = 2")
+    conn.execute("INSERT INTO products (sku, name, price, stock) VALUES ('E100', 'New', 100, 1)")
+    conn.commit()
+    assert effective(conn, 1)[0] == 3000
+    assert effective(conn, 2) is None
+    assert effective(conn, 6)[0] == 150
+
+
+def test_reprice_changes_base_prices(conn):
+    assert pricing.reprice(conn, 'prefix', 'E02', 'percent', 10) == 3
+    assert conn.execute("SELECT price FROM products WHERE id = 1").fetchone()[0] == 3300
+
+
+def test_remove(conn):
+    rule_id = pricing.add_rule(conn, 'sku', 'E026', 'fixed', 1)
+    assert pricing.remove(conn, 'price_rules', rule_id) == 1
+    assert effective(conn, 1) is None
+    with pytest.raises(ValueError):
+        pricing.remove(conn, 'products', 1)
+
+
+def test_invalid_rules(conn):
+    with pytest.raises(ValueError):
+        pricing.add_rule(conn, 'brand', 'X', 'fixed', 1)
+    with pytest.raises(ValueError):
+        pricing.add_rule(conn, 'sku', 'E026', 'double', 1)
+    with pytest.raises(ValueError):
+        pricing.add_promotion(conn, 'sku', 'E026', 3)
+    with pytest.raises(ValueError):
+        pricing.add_promotion(conn, 'sku', 'E026', 3, pay_qty=3)
+
+
+def test_price_book_caches_until_data_version_moves(conn, db_path):
+    from db import connect
+    book = PriceBook(conn)
+    assert book.get(1, 3000) == (3000, None)
+    other = connect(db_path)
+    pricing.add_promotion(other, 'sku', 'E026', 3, bundle_price=8000)
+    other.close()
+    assert book.get(1, 3000) == (3000, (3, 8000))
@@ -0,0 +1,89 @@
+import pytest
+
+from receipts import ReceiptStore, ReceiptWriter, CorruptReceipt, HEADER, format_receipt
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ReceiptStore(str(tmp_path / 'journal'))
+    yield store
+    store.close()
+
+
+def test_round_trip(store):
+    text = format_receipt('2026-10-17 10:00:00', 3330, [('Mizone', 1, 3000)])
+    store.append(7, '2026-10-17 10:00:00', text)
+    store.append_many([(8, '2026-10-17 11:00:00', 'eight'), (9, '2026-10-18 09:00:00', 'nine')])
+    assert store.get(7) == text
+    assert store.get(9) == 'nine'
+    assert store.get(10) is None
+    assert 8 in store and 10 not in store
+    assert [tuple(r) for r in store.find('2026-10-17', '2026-10-18')] == [
+        (7, '2026-10-17 10:00:00'), (8, '2026-10-17 11:00:00')]
+
+
+def test_uncompressed_round_trip(tmp_path):
+    store = ReceiptStore(str(tmp_path / 'plain'), compress=False)
+    store.append(1, 't', 'plain text')
+    assert store.get(1) == 'plain text'
+    store.close()
+
+
+def test_rolls_over_to_new_segments(tmp_path):
+    store = ReceiptStore(str(tmp_path / 'small'), compress=False, segment_size=100)
+    for i in range(1, 21):
+        store.append(i, 't', f'receipt {i} ' * 5)
+    assert len(store._segments()) > 1
+    assert all(store.get(i) == f'receipt {i} ' * 5 for i in range(1, 21))
+    store.close()
+
+
+def test_two_stores_on_one_directory(tmp_path):
+    a = ReceiptStore(str(tmp_path / 'shared'))
+    b = ReceiptStore(str(tmp_path / 'shared'))
+    a.append(1, 't', 'one')
+    b.append(2, 't', 'two')
+    a.append(3, 't', 'three')
+    assert [a.get(i) for i in (1, 2, 3)] == ['one', 'two', 'three']
+    assert [b.get(i) for i in (1, 2, 3)] == ['one', 'two', 'three']
+    a.close()
+    b.close()
+
+
+def test_corrupt_record_is_refused(store):
+    store.append(1, 't', 'one')
+    segment, offset = store._index.execute('SELECT segment, offset FROM receipts WHERE sale_id = 1').fetchone()
+    store._out.flush()
+    with open(store._segment_path(segment), 'r+b') as f:
+        f.seek(offset + HEADER.size)
+        f.write(b'\xff')
+    with pytest.raises(CorruptReceipt):
+        store.get(1)
+
+
+def test_record_of_another_sale_is_refused(store):
+    store.append_many([(2, 't', 'two'), (3, 't', 'three')])
+    store._index.execute(
+        'UPDATE receipts SET offset = (SELECT offset FROM receipts WHERE sale_id = 2) WHERE sale_id = 3')
+    with pytest.raises(CorruptReceipt, match='sale 2'):
+        store.get(3)
+
+
+def test_reindex_skips_a_torn_tail(store):
+    store.append_many([(1, 't1', 'one'), (2, 't2', 'two')])
+    store._out.write(b'RCPT\x01')
+    store._out.flush()
+    store._index.execute('DELETE FROM receipts')
+    assert store.reindex({1: 't1'}) == 2
+    assert store.get(2) == 'two'
+    assert [tuple(r) for r in store.find('t', 't~')] == [(1, 't1')]
+
+
+def test_writer_batches_in_the_background(store):
+    errors = []
+    writer = ReceiptWriter(store, on_error=lambda e, batch: errors.append(e))
+    writer.submit(1, 't', 'one')
+    writer.submit_many([(2, 't', 'two'), (3, 't', 'three')])
+    writer.close()
+    assert errors == [] and store.get(3) == 'three'
+
@@ -0,0 +1,119 @@
+import os
+import time
+
+import pytest
+
+import sale_journal
+from sale_journal import SaleJournal, JournalWriter, JournalInUse, applied_seq, replay
+
+
+def entry(pid=1, qty=1, price=3000, receipt=None):
+    return {'time': '2026-10-17 10:00:00', 'tax_pct': 0.0, 'lines': [[pid, qty, price, None, 'SKU', 'Name']],
+            'receipt': receipt}
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = SaleJournal(str(tmp_path / 'journal'))
+    yield journal
+    journal.close()
+
+
+def sales(conn):
+    return conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+
+
+def stock(conn, pid):
+    return conn.execute("SELECT stock FROM products WHERE id = ?", (pid,)).fetchone()[0]
+
+
+def test_append_numbers_entries(journal):
+    assert [journal.append(entry()) for _ in range(3)] == [1, 2, 3]
+    assert [seq for seq, _ in journal.entries_after(1)] == [2, 3]
+
+
+def test_replay_applies_once(conn, journal):
+    for _ in range(3):
+        journal.append(entry(qty=2))
+    applied = replay(conn, journal)
+    assert len(applied) == 3 and all(r.sale_id for _, _, r in applied)
+    assert applied_seq(conn, journal.journal_id) == 3
+    assert replay(conn, journal) == []
+    assert sales(conn) == 3 and stock(conn, 1) == 14
+
+
+def test_replay_keeps_oversold_sales_by_default(conn, journal):
+    journal.append(entry(qty=25))
+    replay(conn, journal, policy='oversell')
+    assert stock(conn, 1) == -5
+
+
+def test_replay_partial_sells_what_is_left(conn, journal):
+    journal.append(entry(qty=25))
+    (_, _, result), = replay(conn, journal, policy='partial')
+    assert result.sold[0].filled == 20 and stock(conn, 1) == 0
+
+
+def test_reopen_truncates_a_torn_tail(tmp_path, conn):
+    directory = str(tmp_path / 'torn')
+    journal = SaleJournal(directory)
+    journal.append(entry())
+    journal.append(entry())
+    path = journal._segment_path(journal._segment)
+    journal.close()
+    good = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(b'SALE\x03\x00')
+    journal = SaleJournal(directory)
+    assert os.path.getsize(path) == good
+    assert journal.seq == 2
+    assert journal.append(entry()) == 3
+    assert len(replay(conn, journal)) == 3
+    journal.close()
+
+
+def test_directory_is_locked(journal):
+    with pytest.raises(JournalInUse):
+        SaleJournal(journal.directory)
+    journal.close()
+    SaleJournal(journal.directory).close()
+
+
+def test_compact_drops_applied_segments(tmp_path, conn):
+    journal = SaleJournal(str(tmp_path / 'small'), segment_size=200)
+    for _ in range(10):
+        journal.append(entry())
+    assert len(journal._segments()) > 2
+    replay(conn, journal)
+    assert journal._segments() == [journal._segment]
+    assert journal.entries_after(0)[-1][0] == 10
+    journal.close()
+
+
+def test_writer_applies_groups_and_compacts(tmp_path, db_path, conn):
+    journal = SaleJournal(str(tmp_path / 'writer'), segment_size=200)
+    applied = []
+    writer = JournalWriter(journal, db_path, on_applied=applied.extend)
+    for _ in range(20):
+        writer.submit(entry(receipt='r'))
+    deadline = time.time() + 5
+    while len(applied) < 20 and time.time() < deadline:
+        time.sleep(0.01)
+    writer.close()
+    assert len(applied) == 20 and writer.failed is None
+    assert applied_seq(conn, journal.journal_id) == 20 and stock(conn, 1) == 0
+    assert writer.pending_qty() == {}
+    assert len(journal._segments()) == 1
+    journal.close()
+
+
+def test_unknown_sync_mode(tmp_path):
+    with pytest.raises(ValueError):
+        SaleJournal(str(tmp_path / 'x'), sync='sometimes')
+
+
+def test_make_entry_freezes_lines():
+    from checkout_service import plan_sale
+    result = plan_sale({1: [2, 3000, None, 'E026', 'Mizone']}, {1: 20}, 11.0, 'reject', '2026-10-17 10:00:00')
+    made = sale_journal.make_entry(result, receipt='text')
+    assert made['lines'] == [[1, 2, 3000, None, 'E026', 'Mizone']] and made['receipt'] == 'text'
@@ -0,0 +1,19 @@
+import pytest
+
+from scanner import parse_scan, ScanError
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('E026', (1, 'E026')),
+    ('  E026 ', (1, 'E026')),
+    ('3*E026', (3, 'E026')),
+    ('12 * 8991234567890', (12, '8991234567890')),
+])
+def test_parse_scan(text, expected):
+    assert parse_scan(text) == expected
+
+
+@pytest.mark.parametrize('text', ['', '   ', 'E026 E027', '0*E026', '10000*E026'])
+def test_parse_scan_rejects(text):
+    with pytest.raises(ScanError):
+        parse_scan(text)